@@ -0,0 +1,385 @@
+# --- 自動調參 ---
+# 在參考影像（凍結畫面，或零件尺寸已知的合成 / 實拍影像）上掃描 Gaussian Blur kernel、
+# 二值化閾值、形態學 kernel 與 Canny 閾值的組合，回傳量測誤差（mm）由小到大的排名。
+# 候選組合之間共用的計算只做一次：
+#   - Binary Threshold 之前的步驟（灰階、模糊）每個 blur kernel 只算一次
+#   - 以一次直方圖累加找出會產生相同二值影像的閾值，256 個閾值只評估其中互不相同者
+#   - Binary Threshold 之後的步驟依步驟快取，前段相同的候選組合共用中間結果
+#   - 閾值先每隔 stride 組評估一次，再只細掃目前最佳幾名附近的閾值（stride=1 為完整掃描）
+# 評估工作依 (blur kernel, 閾值區段) 切分後分派到 process pool。ROI 設定不參與調參（只看全畫面）。
+#
+#     python autotune.py --synthetic 1080p --parts 50 --ratio 0.1 --save-config tuned.json
+#     python autotune.py frozen.png --config line3.json --nominal 12 8 --count 20
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from incremental import run_cached
+from measure_engine import MeasurementEngine, find_contours, load_config, measure_contours, save_config
+from pipeline import compile_pipeline
+from synthetic import RESOLUTIONS, make_synthetic_frame
+
+DEFAULT_BLUR_SIZES = (3, 5, 7, 9)
+DEFAULT_MORPH_SIZES = (3, 5, 7)
+DEFAULT_TOP = 10
+DEFAULT_STRIDE = 4  # 粗掃時每隔幾組等效閾值評估一次
+REFINE_GROUPS = 5   # 細掃粗掃結果中最佳的幾組閾值附近
+UNITS_PER_WORKER = 4  # 每個 worker 平均分到的工作單位數，讓各核心負載平均
+
+
+# --- 參考影像 ---
+# parts：已知零件的像素外接矩形（synthetic.PART_DTYPE），以位置一對一比對；
+# nominal_mm：只知道零件的標稱尺寸 (寬, 高)，每個偵測結果都與它比較，count 為畫面中的零件數（可省略）
+class ReferenceFrame:
+    def __init__(self, frame, parts=None, nominal_mm=None, count=None):
+        if parts is None and nominal_mm is None:
+            raise ValueError('Reference frame needs either known parts or a nominal size')
+        self.frame = frame
+        self.parts = parts
+        self.nominal_mm = nominal_mm
+        self.count = count
+
+    # 送到 worker 行程的比對目標（不含影像本身）
+    def target(self):
+        return self.parts, self.nominal_mm, self.count
+
+
+# --- 計算單張影像的量測誤差 ---
+# 漏檢的零件視為量到 0 x 0，多出來的偵測視為應該是 0 x 0，
+# 回傳 (寬高絕對誤差總和, 比較的邊數, 比對成功數, 漏檢數, 多檢數)
+def score_result(result, target, pixel_to_mm_ratio=None):
+    parts, nominal_mm, count = target
+    scale = pixel_to_mm_ratio if pixel_to_mm_ratio else 1.0
+    dw, dh = result.width_mm, result.height_mm
+
+    if parts is not None:
+        ew, eh = parts['w'] * scale, parts['h'] * scale
+        if len(parts) == 0 or len(result) == 0:
+            return (float(ew.sum() + eh.sum() + dw.sum() + dh.sum()), 2 * max(len(parts), 1),
+                    0, len(parts), len(result))
+        # 偵測結果的中心落在已知零件外接矩形內才算同一個零件
+        cx = result.x + result.w / 2.0
+        cy = result.y + result.h / 2.0
+        inside = ((cx >= parts['x'][:, None]) & (cx < (parts['x'] + parts['w'])[:, None]) &
+                  (cy >= parts['y'][:, None]) & (cy < (parts['y'] + parts['h'])[:, None]))
+        errors = np.abs(dw - ew[:, None]) + np.abs(dh - eh[:, None])
+        errors[~inside] = np.inf
+        best = errors.argmin(axis=1)
+        best_error = errors[np.arange(len(parts)), best]
+        matched = np.isfinite(best_error)
+        used = np.zeros(len(result), bool)
+        used[best[matched]] = True
+        total = (best_error[matched].sum() + ew[~matched].sum() + eh[~matched].sum() +
+                 dw[~used].sum() + dh[~used].sum())
+        return float(total), 2 * len(parts), int(matched.sum()), int((~matched).sum()), int((~used).sum())
+
+    width, height = nominal_mm
+    # 零件可能旋轉 90 度擺放，取兩種方向中誤差較小者
+    errors = np.minimum(np.abs(dw - width) + np.abs(dh - height), np.abs(dw - height) + np.abs(dh - width))
+    expected = count if count is not None else max(len(result), 1)
+    order = np.argsort(errors, kind='stable')
+    matched = order[:expected]
+    extra = order[expected:]
+    missed = expected - len(matched)
+    total = errors[matched].sum() + missed * (width + height) + dw[extra].sum() + dh[extra].sum()
+    return float(total), 2 * expected, len(matched), missed, len(extra)
+
+
+# --- 以直方圖累加合併等效閾值 ---
+# THRESH_BINARY 把 > t 的像素設為前景；兩個閾值之間若沒有任何像素值，二值影像完全相同。
+# 回傳 [(代表閾值, 最小閾值, 最大閾值), ...]；代表閾值取等效區間的中點，對光線變化的容忍度最大。
+# 所有影像都是全黑或全白的閾值不會產生有意義的輪廓，直接略過。
+def distinct_thresholds(images, thresholds):
+    thresholds = np.asarray(sorted(set(int(t) for t in thresholds)), np.intp)
+    cumulative = np.stack([np.cumsum(np.bincount(image.ravel(), minlength=256)) for image in images])
+    totals = cumulative[:, -1:]
+    below = cumulative[:, thresholds]  # 每張影像 <= t 的像素數（即背景像素數）
+    useful = ~np.all((below == 0) | (below == totals), axis=0)
+    thresholds, below = thresholds[useful], below[:, useful]
+    if len(thresholds) == 0:
+        return []
+    # 相鄰閾值的背景像素數完全相同 -> 同一組
+    starts = np.flatnonzero(np.r_[True, np.any(below[:, 1:] != below[:, :-1], axis=0)])
+    ends = np.r_[starts[1:], len(thresholds)] - 1
+    groups = []
+    for lo, hi in zip(thresholds[starts].tolist(), thresholds[ends].tolist()):
+        groups.append(((lo + hi) // 2, lo, hi))
+    return groups
+
+
+# --- 候選組合的參數 ---
+def candidate_parameters(parameters, blur, morph, canny):
+    params = {step: dict(values) for step, values in parameters.items()}
+    if blur is not None:
+        params.setdefault('Gaussian Blur', {})['Kernel Size'] = str(blur)
+    if morph is not None:
+        params.setdefault('Morphological Operations', {})['Kernel Size'] = str(morph)
+    if canny is not None:
+        params.setdefault('Canny Edge Detection', {})['Threshold'] = str(canny)
+    return params
+
+
+# --- 把選定的候選組合套用到引擎 ---
+def apply_candidate(engine, candidate):
+    params = candidate_parameters(engine.preprocess_parameters, candidate['blur'], candidate['morph'],
+                                  candidate['canny'])
+    params.setdefault('Binary Threshold', {})['Threshold'] = str(candidate['threshold'])
+    # 就地更新傳入的引擎；串流中請先以 engine.replace() 取得新快照再套用
+    engine.preprocess_parameters.clear()
+    engine.preprocess_parameters.update(params)
+    engine.binary_threshold = candidate['threshold']
+    engine.invalidate_pipeline()
+
+
+# --- worker 行程 ---
+_state = None
+
+
+def _init_worker(state):
+    global _state
+    cv2.setNumThreads(1)  # 平行度交給 process pool
+    _state = state
+
+
+# 評估一個工作單位：固定 blur kernel，掃過一段閾值與全部形態學 / Canny 組合
+def evaluate_unit(unit):
+    blur, thresholds = unit
+    state = _state
+    images = state['prefixed'][blur]
+    caches = [[] for _ in images]
+    rows = []
+    for threshold in thresholds:
+        for morph in state['morph_sizes']:
+            for canny in state['canny_thresholds']:
+                params = candidate_parameters(state['parameters'], blur, morph, canny)
+                pipeline = compile_pipeline(state['suffix_steps'], params, threshold)
+                total = edges = matched = missed = extra = 0
+                for j, (image, target) in enumerate(zip(images, state['targets'])):
+                    processed, _, _ = run_cached(pipeline, image, (blur, j), caches[j])
+                    result = measure_contours(find_contours(processed), state['min_area'],
+                                              state['pixel_to_mm_ratio'])
+                    t, e, m, mi, ex = score_result(result, target, state['pixel_to_mm_ratio'])
+                    total += t
+                    edges += e
+                    matched += m
+                    missed += mi
+                    extra += ex
+                rows.append({'blur': blur, 'threshold': threshold, 'morph': morph, 'canny': canny,
+                             'error_mm': total / max(edges, 1), 'matched': matched, 'missed': missed,
+                             'extra': extra})
+    return rows
+
+
+def _split(items, parts):
+    size = max(1, -(-len(items) // max(parts, 1)))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# selection：{blur: [代表閾值...]}，切成約 workers * UNITS_PER_WORKER 個工作單位
+def _make_units(selection, workers):
+    total = sum(len(values) for values in selection.values())
+    units = []
+    for blur, values in selection.items():
+        if values:
+            parts = max(1, round(workers * UNITS_PER_WORKER * len(values) / total))
+            units.extend((blur, chunk) for chunk in _split(values, parts))
+    return units
+
+
+def _evaluate(executor, units):
+    if executor is None:
+        return [row for unit in units for row in evaluate_unit(unit)]
+    return [row for rows in executor.map(evaluate_unit, units) for row in rows]
+
+
+def _rank_key(row):
+    # 誤差相同時優先選漏檢 / 多檢較少、等效閾值區間較寬（較穩定）者
+    return row['error_mm'], row['missed'] + row['extra'], row['threshold_range'][0] - row['threshold_range'][1]
+
+
+# --- 執行掃描 ---
+# 回傳 {'candidates': [...依 error_mm 排序...], 'evaluated': 評估的組合數, 'elapsed': 秒數, ...}
+# 每個候選組合含 blur / threshold / morph / canny（步驟不存在時為 None）、threshold_range（等效閾值區間）、
+# error_mm（每邊平均絕對誤差；未設定換算比例時為像素）、matched / missed / extra
+def autotune(engine, references, blur_sizes=None, thresholds=None, morph_sizes=None, canny_thresholds=None,
+             workers=None, top=None, stride=DEFAULT_STRIDE):
+    steps = list(engine.preprocess_steps)
+    if 'Binary Threshold' not in steps:
+        raise ValueError('Auto-tuning needs a Binary Threshold step')
+    split = steps.index('Binary Threshold')
+    prefix_steps, suffix_steps = steps[:split], steps[split:]
+    parameters = engine.preprocess_parameters
+    start = time.perf_counter()
+
+    # 不在流程中的步驟不掃描
+    blur_sizes = list(blur_sizes or DEFAULT_BLUR_SIZES) if 'Gaussian Blur' in prefix_steps else [None]
+    morph_sizes = list(morph_sizes or DEFAULT_MORPH_SIZES) if 'Morphological Operations' in suffix_steps else [None]
+    if 'Canny Edge Detection' in suffix_steps:
+        canny_thresholds = list(canny_thresholds or [int(parameters.get('Canny Edge Detection', {})
+                                                         .get('Threshold', '50'))])
+    else:
+        canny_thresholds = [None]
+    thresholds = range(256) if thresholds is None else thresholds
+
+    # Binary Threshold 之前的步驟：每個 blur kernel 只算一次
+    prefixed = {}
+    groups = {}
+    for blur in blur_sizes:
+        params = candidate_parameters(parameters, blur, None, None)
+        prefix = compile_pipeline(prefix_steps, params, engine.binary_threshold)
+        prefixed[blur] = [prefix.run(ref.frame) for ref in references]
+        groups[blur] = distinct_thresholds(prefixed[blur], thresholds)
+
+    ranges = {(blur, rep): (lo, hi) for blur in blur_sizes for rep, lo, hi in groups[blur]}
+    positions = {(blur, g[0]): i for blur in blur_sizes for i, g in enumerate(groups[blur])}
+    workers = workers or os.cpu_count() or 1
+
+    state = {
+        'prefixed': prefixed,
+        'suffix_steps': suffix_steps,
+        'parameters': parameters,
+        'morph_sizes': morph_sizes,
+        'canny_thresholds': canny_thresholds,
+        'targets': [ref.target() for ref in references],
+        'min_area': engine.min_area,
+        # 評分只用單一換算比例；有相機校正時取畫面中心的比例
+        'pixel_to_mm_ratio': (engine.calibration.mm_per_pixel() if engine.calibration is not None
+                              else engine.pixel_to_mm_ratio),
+    }
+    if workers == 1:
+        _init_worker(state)
+        executor = nullcontext()
+    else:
+        # spawn：從 GUI 呼叫時不 fork 有 wx 與串流執行緒的行程
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,),
+                                       mp_context=multiprocessing.get_context('spawn'))
+    with executor:
+        pool = executor if workers > 1 else None
+        # 粗掃：每隔 stride 組取一組（含最後一組）
+        coarse = {blur: [g[0] for g in groups[blur][::stride]] for blur in blur_sizes}
+        for blur in blur_sizes:
+            if groups[blur] and (len(groups[blur]) - 1) % stride:
+                coarse[blur].append(groups[blur][-1][0])
+        rows = _evaluate(pool, _make_units(coarse, workers))
+        for row in rows:
+            row['threshold_range'] = ranges[row['blur'], row['threshold']]
+
+        # 細掃：粗掃最佳的幾組閾值前後尚未評估的閾值
+        if stride > 1:
+            done = {(blur, t) for blur in blur_sizes for t in coarse[blur]}
+            fine = {blur: set() for blur in blur_sizes}
+            best = []
+            for row in sorted(rows, key=_rank_key):
+                if (row['blur'], row['threshold']) not in best:
+                    best.append((row['blur'], row['threshold']))
+                if len(best) >= REFINE_GROUPS:
+                    break
+            for blur, threshold in best:
+                center = positions[blur, threshold]
+                for g in groups[blur][max(center - stride + 1, 0):center + stride]:
+                    if (blur, g[0]) not in done:
+                        fine[blur].add(g[0])
+            fine_rows = _evaluate(pool, _make_units({blur: sorted(v) for blur, v in fine.items()}, workers))
+            for row in fine_rows:
+                row['threshold_range'] = ranges[row['blur'], row['threshold']]
+            rows.extend(fine_rows)
+
+    rows.sort(key=_rank_key)
+    return {
+        'candidates': rows[:top] if top else rows,
+        'evaluated': len(rows),
+        'thresholds_distinct': {str(blur): len(groups[blur]) for blur in blur_sizes},
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+# --- 報告文字（CLI 與 GUI 共用） ---
+def format_candidate(rank, candidate):
+    lo, hi = candidate['threshold_range']
+    parts = [f'#{rank}', f"error {candidate['error_mm']:.3f}", f"threshold {candidate['threshold']} ({lo}-{hi})"]
+    if candidate['blur'] is not None:
+        parts.append(f"blur {candidate['blur']}")
+    if candidate['morph'] is not None:
+        parts.append(f"morph {candidate['morph']}")
+    if candidate['canny'] is not None:
+        parts.append(f"canny {candidate['canny']}")
+    parts.append(f"matched {candidate['matched']} / missed {candidate['missed']} / extra {candidate['extra']}")
+    return '  '.join(parts)
+
+
+def _odd_sizes(value):
+    size = int(value)
+    if size < 1 or size % 2 == 0:
+        raise argparse.ArgumentTypeError('kernel size must be a positive odd number')
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='掃描前處理參數，找出量測誤差最小的設定')
+    parser.add_argument('images', nargs='*', help='參考影像（需搭配 --nominal）')
+    parser.add_argument('--config', help='起始量測設定檔（JSON）')
+    parser.add_argument('--nominal', nargs=2, type=float, metavar=('W', 'H'), help='參考影像中零件的標稱尺寸（mm）')
+    parser.add_argument('--count', type=int, help='每張參考影像中的零件數')
+    parser.add_argument('--synthetic', choices=list(RESOLUTIONS), help='改用零件尺寸已知的合成影像')
+    parser.add_argument('--parts', type=int, default=50, help='每張合成影像的零件數')
+    parser.add_argument('--frames', type=int, default=2, help='合成影像張數')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ratio', type=float, help='pixel to mm 換算比例（覆蓋設定檔）')
+    parser.add_argument('--blur', nargs='+', type=_odd_sizes, help=f'Gaussian Blur kernel（預設 {DEFAULT_BLUR_SIZES}）')
+    parser.add_argument('--morph', nargs='+', type=_odd_sizes, help=f'形態學 kernel（預設 {DEFAULT_MORPH_SIZES}）')
+    parser.add_argument('--canny', nargs='+', type=int, help='Canny 閾值（預設沿用設定檔）')
+    parser.add_argument('--thresholds', nargs=2, type=int, metavar=('LO', 'HI'), default=(0, 255),
+                        help='二值化閾值範圍（含，預設 0 255）')
+    parser.add_argument('--stride', type=int, default=DEFAULT_STRIDE,
+                        help=f'粗掃時每隔幾組等效閾值評估一次（1 為完整掃描，預設 {DEFAULT_STRIDE}）')
+    parser.add_argument('--workers', '-j', type=int, default=None, help='worker 行程數（預設為 CPU 核心數）')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='顯示前幾名')
+    parser.add_argument('--output', '-o', help='完整排名報告（JSON）')
+    parser.add_argument('--save-config', help='把最佳設定存成量測設定檔')
+    args = parser.parse_args(argv)
+
+    engine = load_config(args.config) if args.config else MeasurementEngine()
+    if args.ratio is not None:
+        engine.pixel_to_mm_ratio = args.ratio
+
+    if args.synthetic:
+        width, height = RESOLUTIONS[args.synthetic]
+        references = [ReferenceFrame(*make_synthetic_frame(width, height, args.parts, seed=args.seed + i))
+                      for i in range(args.frames)]
+    else:
+        if not args.images or args.nominal is None:
+            parser.error('請指定參考影像與 --nominal，或改用 --synthetic')
+        references = []
+        for path in args.images:
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if frame is None:
+                parser.error(f'無法讀取影像：{path}')
+            references.append(ReferenceFrame(frame, nominal_mm=tuple(args.nominal), count=args.count))
+
+    lo, hi = args.thresholds
+    report = autotune(engine, references, args.blur, range(max(lo, 0), min(hi, 255) + 1), args.morph, args.canny,
+                      args.workers, stride=max(args.stride, 1))
+    candidates = report['candidates']
+    print(f"評估 {report['evaluated']} 組參數，{report['elapsed']:.2f} 秒", file=sys.stderr)
+    for rank, candidate in enumerate(candidates[:args.top], 1):
+        print(format_candidate(rank, candidate))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save_config and candidates:
+        apply_candidate(engine, candidates[0])
+        save_config(engine, args.save_config)
+    return 0 if candidates else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# --- 離線批次量測 ---
+# 以與 GUI 相同的前處理流程與 pixel_to_mm_ratio，重新量測資料夾 / glob 內的影像或錄影檔。
+# 工作會切成小段（chunk）分派到 process pool，結果依輸入順序邊算邊輸出。
+#
+#     python batch_measure.py captures/ --config line3.json --output result.csv
+#     python batch_measure.py "archive/2024-*/*.png" recording.mp4 --config line3.json --workers 8
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from calibration import load_calibration
+from measure_engine import MeasurementEngine, load_config
+from profiles import DEFAULT_PROFILE_DIR, ProfileError, ProfileStore
+from tiling import DEFAULT_TILE_SIZE, TiledProcessor
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.wmv')
+
+DEFAULT_CHUNK_SIZE = 32
+
+OUTPUT_FIELDS = ['source', 'frame', 'index', 'x', 'y', 'w', 'h', 'width_mm', 'height_mm', 'area']
+
+
+# --- 整理輸入：資料夾、glob 或檔案 ---
+def expand_inputs(inputs):
+    images, videos = [], []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = sorted(os.path.join(item, name) for name in os.listdir(item))
+        elif glob.has_magic(item):
+            paths = sorted(glob.glob(item))
+        else:
+            paths = [item]
+        for path in paths:
+            ext = os.path.splitext(path)[1].lower()
+            if ext in IMAGE_EXTENSIONS:
+                images.append(path)
+            elif ext in VIDEO_EXTENSIONS:
+                videos.append(path)
+    return images, videos
+
+
+# --- 切分工作單位 ---
+# 影像：('images', [路徑...])；影片：('video', 路徑, 起始影格, 影格數)，影格數 None 表示讀到結尾
+# 每支影片切成 segments 段互不重疊的區間，每段由一個 worker 以自己的 VideoCapture 從頭依序讀取
+# （H.264 / HEVC 等格式以 CAP_PROP_POS_FRAMES 跳轉只會落在附近的關鍵影格，影格編號會錯開）。
+# CAP_PROP_FRAME_COUNT 只是估計值，因此只用來分段，最後一段一律讀到結尾
+def make_work_units(images, videos, chunk_size=DEFAULT_CHUNK_SIZE, segments=1):
+    for start in range(0, len(images), chunk_size):
+        yield ('images', images[start:start + chunk_size])
+    for path in videos:
+        capture = cv2.VideoCapture(path)
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        capture.release()
+        length = -(-frame_count // segments) if frame_count > 0 else 0
+        if length == 0:
+            yield ('video', path, 0, None)
+            continue
+        starts = list(range(0, frame_count, length))
+        for start in starts[:-1]:
+            yield ('video', path, start, length)
+        yield ('video', path, starts[-1], None)
+
+
+# --- worker 行程 ---
+_engine = None
+
+
+def _init_worker(config, tile_workers=0, tile_size=DEFAULT_TILE_SIZE):
+    global _engine
+    cv2.setNumThreads(1)  # 平行度交給 process pool，避免 OpenCV 內部執行緒互搶核心
+    _engine = MeasurementEngine.from_config(config)
+    if tile_workers:
+        _engine.tiler = TiledProcessor(tile_workers, tile_size)
+
+
+def _measure_rows(source, frame_index, frame):
+    result = _engine.measure(frame)
+    columns = (result.x.tolist(), result.y.tolist(), result.w.tolist(), result.h.tolist(),
+               result.width_mm.round(4).tolist(), result.height_mm.round(4).tolist(), result.area.tolist())
+    return [(source, frame_index, index) + values for index, values in enumerate(zip(*columns))]
+
+
+# 回傳 (處理影格數, 量測列)
+def process_unit(unit):
+    rows = []
+    frames = 0
+    if unit[0] == 'images':
+        for path in unit[1]:
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            rows.extend(_measure_rows(path, 0, frame))
+            frames += 1
+    else:
+        _, path, start, count = unit
+        capture = cv2.VideoCapture(path)
+        # 以 grab() 逐張前進到起點（不轉換影像），影格編號與從頭讀取完全相同
+        frame_index = 0
+        while frame_index < start and capture.grab():
+            frame_index += 1
+        while frame_index == start + frames and (count is None or frames < count):
+            ret, frame = capture.read()
+            if not ret:
+                break
+            rows.extend(_measure_rows(path, frame_index, frame))
+            frame_index += 1
+            frames += 1
+        capture.release()
+    return frames, rows
+
+
+# --- 依輸入順序取得結果，同時最多 max_pending 個工作單位在執行 ---
+# tile_workers > 0 時每個行程再以分塊平行處理大影像（行程數 x 分塊執行緒數不宜超過核心數）
+def run_units(units, config, workers=None, max_pending=None, tile_workers=0, tile_size=DEFAULT_TILE_SIZE):
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config, tile_workers, tile_size),
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = deque()
+        for unit in units:
+            pending.append(executor.submit(process_unit, unit))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='離線批次量測影像資料夾與錄影檔')
+    parser.add_argument('inputs', nargs='+', help='影像資料夾、glob 或影片檔')
+    parser.add_argument('--config', help='GUI 儲存的量測設定檔（JSON）')
+    parser.add_argument('--product', help='改用產品設定檔（依產品代碼，取代 --config）')
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR, help='產品設定檔資料夾')
+    parser.add_argument('--output', '-o', help='輸出檔案（.csv 或 .jsonl，預設輸出 CSV 到 stdout）')
+    parser.add_argument('--workers', '-j', type=int, default=None, help='worker 行程數（預設為 CPU 核心數）')
+    parser.add_argument('--calibration', help='相機校正檔（calibration.py 產生，覆蓋設定檔）')
+    parser.add_argument('--precision', action='store_true',
+                        help='精密模式：次像素邊緣與旋轉外接矩形（覆蓋設定檔，較慢）')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每個工作單位的影格數')
+    parser.add_argument('--tile-workers', type=int, default=0,
+                        help='每個行程以幾條執行緒分塊處理大影像（0 表示不分塊；影像少而大時搭配 --workers 1）')
+    parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE, help='分塊大小（像素）')
+    args = parser.parse_args(argv)
+
+    if args.product:
+        try:
+            engine = ProfileStore(args.profile_dir).engine(args.product)
+        except ProfileError as e:
+            parser.error(str(e))
+    else:
+        engine = load_config(args.config) if args.config else MeasurementEngine()
+    if args.precision:
+        engine.precision = True
+    if args.calibration:
+        engine.calibration = load_calibration(args.calibration)
+    images, videos = expand_inputs(args.inputs)
+    if not images and not videos:
+        parser.error('找不到任何影像或影片檔')
+
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    as_jsonl = bool(args.output) and args.output.lower().endswith('.jsonl')
+    writer = None if as_jsonl else csv.writer(out)
+    if writer:
+        writer.writerow(OUTPUT_FIELDS)
+
+    total_frames = 0
+    start = time.perf_counter()
+    try:
+        units = make_work_units(images, videos, args.chunk_size, args.workers or os.cpu_count() or 1)
+        for frames, rows in run_units(units, engine.to_config(), args.workers,
+                                      tile_workers=args.tile_workers, tile_size=args.tile_size):
+            total_frames += frames
+            if writer:
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    out.write(json.dumps(dict(zip(OUTPUT_FIELDS, row)), ensure_ascii=False) + '\n')
+            elapsed = time.perf_counter() - start
+            print(f'\r{total_frames} frames, {total_frames / elapsed:.1f} images/sec', end='', file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    rate = total_frames / elapsed if elapsed > 0 else 0.0
+    print(f'\r完成：{total_frames} frames，{elapsed:.1f} 秒，{rate:.1f} images/sec', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,294 @@
+# --- 前處理與量測效能測試 ---
+# 以固定種子產生已知零件尺寸的合成影像（VGA ~ 4K、不同零件密度），或讀取實拍影像資料夾，
+# 對預設流程（或 GUI 可組出的所有步驟排列）量測 frames/sec、各階段延遲與記憶體峰值。
+# 結果存成 JSON，可與基準檔比較，fps 下降超過門檻時以非 0 結束碼回報。不需要攝影機。
+#
+#     python benchmark.py --output bench.json
+#     python benchmark.py --resolutions 1080p 4K --permutations all --output bench.json
+#     python benchmark.py --baseline bench_baseline.json --threshold 0.1
+#     python benchmark.py --resolutions 4K --tile-workers 8                  # 大影像分塊平行處理
+#     python benchmark.py --live recordings/line3.mp4 --preload   # 以最快速度重播，測整條串流管線的 fps
+#     python benchmark.py --live synthetic:1080p:2000 --precision --engine-processes 2   # 量測改在獨立行程執行
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from capture_pipeline import StagedCapturePipeline
+from frame_sources import open_source
+from measure_engine import DEFAULT_PREPROCESS_STEPS, MeasurementEngine
+from synthetic import RESOLUTIONS, make_synthetic_frame
+from tiling import DEFAULT_TILE_SIZE, TiledProcessor
+
+# 每張 1080p 影像的零件數；其他解析度依像素數等比例換算，維持相同的零件密度
+DENSITIES = {'sparse': 10, 'medium': 200, 'dense': 2000}
+DEFAULT_RESOLUTIONS = ['VGA', '1080p', '4K']
+DEFAULT_FRAMES = 4
+DEFAULT_REPEAT = 10
+DEFAULT_THRESHOLD = 0.10
+DEFAULT_LIVE_SECONDS = 10.0
+DEFAULT_LIVE_WORKERS = 2
+LIVE_TICK = 1 / 60   # 串流測試時主執行緒模擬 GUI 事件迴圈的週期（秒）
+
+# 案例名稱中使用的步驟縮寫
+STEP_CODES = {
+    'Gray Conversion': 'gray',
+    'Gaussian Blur': 'blur',
+    'Binary Threshold': 'bin',
+    'Morphological Operations': 'morph',
+    'Canny Edge Detection': 'canny',
+}
+
+
+# --- GUI 可組出的步驟清單：不重複的任意子集合與任意順序 ---
+def step_permutations(mode='default'):
+    if mode == 'default':
+        return [list(DEFAULT_PREPROCESS_STEPS)]
+    steps = list(DEFAULT_PREPROCESS_STEPS)
+    return [list(p) for k in range(1, len(steps) + 1) for p in itertools.permutations(steps, k)]
+
+
+def load_captures(folder, limit):
+    frames = []
+    for name in sorted(os.listdir(folder)):
+        frame = cv2.imread(os.path.join(folder, name), cv2.IMREAD_COLOR)
+        if frame is not None:
+            frames.append(frame)
+        if len(frames) >= limit:
+            break
+    return frames
+
+
+# --- 單一案例：暖機 -> 計時 -> 各階段延遲 -> 記憶體峰值，各自分開量以免互相干擾 ---
+# peak_alloc_mb 為暖機後（緩衝區池已配置）處理一輪影像時 numpy 配置的峰值，即穩定狀態的每張配置量
+# tiler（tiling.TiledProcessor）不為 None 時以分塊平行處理量測
+def run_case(steps, frames, repeat, tiler=None):
+    engine = MeasurementEngine(preprocess_steps=list(steps))
+    engine.tiler = tiler
+    try:
+        detected = [len(engine.measure(frame)) for frame in frames]  # 暖機並檢查步驟是否可執行
+    except cv2.error as e:
+        return {'error': e.err.strip().splitlines()[0].lstrip('> ')}
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            engine.measure(frame)
+    elapsed = time.perf_counter() - start
+    total = repeat * len(frames)
+
+    engine.profiler.enabled = True
+    for _ in range(repeat):
+        for frame in frames:
+            engine.measure(frame)
+    stages = {name: {key: round(value, 4) for key, value in stats.items() if key != 'count'}
+              for name, stats in engine.profiler.snapshot()['stages'].items()}
+    engine.profiler.enabled = False
+
+    tracemalloc.start()
+    for frame in frames:
+        engine.measure(frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'fps': round(total / elapsed, 2),
+        'mean_ms': round(elapsed / total * 1000, 4),
+        'stages': stages,
+        'peak_alloc_mb': round(peak / 2 ** 20, 3),
+        'detected': int(np.mean(detected)),
+    }
+
+
+def run_suite(resolutions, densities, permutation_mode, frames_per_case, repeat, captures=None,
+              seed=0, progress=None, tiler=None):
+    frame_sets = {}
+    for res in resolutions:
+        width, height = RESOLUTIONS[res]
+        for density in densities:
+            n_parts = max(1, round(DENSITIES[density] * width * height / (1920 * 1080)))
+            frame_sets[f'{res}/{density}'] = ([make_synthetic_frame(width, height, n_parts, seed=seed + i)[0]
+                                               for i in range(frames_per_case)], n_parts)
+    if captures:
+        frame_sets['captures'] = (captures, None)
+
+    cases = {}
+    for set_name, (frames, n_parts) in frame_sets.items():
+        for steps in step_permutations(permutation_mode):
+            name = f"{set_name}/{'+'.join(STEP_CODES[s] for s in steps)}"
+            result = run_case(steps, frames, repeat, tiler)
+            if n_parts is not None:
+                result['parts'] = n_parts
+            cases[name] = result
+            if progress:
+                progress(name, result)
+    return {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+            'frames_per_case': frames_per_case,
+            'seed': seed,
+            'tile_workers': tiler.workers if tiler is not None else 0,
+            'max_rss_mb': _max_rss_mb(),
+        },
+        'cases': cases,
+    }
+
+
+# 行程的最大常駐記憶體（含 OpenCV 內部配置）；非 Unix 平台回傳 None
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+
+# --- 與基準比較：回傳 fps 下降超過門檻的案例 ---
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for name, result in report['cases'].items():
+        base = baseline.get('cases', {}).get(name)
+        if not base or 'fps' not in base or 'fps' not in result:
+            continue
+        change = result['fps'] / base['fps'] - 1.0
+        if change < -threshold:
+            regressions.append((name, base['fps'], result['fps'], change))
+    return regressions
+
+
+# --- 串流管線測試：來源以最快速度輸出，量測 擷取 -> worker -> 依序送出 的整體吞吐量 ---
+# processes > 0 時量測交給 process_worker.ProcessEngine（worker 數量等於行程數）；
+# 主執行緒每 LIVE_TICK 醒來一次並記錄延遲，模擬 GUI 事件迴圈搶不到 GIL 時的卡頓
+def run_live(source, seconds=DEFAULT_LIVE_SECONDS, workers=DEFAULT_LIVE_WORKERS, processes=0, precision=False):
+    engine = MeasurementEngine(precision=precision).prepare()
+    process_engine = None
+    frame_pool = None
+    process = engine.measure
+    if processes:
+        from process_worker import ProcessEngine
+        process_engine = ProcessEngine(processes).start()
+        process = lambda frame: process_engine.measure(frame, engine)
+        frame_pool = process_engine.frames
+        workers = processes
+    emitted = []
+    lags = []
+    pipeline = StagedCapturePipeline(source, process, workers=workers, fps=0, frame_pool=frame_pool,
+                                     on_result=lambda seq, frame, result: emitted.append(seq))
+    try:
+        start = time.perf_counter()
+        pipeline.start()
+        deadline = start
+        while time.perf_counter() - start < seconds and not pipeline.finished:
+            deadline += LIVE_TICK
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+            lags.append(time.perf_counter() - deadline)
+            deadline = max(deadline, time.perf_counter() - LIVE_TICK)
+        pipeline.stop()
+        elapsed = time.perf_counter() - start
+    finally:
+        if process_engine is not None:
+            process_engine.close()
+    lags = np.array(lags) * 1000
+    return {
+        'source': source.describe(),
+        'seconds': elapsed,
+        'captured_fps': pipeline.frames_captured / elapsed,
+        'processed_fps': pipeline.frames_processed / elapsed,
+        'emitted': len(emitted),
+        'dropped': pipeline.input_queue.dropped,
+        'errors': pipeline.errors,
+        'processes': processes,
+        'main_thread_lag_ms': {'mean': float(lags.mean()), 'p99': float(np.percentile(lags, 99)),
+                               'max': float(lags.max())} if len(lags) else None,
+    }
+
+
+def _print_result(name, result):
+    if 'error' in result:
+        print(f'{name:<48} skipped ({result["error"]})')
+    else:
+        print(f'{name:<48} {result["fps"]:>9.1f} fps {result["mean_ms"]:>9.2f} ms '
+              f'{result["peak_alloc_mb"]:>8.2f} MB  {result["detected"]} contours')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='前處理與輪廓量測效能測試')
+    parser.add_argument('--resolutions', nargs='+', choices=list(RESOLUTIONS), default=DEFAULT_RESOLUTIONS)
+    parser.add_argument('--densities', nargs='+', choices=list(DENSITIES), default=list(DENSITIES))
+    parser.add_argument('--permutations', choices=['default', 'all'], default='default',
+                        help='default：只測預設流程；all：測 GUI 可組出的所有步驟排列')
+    parser.add_argument('--images', help='額外加入的實拍影像資料夾')
+    parser.add_argument('--frames', type=int, default=DEFAULT_FRAMES, help='每個案例的影像張數')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='每張影像重複次數')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', '-o', help='結果 JSON 檔')
+    parser.add_argument('--baseline', help='比較用的基準 JSON 檔')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='fps 下降超過此比例視為退步（預設 0.10）')
+    parser.add_argument('--tile-workers', type=int, default=0,
+                        help='以幾條執行緒分塊平行處理（0 表示整張處理）')
+    parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE, help='分塊大小（像素）')
+    parser.add_argument('--live', metavar='SOURCE',
+                        help='改測串流管線：錄影檔 / 影像資料夾 / synthetic[:解析度[:零件數]]，以最快速度輸出')
+    parser.add_argument('--live-seconds', type=float, default=DEFAULT_LIVE_SECONDS)
+    parser.add_argument('--workers', type=int, default=DEFAULT_LIVE_WORKERS, help='串流管線的 worker 數量')
+    parser.add_argument('--preload', action='store_true', help='重播前先把影像解碼到記憶體，排除讀檔與解碼時間')
+    parser.add_argument('--engine-processes', type=int, default=0,
+                        help='串流測試時量測改在幾個獨立行程執行（0 表示在串流執行緒執行）')
+    parser.add_argument('--precision', action='store_true', help='串流測試使用精密量測模式')
+    args = parser.parse_args(argv)
+
+    if args.live:
+        source = open_source(args.live, realtime=False, preload=args.preload)
+        try:
+            result = run_live(source, args.live_seconds, args.workers, args.engine_processes, args.precision)
+        finally:
+            source.release()
+        print(f'{result["source"]}')
+        print(f'擷取 {result["captured_fps"]:.1f} fps，量測 {result["processed_fps"]:.1f} fps，'
+              f'丟棄 {result["dropped"]} 張，錯誤 {result["errors"]}')
+        lag = result['main_thread_lag_ms']
+        if lag:
+            print(f'主執行緒延遲 平均 {lag["mean"]:.2f} ms，p99 {lag["p99"]:.2f} ms，最大 {lag["max"]:.2f} ms')
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+        return 0
+
+    captures = load_captures(args.images, args.frames) if args.images else None
+    tiler = TiledProcessor(args.tile_workers, args.tile_size, min_pixels=0) if args.tile_workers else None
+    report = run_suite(args.resolutions, args.densities, args.permutations, args.frames, args.repeat,
+                       captures, args.seed, progress=_print_result, tiler=tiler)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for name, base_fps, fps, change in regressions:
+            print(f'REGRESSION {name}: {base_fps:.1f} -> {fps:.1f} fps ({change:+.1%})')
+        if regressions:
+            return 1
+        print(f'與基準相比沒有超過 {args.threshold:.0%} 的退步')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
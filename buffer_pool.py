@@ -0,0 +1,36 @@
+# --- 影像緩衝區池 ---
+# 以 (shape, dtype, slot) 為鍵重複使用同一塊記憶體，
+# 讓即時迴圈在穩定狀態下不再每張影像配置新的陣列。
+# 取得的緩衝區會在下一次使用同一個鍵時被覆寫，需要保存時請自行 copy()。
+import numpy as np
+
+
+class FramePool:
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, shape, dtype=np.uint8, slot=0):
+        key = (tuple(shape), np.dtype(dtype).str, slot)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = np.empty(shape, dtype)
+            self._buffers[key] = buffer
+        return buffer
+
+    # 與 image 同形狀、同型別的緩衝區
+    def like(self, image, slot=0):
+        return self.get(image.shape, image.dtype, slot)
+
+    # 從攝影機讀取影像到重複使用的緩衝區（不同 slot 可做前後張交替）
+    def read(self, capture, slot=0):
+        key = ('capture', slot)
+        ret, frame = capture.read(self._buffers.get(key))
+        if ret:
+            self._buffers[key] = frame
+        return ret, frame
+
+    def clear(self):
+        self._buffers.clear()
+
+    def __len__(self):
+        return len(self._buffers)
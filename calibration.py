@@ -0,0 +1,265 @@
+# --- 相機校正：內參 / 畸變 + 量測平面的 homography ---
+# 取代單一的 pixel_to_mm_ratio：以棋盤格（或圓點陣列）的多張影像求相機內參與鏡頭畸變，
+# 再以平放在量測平面上的那一張求 homography（去畸變後的正規化座標 -> 平面上的 mm 座標），
+# 畫面邊緣的畸變與相機傾斜造成的透視都會被修正。
+# 校正後預先算好「像素 -> mm」的對照表（每 LUT_STEP 像素一格，雙線性內插），
+# 每張影像只需查表換算輪廓點，不對整張影像做 remap；顯示用的去畸變影像另有預先建好的 remap 對照表。
+# 校正結果存成 JSON，GUI 啟動時自動載入，也會一起寫進量測設定檔。
+#
+#     python calibration.py board/*.png --pattern 9 6 --square 5 --output calibration.json
+#     python calibration.py board/ --plane board/on_belt.png --square 5 --rectify board/on_belt.png rectified.png
+import argparse
+import glob
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from precision import stack_contours
+
+DEFAULT_CALIBRATION_PATH = 'calibration.json'
+DEFAULT_PATTERN = (9, 6)       # 棋盤格內角點數（欄, 列）
+DEFAULT_SQUARE_MM = 10.0       # 相鄰角點（圓心）間距
+MIN_VIEWS = 3                  # 少於此張數時不求內參，只以 homography 修正透視
+# 一般工業鏡頭 k1, k2 已足夠；k3 在校正板沒涵蓋到的畫面邊角容易外插發散，預設固定為 0
+CALIBRATION_FLAGS = cv2.CALIB_FIX_K3
+LUT_STEP = 4                   # 對照表格距（像素）；畸變與透視都很平滑，內插誤差遠小於 0.01 px
+UNDISTORT_CRITERIA = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 50, 1e-10)
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 30, 1e-3)
+
+
+class Calibration:
+    def __init__(self, camera_matrix, dist_coeffs, image_size, homography, rms=None):
+        # camera_matrix 為 None 表示只有 homography（沒有鏡頭畸變模型）
+        self.camera_matrix = None if camera_matrix is None else np.asarray(camera_matrix, np.float64)
+        self.dist_coeffs = None if dist_coeffs is None else np.asarray(dist_coeffs, np.float64).ravel()
+        self.image_size = tuple(int(v) for v in image_size)  # (寬, 高)
+        self.homography = np.asarray(homography, np.float64)
+        self.rms = rms
+        self._lut = None
+        self._rectify_maps = None
+
+    # 去畸變：像素 -> 正規化座標（沒有內參時維持像素座標）
+    def _undistort(self, points):
+        points = np.asarray(points, np.float64).reshape(-1, 1, 2)
+        if self.camera_matrix is None:
+            return points
+        return cv2.undistortPoints(points, self.camera_matrix, self.dist_coeffs, criteria=UNDISTORT_CRITERIA)
+
+    # 不查表的精確換算，用於建表與少量點
+    def to_world_exact(self, points):
+        return cv2.perspectiveTransform(self._undistort(points), self.homography).reshape(-1, 2)
+
+    # 像素 -> mm 對照表，第一次使用時建立
+    def lut(self):
+        if self._lut is None:
+            width, height = self.image_size
+            xs = np.arange(0, width + LUT_STEP, LUT_STEP, dtype=np.float64)
+            ys = np.arange(0, height + LUT_STEP, LUT_STEP, dtype=np.float64)
+            grid = np.stack(np.meshgrid(xs, ys), axis=2)
+            self._lut = self.to_world_exact(grid.reshape(-1, 2)).reshape(len(ys), len(xs), 2)
+        return self._lut
+
+    # --- 把像素座標 (N, 2) 換算成量測平面上的 mm 座標 (N, 2)，對照表雙線性內插 ---
+    def to_world(self, points):
+        lut = self.lut()
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        gx, gy = points[:, 0] / LUT_STEP, points[:, 1] / LUT_STEP
+        ix = np.clip(np.floor(gx).astype(np.intp), 0, lut.shape[1] - 2)
+        iy = np.clip(np.floor(gy).astype(np.intp), 0, lut.shape[0] - 2)
+        fx, fy = (gx - ix)[:, None], (gy - iy)[:, None]
+        top = lut[iy, ix] * (1 - fx) + lut[iy, ix + 1] * fx
+        bottom = lut[iy + 1, ix] * (1 - fx) + lut[iy + 1, ix + 1] * fx
+        return top * (1 - fy) + bottom * fy
+
+    # 畫面中心附近 1 像素對應的 mm，供只接受單一換算比例的地方（例如自動調參評分）使用
+    def mm_per_pixel(self):
+        width, height = self.image_size
+        cx, cy = width / 2.0, height / 2.0
+        p0, px, py = self.to_world_exact([(cx, cy), (cx + 1, cy), (cx, cy + 1)])
+        return float((np.hypot(*(px - p0)) + np.hypot(*(py - p0))) / 2)
+
+    def check_size(self, frame_shape):
+        height, width = frame_shape[:2]
+        if (width, height) != self.image_size:
+            raise ValueError(f'影像尺寸 {width}x{height} 與校正時的 '
+                             f'{self.image_size[0]}x{self.image_size[1]} 不同，請重新校正')
+
+    # --- 整張影像去畸變（顯示用），remap 對照表只建一次 ---
+    def rectify(self, frame):
+        if self.camera_matrix is None:
+            return frame
+        if self._rectify_maps is None:
+            self._rectify_maps = cv2.initUndistortRectifyMap(self.camera_matrix, self.dist_coeffs, None,
+                                                             self.camera_matrix, self.image_size, cv2.CV_16SC2)
+        return cv2.remap(frame, *self._rectify_maps, cv2.INTER_LINEAR)
+
+    def to_dict(self):
+        return {
+            'camera_matrix': None if self.camera_matrix is None else self.camera_matrix.tolist(),
+            'dist_coeffs': None if self.dist_coeffs is None else self.dist_coeffs.tolist(),
+            'image_size': list(self.image_size),
+            'homography': self.homography.tolist(),
+            'rms': self.rms,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('camera_matrix'), data.get('dist_coeffs'), data['image_size'], data['homography'],
+                   data.get('rms'))
+
+
+def save_calibration(calibration, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(calibration.to_dict(), f, indent=2)
+
+
+def load_calibration(path):
+    with open(path, encoding='utf-8') as f:
+        return Calibration.from_dict(json.load(f))
+
+
+# --- 校正板的角點（圓心）在板面上的 mm 座標 (N, 3)，z = 0 ---
+def board_points(pattern_size=DEFAULT_PATTERN, square_mm=DEFAULT_SQUARE_MM):
+    cols, rows = pattern_size
+    points = np.zeros((cols * rows, 3), np.float32)
+    points[:, :2] = np.mgrid[0:cols, 0:rows].T.reshape(-1, 2) * square_mm
+    return points
+
+
+# --- 找出校正板角點（次像素），找不到時回傳 None ---
+def find_board_corners(image, pattern_size=DEFAULT_PATTERN, pattern='chessboard'):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if pattern == 'circles':
+        found, corners = cv2.findCirclesGrid(gray, pattern_size, flags=cv2.CALIB_CB_SYMMETRIC_GRID)
+        return corners.astype(np.float32) if found else None
+    found, corners = cv2.findChessboardCorners(gray, pattern_size,
+                                               flags=cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE)
+    if not found:
+        return None
+    return cv2.cornerSubPix(gray, corners, (5, 5), (-1, -1), SUBPIX_CRITERIA)
+
+
+# 旋轉 homography 的輸出座標，使 mm 座標軸與影像的水平 / 垂直方向一致（寬高的定義與未校正時相同）
+def _align_axes(calibration):
+    width, height = calibration.image_size
+    cx, cy = width / 2.0, height / 2.0
+    p0, p1 = calibration.to_world_exact([(cx, cy), (cx + 1, cy)])
+    angle = np.arctan2(p1[1] - p0[1], p1[0] - p0[0])
+    c, s = np.cos(angle), np.sin(angle)
+    rotation = np.array([[c, s, 0], [-s, c, 0], [0, 0, 1]])
+    calibration.homography = rotation @ calibration.homography
+    # 影像 y 軸與板面 y 軸方向相反時翻轉，維持右手座標（不影響尺寸）
+    q0, q1 = calibration.to_world_exact([(cx, cy), (cx, cy + 1)])
+    if q1[1] < q0[1]:
+        calibration.homography = np.diag([1.0, -1.0, 1.0]) @ calibration.homography
+    return calibration
+
+
+# --- 由多張校正板影像求內參與畸變，並以 plane_image（預設第一張）求量測平面的 homography ---
+def calibrate(images, pattern_size=DEFAULT_PATTERN, square_mm=DEFAULT_SQUARE_MM, plane_image=None,
+              pattern='chessboard'):
+    images = list(images)
+    if not images:
+        raise ValueError('沒有校正影像')
+    height, width = images[0].shape[:2]
+    if any(image.shape[:2] != (height, width) for image in images):
+        raise ValueError('校正影像的尺寸必須相同')
+    object_points = board_points(pattern_size, square_mm)
+    views = [c for c in (find_board_corners(image, pattern_size, pattern) for image in images) if c is not None]
+    if plane_image is None:
+        if not views:
+            raise ValueError(f'找不到 {pattern_size[0]}x{pattern_size[1]} 的校正板')
+        plane = views[0]
+    else:
+        # 內參與畸變屬於校正影像的解析度，不同尺寸的平面影像會得到錯誤的 homography 與 mm 換算
+        if plane_image.shape[:2] != (height, width):
+            raise ValueError(f'量測平面影像的尺寸 {plane_image.shape[1]}x{plane_image.shape[0]} '
+                             f'與校正影像 {width}x{height} 不同')
+        plane = find_board_corners(plane_image, pattern_size, pattern)
+        if plane is None:
+            raise ValueError('量測平面影像中找不到校正板')
+
+    camera_matrix = dist_coeffs = rms = None
+    if len(views) >= MIN_VIEWS:
+        rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(
+            [object_points] * len(views), views, (width, height), None, None, flags=CALIBRATION_FLAGS)
+    calibration = Calibration(camera_matrix, dist_coeffs, (width, height), np.eye(3), rms)
+    homography, _ = cv2.findHomography(calibration._undistort(plane), object_points[:, :2])
+    if homography is None:
+        raise ValueError('無法由校正板求出 homography')
+    calibration.homography = homography
+    return _align_axes(calibration)
+
+
+# --- 以校正結果換算量測結果的 mm 寬高（軸對齊外接矩形模式） ---
+# 輪廓點換到 mm 座標後逐輪廓取 X / Y 範圍。輪廓點是邊界像素的中心，比 boundingRect 的寬（含兩端像素）
+# 少一個像素，依各輪廓的像素寬高等比例補回，與未校正時 w * ratio 的定義一致。
+def apply_calibration(result, calibration):
+    if len(result) == 0:
+        return result
+    points, starts, _ = stack_contours(result.selected_contours)
+    world = calibration.to_world(points)
+    extent = np.maximum.reduceat(world, starts, axis=0) - np.minimum.reduceat(world, starts, axis=0)
+    w, h = result.w.astype(np.float64), result.h.astype(np.float64)
+    result.width_mm = extent[:, 0] * w / np.maximum(w - 1, 1)
+    result.height_mm = extent[:, 1] * h / np.maximum(h - 1, 1)
+    return result
+
+
+def load_images(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(os.path.join(item, name) for name in os.listdir(item)))
+        elif glob.has_magic(item):
+            paths.extend(sorted(glob.glob(item)))
+        else:
+            paths.append(item)
+    images = [cv2.imread(path, cv2.IMREAD_COLOR) for path in paths]
+    return [image for image in images if image is not None]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='以校正板影像建立相機校正（內參、畸變與量測平面 homography）')
+    parser.add_argument('inputs', nargs='+', help='校正板影像（資料夾、glob 或檔案）')
+    parser.add_argument('--pattern', type=int, nargs=2, default=DEFAULT_PATTERN, metavar=('COLS', 'ROWS'),
+                        help='內角點（圓點）數，預設 9 6')
+    parser.add_argument('--square', type=float, default=DEFAULT_SQUARE_MM, help='角點間距（mm）')
+    parser.add_argument('--circles', action='store_true', help='校正板為對稱圓點陣列')
+    parser.add_argument('--plane', help='平放在量測平面上的校正板影像（預設為第一張找得到校正板的影像）')
+    parser.add_argument('--output', '-o', default=DEFAULT_CALIBRATION_PATH)
+    parser.add_argument('--rectify', nargs=2, metavar=('INPUT', 'OUTPUT'), help='輸出一張去畸變影像以供檢查')
+    args = parser.parse_args(argv)
+
+    images = load_images(args.inputs)
+    plane = cv2.imread(args.plane, cv2.IMREAD_COLOR) if args.plane else None
+    if args.plane and plane is None:
+        print(f'無法讀取 {args.plane}', file=sys.stderr)
+        return 1
+    try:
+        calibration = calibrate(images, tuple(args.pattern), args.square, plane,
+                                'circles' if args.circles else 'chessboard')
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    save_calibration(calibration, args.output)
+    if calibration.camera_matrix is None:
+        print(f'校正板影像少於 {MIN_VIEWS} 張，只修正透視（沒有鏡頭畸變模型）')
+    else:
+        print(f'重投影誤差 RMS = {calibration.rms:.3f} px')
+    print(f'畫面中心 1 px = {calibration.mm_per_pixel():.4f} mm，已儲存至 {args.output}')
+
+    if args.rectify:
+        frame = cv2.imread(args.rectify[0], cv2.IMREAD_COLOR)
+        if frame is None:
+            print(f'無法讀取 {args.rectify[0]}', file=sys.stderr)
+            return 1
+        cv2.imwrite(args.rectify[1], calibration.rectify(frame))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,303 @@
+# --- 多階段擷取管線 ---
+# 擷取執行緒 -> 處理 worker（多條） -> 顯示 / 記錄消費者，各階段以有界佇列連接：
+#   - 擷取 -> 處理：latest 策略，worker 忙不過來時丟掉最舊的影像
+#   - 顯示：latest 策略、容量 1，只畫最新結果
+#   - 記錄：lossless 策略，佇列滿時反壓 worker，不遺漏任何結果
+# 每張影像帶有序號，結果一律依序號順序送出；整體吞吐量只受最慢的階段限制。
+# 設定 gate（motion_gate.MotionGate）時，畫面沒變化的影像在擷取階段就略過，顯示端沿用上一次的結果。
+# 最新的 (序號, 影像, 結果) 另外放在 latest（LatestSlot），GUI 可隨時讀取，不必在串流執行緒操作 GUI 元件。
+# OpenCV 運算會釋放 GIL，因此多條 worker 執行緒可以真正平行處理。
+# capture 可以是 cv2.VideoCapture 或 frame_sources 的來源；realtime 屬性為 False 的來源（最快速度重播）不節流，
+# 擷取 -> 處理改為 lossless（等 worker 有空再讀下一張），每張影像都會被量測，重播結果可重現；
+# 來源播完（read 失敗且 isOpened() 為 False）時擷取執行緒結束，finished 變為 True。
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from profiling import StageProfiler
+
+DROP_OLDEST = 'latest'   # 佇列滿時丟掉最舊的項目
+BLOCK = 'lossless'       # 佇列滿時等待，不丟資料
+
+DEFAULT_FPS = 30.0
+
+
+# --- 有界佇列（可設定丟棄策略） ---
+class FrameQueue:
+    def __init__(self, maxsize, policy=DROP_OLDEST):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f'Unknown queue policy: {policy}')
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    # 放入項目；DROP_OLDEST 策略下回傳被擠掉的項目（沒有則回傳 None）
+    def put(self, item):
+        with self._cond:
+            dropped = None
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    dropped = self._items.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._items) >= self.maxsize and not self.closed:
+                        self._cond.wait()
+            if self.closed:
+                return None
+            self._items.append(item)
+            self._cond.notify_all()
+            return dropped
+
+    # 取出項目；佇列關閉或逾時回傳 None
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._items and not self.closed:
+                self._cond.wait_for(lambda: self._items or self.closed, timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+_SKIPPED = object()
+
+
+# --- 依序號重新排序結果 ---
+# worker 完成的順序不一定與擷取順序相同；被丟棄或處理失敗的序號以 skip 標記，
+# 避免後續結果一直等待
+class ResultSequencer:
+    def __init__(self, emit):
+        self._emit = emit
+        self._next_seq = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def push(self, seq, item):
+        with self._lock:
+            self._pending[seq] = item
+            self._drain()
+
+    def skip(self, seq):
+        self.push(seq, _SKIPPED)
+
+    def _drain(self):
+        while self._next_seq in self._pending:
+            item = self._pending.pop(self._next_seq)
+            if item is not _SKIPPED:
+                self._emit(self._next_seq, item)
+            self._next_seq += 1
+
+
+# --- 最新結果槽 ---
+# 只保存最新的一筆；寫入是單一參照替換（原子操作），讀取端一次取得完整的一筆，
+# 雙方都不加鎖也不等待，讀取太慢時中間的結果直接被覆蓋
+class LatestSlot:
+    def __init__(self):
+        self._item = None
+
+    def publish(self, item):
+        self._item = item
+
+    def get(self):
+        return self._item
+
+    def clear(self):
+        self._item = None
+
+
+# --- 擷取速率控制：依攝影機 fps 計算下一張的時間點 ---
+class FramePacer:
+    def __init__(self, fps):
+        self.period = 1.0 / fps if fps and fps > 0 else 0.0
+        self._deadline = None
+
+    def wait(self):
+        if not self.period:
+            return
+        now = time.monotonic()
+        if self._deadline is None or now - self._deadline > self.period:
+            # 第一張或已經落後超過一個週期：從現在重新計時，不追趕
+            self._deadline = now
+        elif self._deadline > now:
+            time.sleep(self._deadline - now)
+        self._deadline += self.period
+
+
+# --- 多階段擷取管線 ---
+# process(frame) 在 worker 執行緒執行並回傳結果；
+# on_result(seq, frame, result) 依序號順序對每個結果呼叫一次（追蹤等需要連續影格的處理），
+# 在分送到顯示與記錄之前執行，同一時間只會有一個呼叫；
+# on_display(seq, frame, result) 在顯示執行緒執行（只處理最新結果）；
+# on_log(seq, result, timestamp) 在記錄執行緒執行（每個結果都會收到，依序號順序），
+# timestamp 是擷取執行緒讀到該影像時的 time.time()，不受處理與記錄的延遲影響；
+# frame_pool（例如 process_worker.SharedFramePool）給定時以 frame_pool.read(capture) 讀取，
+# 影像直接解碼進它提供的緩衝區，緩衝區不可在影像仍在管線中時被覆寫
+class StagedCapturePipeline:
+    def __init__(self, capture, process, on_display=None, on_log=None, workers=2,
+                 queue_size=2, log_queue_size=256, fps=None, profiler=None, on_result=None, gate=None,
+                 frame_pool=None):
+        self.capture = capture
+        self.process = process
+        self.frame_pool = frame_pool
+        self.on_result = on_result
+        self.gate = gate
+        self.on_display = on_display
+        self.on_log = on_log
+        self.workers = max(1, workers)
+        realtime = getattr(capture, 'realtime', True)
+        if fps is None:
+            fps = (capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS) if realtime else 0
+        self.fps = fps
+        self.profiler = profiler if profiler is not None else StageProfiler()
+
+        self.input_queue = FrameQueue(queue_size, DROP_OLDEST if realtime else BLOCK)
+        self.display_queue = FrameQueue(1, DROP_OLDEST) if on_display else None
+        self.log_queue = FrameQueue(log_queue_size, BLOCK) if on_log else None
+        self.sequencer = ResultSequencer(self._emit)
+        self.latest = LatestSlot()  # 依序號順序最新的 (序號, 影像, 結果)
+
+        self.frames_captured = 0
+        self.frames_skipped = 0   # 畫面沒變化而略過的影像數
+        self.frames_processed = 0
+        self.errors = 0
+        self.last_error = None
+        self.finished = False
+
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self.finished = False
+        self.latest.clear()
+        self._threads = [threading.Thread(target=self._capture_loop, name='capture', daemon=True)]
+        self._threads += [threading.Thread(target=self._worker_loop, name=f'measure-{i}', daemon=True)
+                          for i in range(self.workers)]
+        if self.display_queue is not None:
+            self._threads.append(threading.Thread(target=self._consumer_loop, name='display', daemon=True,
+                                                  args=(self.display_queue, self._display)))
+        if self.log_queue is not None:
+            self._threads.append(threading.Thread(target=self._consumer_loop, name='log', daemon=True,
+                                                  args=(self.log_queue, self._log)))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=1.0):
+        self._running = False
+        for queue in (self.input_queue, self.display_queue, self.log_queue):
+            if queue is not None:
+                queue.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=timeout)
+        self._threads = []
+
+    @property
+    def running(self):
+        return self._running
+
+    # --- 擷取階段 ---
+    def _capture_loop(self):
+        pacer = FramePacer(self.fps)
+        seq = 0
+        while self._running:
+            pacer.wait()
+            with self.profiler.time('capture'):
+                if self.frame_pool is not None:
+                    ret, frame = self.frame_pool.read(self.capture)
+                else:
+                    ret, frame = self.capture.read()
+            if not ret:
+                if not self.capture.isOpened():
+                    self.finished = True
+                    return
+                continue
+            captured_at = time.time()   # 擷取時間跟著影像走，記錄時使用
+            self.frames_captured += 1
+            self.profiler.tick('captured')
+            if self.gate is not None:
+                with self.profiler.time('gate'):
+                    process = self.gate.should_process(frame)
+                if not process:
+                    self.frames_skipped += 1
+                    self.profiler.tick('skipped')
+                    continue
+            dropped = self.input_queue.put((seq, frame, captured_at))
+            if dropped is not None:
+                self.sequencer.skip(dropped[0])
+            seq += 1
+
+    # --- 處理階段 ---
+    def _worker_loop(self):
+        while self._running:
+            item = self.input_queue.get(timeout=0.1)
+            if item is None:
+                continue
+            seq, frame, captured_at = item
+            try:
+                result = self.process(frame)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+                self.sequencer.skip(seq)
+                continue
+            self.frames_processed += 1
+            self.profiler.tick('processed')
+            self.sequencer.push(seq, (frame, result, captured_at))
+
+    # 依序號順序分送到顯示與記錄佇列（在 sequencer 的鎖內執行）
+    def _emit(self, seq, item):
+        frame, result, captured_at = item
+        if self.on_result is not None:
+            try:
+                with self.profiler.time('track'):
+                    self.on_result(seq, frame, result)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+        self.latest.publish((seq, frame, result))
+        if self.display_queue is not None:
+            self.display_queue.put((seq, (frame, result)))
+        if self.log_queue is not None:
+            self.log_queue.put((seq, (result, captured_at)))   # 記錄不需要影像，排隊中的項目不佔住影像
+
+    # --- 消費者階段 ---
+    def _consumer_loop(self, queue, handler):
+        while self._running or len(queue):
+            item = queue.get(timeout=0.1)
+            if item is None:
+                if queue.closed:
+                    return
+                continue
+            seq, args = item
+            try:
+                handler(seq, *args)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+
+    def _display(self, seq, frame, result):
+        with self.profiler.time('display'):
+            self.on_display(seq, frame, result)
+        self.profiler.tick('displayed')
+
+    def _log(self, seq, result, captured_at):
+        self.on_log(seq, result, timestamp=captured_at)
@@ -0,0 +1,317 @@
+# --- 影像來源 ---
+# 與 cv2.VideoCapture 相同的介面（read / get / isOpened / release），可直接交給 StagedCapturePipeline 或 GUI：
+#   - WebcamSource：攝影機，可設定解析度、fps、FOURCC；CAP_PROP_BUFFERSIZE=1 讓 read() 拿到最新的影像
+#   - ReplaySource：重播錄影檔或影像序列（資料夾 / glob），依原始 fps 或以最快速度（不節流）輸出
+#   - SyntheticSource：以固定亂數種子預先產生的合成影像，零件尺寸已知，不需要攝影機
+# 來源開啟一次後由各模式共用，停止串流不會關閉裝置。
+#
+#     source = open_source('0', width=1920, height=1080, fps=60, fourcc='MJPG')
+#     source = open_source('recordings/line3.mp4', realtime=False)   # 壓力測試：不依原始 fps 節流
+#     source = open_source('synthetic:1080p')
+#     pending = open_source_async('0')   # 背景開啟（攝影機初始化常需要數百 ms），同時建立視窗
+#     source = pending.result()
+import os
+import threading
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from synthetic import RESOLUTIONS, make_synthetic_frame
+
+DEFAULT_BUFFER_SIZE = 1
+DEFAULT_REPLAY_FPS = 30.0   # 影像序列沒有 fps 資訊時使用
+DEFAULT_SYNTHETIC_RESOLUTION = '1080p'
+DEFAULT_SYNTHETIC_PARTS = 50
+DEFAULT_SYNTHETIC_FRAMES = 16
+SYNTHETIC_PREFIX = 'synthetic'
+
+
+def fourcc_code(fourcc):
+    return cv2.VideoWriter_fourcc(*fourcc.upper().ljust(4)[:4])
+
+
+def fourcc_name(code):
+    code = int(code)
+    return ''.join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip('\0 ')
+
+
+# 'WxH' 或 RESOLUTIONS 內的名稱（1080p、4K...）轉成 (寬, 高)
+def parse_resolution(text):
+    if text in RESOLUTIONS:
+        return RESOLUTIONS[text]
+    try:
+        width, height = (int(value) for value in text.lower().split('x'))
+    except ValueError:
+        raise ValueError(f'解析度格式應為 寬x高 或 {"/".join(RESOLUTIONS)}，實際為 {text!r}') from None
+    if width <= 0 or height <= 0:
+        raise ValueError(f'解析度必須大於 0：{text!r}')
+    return width, height
+
+
+# 與 cv2.VideoCapture.read(image) 相同：image 形狀與型別相符時寫入 image 並回傳它
+def _into(frame, image):
+    if image is None or image is frame or image.shape != frame.shape or image.dtype != frame.dtype:
+        return frame
+    np.copyto(image, frame)
+    return image
+
+
+# --- 攝影機 ---
+class WebcamSource:
+    def __init__(self, index=0, width=None, height=None, fps=None, fourcc=None,
+                 buffer_size=DEFAULT_BUFFER_SIZE, backend=cv2.CAP_ANY):
+        self.index = index
+        self.realtime = True
+        self.capture = cv2.VideoCapture(index, backend)
+        if self.capture.isOpened():
+            self.configure(width, height, fps, fourcc, buffer_size)
+
+    # 部分後端切換 FOURCC 後會重設解析度，因此先設 FOURCC 再設解析度與 fps；
+    # 驅動不支援的數值會被忽略或換成最接近的值，實際結果以 get() 為準
+    def configure(self, width=None, height=None, fps=None, fourcc=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        if fourcc:
+            self.capture.set(cv2.CAP_PROP_FOURCC, fourcc_code(fourcc))
+        if width:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            self.capture.set(cv2.CAP_PROP_FPS, fps)
+        if buffer_size:
+            self.capture.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+
+    # image：重複使用的緩衝區，形狀相符時 OpenCV 直接解碼進去（例如 process_worker 的共享記憶體區塊）
+    def read(self, image=None):
+        return self.capture.read(image)
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def release(self):
+        self.capture.release()
+
+    def describe(self):
+        width = int(self.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fourcc = fourcc_name(self.get(cv2.CAP_PROP_FOURCC)) or '?'
+        return f'攝影機 {self.index}：{width}x{height} @ {self.get(cv2.CAP_PROP_FPS):g} fps {fourcc}'
+
+
+# --- 錄影 / 影像序列重播 ---
+# realtime=False 時 realtime 屬性為 False，StagedCapturePipeline 不節流，以讀檔與解碼的最快速度輸出；
+# preload=True 先把所有影像解碼到記憶體，重播時不受磁碟與解碼速度限制（注意記憶體用量）
+class ReplaySource:
+    def __init__(self, paths, realtime=True, loop=True, preload=False, fps=None):
+        from batch_measure import expand_inputs  # 載入 ProcessPoolExecutor，只有重播時才需要
+        images, videos = expand_inputs([paths] if isinstance(paths, str) else paths)
+        if not images and not videos:
+            raise ValueError(f'找不到可重播的影像或影片：{paths}')
+        self.realtime = realtime
+        self.loop = loop
+        self.images = images
+        self.videos = videos
+        self.position = 0      # 已輸出的影格數（從頭重播時歸零）
+        self._opened = True
+        self._video_index = 0
+        self._video = None
+        self._frames = None
+        self._size = (0, 0)
+        if videos:
+            self._open_video(0)
+            native_fps = self._video.get(cv2.CAP_PROP_FPS)
+        else:
+            native_fps = 0
+        self.fps = fps or native_fps or DEFAULT_REPLAY_FPS
+        if preload:
+            self._frames = list(self._decode_all())
+            if not self._frames:
+                raise ValueError(f'無法解碼任何影像：{paths}')
+        first = self._frames[0] if self._frames else self._peek()
+        if first is not None:
+            self._size = (first.shape[1], first.shape[0])
+
+    def _open_video(self, index):
+        if self._video is not None:
+            self._video.release()
+        self._video_index = index
+        self._video = cv2.VideoCapture(self.videos[index])
+
+    def _peek(self):
+        if self.images:
+            return cv2.imread(self.images[0])
+        ret, frame = self._video.read()
+        self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return frame if ret else None
+
+    def _decode_all(self):
+        for path in self.images:
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield frame
+        for index in range(len(self.videos)):
+            self._open_video(index)
+            while True:
+                ret, frame = self._video.read()
+                if not ret:
+                    break
+                yield frame
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+    # 依序輸出下一張；影像序列在前、影片在後，全部播完後 loop=True 時從頭開始
+    def _next_frame(self, image=None):
+        if self._frames is not None:
+            if self.position >= len(self._frames):
+                return None
+            return self._frames[self.position]
+        if self.position < len(self.images):
+            frame = cv2.imread(self.images[self.position])
+            return frame if frame is not None else self._skip()
+        while self.videos:
+            if self._video is None:
+                self._open_video(0)
+            ret, frame = self._video.read(image)
+            if ret:
+                return frame
+            if self._video_index + 1 >= len(self.videos):
+                self._video.release()
+                self._video = None
+                return None
+            self._open_video(self._video_index + 1)
+        return None
+
+    # 讀不到的影像檔直接跳過
+    def _skip(self):
+        self.position += 1
+        return self._next_frame()
+
+    # image：重複使用的緩衝區；影片直接解碼進去，影像檔與預先載入的影像形狀相符時複製進去
+    def read(self, image=None):
+        if not self._opened:
+            return False, None
+        frame = self._next_frame(image)
+        if frame is None and self.loop and self.position > 0:
+            self.position = 0
+            frame = self._next_frame(image)
+        if frame is None:
+            self._opened = False
+            return False, None
+        self.position += 1
+        return True, _into(frame, image)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self._size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self._size[1]
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self._frames) if self._frames is not None else 0
+        return 0
+
+    def isOpened(self):
+        return self._opened
+
+    def release(self):
+        self._opened = False
+        self._frames = None
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+    def describe(self):
+        count = '、'.join(text for n, text in ((len(self.images), f'{len(self.images)} 張影像'),
+                                               (len(self.videos), f'{len(self.videos)} 支影片')) if n)
+        speed = f'{self.fps:g} fps' if self.realtime else '最快速度'
+        return f'重播 {count}：{self._size[0]}x{self._size[1]} @ {speed}'
+
+
+# --- 合成影像 ---
+# 預先產生 frames 張（亂數種子 seed, seed+1, ...）並循環輸出，每次執行的內容完全相同；
+# parts 屬性是最近一張影像的零件真值（synthetic.PART_DTYPE）
+class SyntheticSource:
+    def __init__(self, width=None, height=None, n_parts=DEFAULT_SYNTHETIC_PARTS, seed=0,
+                 frames=DEFAULT_SYNTHETIC_FRAMES, fps=DEFAULT_REPLAY_FPS, realtime=True):
+        if width is None or height is None:
+            width, height = RESOLUTIONS[DEFAULT_SYNTHETIC_RESOLUTION]
+        self.size = (width, height)
+        self.fps = fps
+        self.realtime = realtime
+        self.position = 0
+        self.parts = None
+        self._opened = True
+        self._frames = [make_synthetic_frame(width, height, n_parts, seed=seed + i) for i in range(max(1, frames))]
+
+    def read(self, image=None):
+        if not self._opened:
+            return False, None
+        frame, self.parts = self._frames[self.position % len(self._frames)]
+        self.position += 1
+        return True, _into(frame, image)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.size[1]
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return 0
+
+    def isOpened(self):
+        return self._opened
+
+    def release(self):
+        self._opened = False
+        self._frames = []
+
+    def describe(self):
+        speed = f'{self.fps:g} fps' if self.realtime else '最快速度'
+        return f'合成影像 {len(self._frames)} 張循環：{self.size[0]}x{self.size[1]} @ {speed}'
+
+
+# --- 依文字描述開啟來源 ---
+# 整數 -> 攝影機編號；'synthetic[:解析度[:零件數]]' -> 合成影像；其他 -> 錄影檔、資料夾或 glob
+# width / height / fps / fourcc 只套用到攝影機與合成影像（fps 也可覆寫重播速度）；
+# realtime=False 時重播與合成影像以最快速度輸出
+def open_source(spec='0', width=None, height=None, fps=None, fourcc=None, realtime=True, loop=True, preload=False):
+    spec = str(spec)
+    if spec.isdigit():
+        return WebcamSource(int(spec), width, height, fps, fourcc)
+    if spec == SYNTHETIC_PREFIX or spec.startswith(SYNTHETIC_PREFIX + ':'):
+        options = spec.split(':')[1:]
+        if options and options[0]:
+            width, height = parse_resolution(options[0])
+        n_parts = int(options[1]) if len(options) > 1 else DEFAULT_SYNTHETIC_PARTS
+        return SyntheticSource(width, height, n_parts, fps=fps or DEFAULT_REPLAY_FPS, realtime=realtime)
+    if not os.path.exists(spec) and not any(ch in spec for ch in '*?['):
+        raise ValueError(f'找不到影像來源：{spec}')
+    return ReplaySource(spec, realtime=realtime, loop=loop, preload=preload, fps=fps)
+
+
+# --- 在背景執行緒開啟來源，回傳 Future（result() 取得來源或丟出 open_source 的例外） ---
+def open_source_async(spec='0', **options):
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(open_source(spec, **options))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='open-source', daemon=True).start()
+    return future
@@ -0,0 +1,545 @@
+# --- 量測引擎（不依賴 GUI） ---
+# 前處理、輪廓擷取與尺寸換算都集中在這裡，
+# 可在沒有 wxPython / matplotlib 的環境（產線無頭主機、測試程式）直接使用：
+#
+#     engine = MeasurementEngine(pixel_to_mm_ratio=0.05)
+#     result = engine.measure(frame)
+import json
+import threading
+
+import cv2
+import numpy as np
+
+from buffer_pool import FramePool
+from calibration import Calibration, apply_calibration
+from pipeline import compile_pipeline
+from precision import EDGE_RADIUS, PRECISE_DTYPE, apply_precision, rotated_corners
+from profiling import StageProfiler
+
+DEFAULT_BINARY_THRESHOLD = 127
+DEFAULT_MIN_AREA = 50
+MAXIMUM_AREA = 500
+
+# 預設前處理步驟與參數（參數值沿用 AddStepDialog 的字串格式）
+DEFAULT_PREPROCESS_STEPS = ['Gray Conversion', 'Gaussian Blur', 'Binary Threshold',
+                            'Morphological Operations', 'Canny Edge Detection']
+DEFAULT_PREPROCESS_PARAMETERS = {
+    'Gaussian Blur': {'Kernel Size': '5'},
+    'Binary Threshold': {'Threshold': str(DEFAULT_BINARY_THRESHOLD)},
+    'Morphological Operations': {'Kernel Size': '5'},
+    'Canny Edge Detection': {'Threshold': '50'}
+}
+
+BOX_COLOR = (0, 255, 0)
+ROI_COLOR = (0, 200, 255)
+TEXT_COLOR = (255, 0, 0)
+# 直接畫在 RGB 顯示影像上時使用的顏色（與上方 BGR 顏色外觀相同）
+TEXT_COLOR_RGB = TEXT_COLOR[::-1]
+
+
+# --- 公用函式區 ---
+# OpenCV findContours 傳回格式處理函式
+# 處理不同版本的 findContours 回傳值結構
+def grab_contours(cnts):
+    if len(cnts) == 2:
+        return cnts[0]
+    elif len(cnts) == 3:
+        return cnts[1]
+    raise Exception("Contours tuple must have length 2 or 3.")
+
+
+# --- 執行前處理流程 ---
+# 回傳每一步的結果（第 0 張為原圖），最後一張即為二值化後的輪廓來源
+# 僅供單次呼叫使用；重複處理時應改用 compile_pipeline 編譯一次後重複執行
+def preprocess_image(image, steps, parameters, binary_threshold=DEFAULT_BINARY_THRESHOLD):
+    return compile_pipeline(steps, parameters, binary_threshold).run(image, keep_intermediates=True)
+
+
+# --- 擷取外輪廓 ---
+# offset 會加到每個輪廓點上（ROI 子影像的輪廓可直接換回全畫面座標）
+# 精密模式需要完整的邊界點（CHAIN_APPROX_NONE）以沿法線修正次像素邊緣
+def find_contours(binary_image, offset=(0, 0), approx=cv2.CHAIN_APPROX_SIMPLE):
+    return grab_contours(cv2.findContours(binary_image, cv2.RETR_EXTERNAL, approx, offset=offset))
+
+
+# --- 批次計算所有輪廓的外接矩形與面積 ---
+# 把全部輪廓點串成一個陣列，以 reduceat 一次算出每段的最小 / 最大座標與
+# 多邊形面積（鞋帶公式，與 cv2.contourArea 相同），不需逐一呼叫 OpenCV
+def contour_geometry(contours):
+    n = len(contours)
+    if n == 0:
+        empty = np.zeros(0, np.int32)
+        return empty, empty, empty, empty, np.zeros(0, np.float64)
+    lengths = np.fromiter((len(c) for c in contours), np.intp, n)
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    starts = np.zeros(n, np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    px, py = points[:, 0], points[:, 1]
+
+    x = np.minimum.reduceat(px, starts)
+    y = np.minimum.reduceat(py, starts)
+    w = np.maximum.reduceat(px, starts) - x + 1
+    h = np.maximum.reduceat(py, starts) - y + 1
+
+    # 每個點的下一個點（最後一點接回該輪廓的第一點）
+    nxt = np.arange(1, len(points) + 1)
+    nxt[starts + lengths - 1] = starts
+    cross = px * py[nxt] - px[nxt] * py
+    area = np.abs(np.add.reduceat(cross, starts)) * 0.5
+    return (x.astype(np.int32), y.astype(np.int32), w.astype(np.int32), h.astype(np.int32), area)
+
+
+# --- 單張影像的量測結果（欄位式，每個欄位為一個 NumPy 陣列） ---
+# 數值一律保留為陣列，格式化字串只在顯示端（表格、標註）產生
+class MeasurementResult:
+    FIELDS = ('x', 'y', 'w', 'h', 'area', 'width_mm', 'height_mm')
+
+    def __init__(self, contours, indices, x, y, w, h, area, width_mm, height_mm, region=None):
+        self.contours = contours  # findContours 找到的全部輪廓
+        self.indices = indices    # 通過面積過濾的輪廓在 contours 中的索引
+        # 每個量測所屬的 ROI 編號（未使用 ROI 時全為 0）
+        self.region = region if region is not None else np.zeros(len(indices), np.int16)
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.area = area
+        self.width_mm = width_mm    # 未設定換算比例時為像素值
+        self.height_mm = height_mm
+        self.tracks = None          # 追蹤器填入的每列物件 ID 與平滑統計（tracker.TRACK_DTYPE）
+        self.precise = None         # 精密模式的旋轉外接矩形與 Feret 直徑（precision.PRECISE_DTYPE）
+        self.static = None          # 沿用上一張量測的列（StaticReuse）；None 表示沒有檢查
+
+    @classmethod
+    def empty(cls, contours=()):
+        ints = np.zeros(0, np.int32)
+        floats = np.zeros(0, np.float64)
+        return cls(contours, np.zeros(0, np.intp), ints, ints, ints, ints, floats, floats, floats)
+
+    def __len__(self):
+        return len(self.indices)
+
+    # 合併多個 ROI 的結果；第 i 個結果的 region 欄位標記為 i
+    @classmethod
+    def concatenate(cls, results):
+        if not results:
+            return cls.empty()
+        contours = []
+        indices = []
+        for result in results:
+            indices.append(result.indices + len(contours))
+            contours.extend(result.contours)
+        region = np.concatenate([np.full(len(r), i, np.int16) for i, r in enumerate(results)])
+        columns = [np.concatenate([getattr(r, name) for r in results]) for name in cls.FIELDS]
+        merged = cls(contours, np.concatenate(indices), *columns, region=region)
+        if all(r.precise is not None for r in results):
+            merged.precise = np.concatenate([r.precise for r in results])
+        return merged
+
+    # 只含 rows 各列的結果（共用 contours）
+    def subset(self, rows):
+        subset = MeasurementResult(self.contours, self.indices[rows], *(getattr(self, name)[rows] for name in self.FIELDS),
+                                   region=self.region[rows])
+        if self.precise is not None:
+            subset.precise = self.precise[rows]
+        return subset
+
+    @property
+    def rect_area(self):
+        return self.w * self.h
+
+    # 通過過濾的輪廓本身
+    @property
+    def selected_contours(self):
+        return [self.contours[i] for i in self.indices]
+
+    def column(self, name):
+        return getattr(self, name)
+
+    # 結構化陣列（供 CSV / 統計直接使用）
+    def to_records(self):
+        records = np.empty(len(self), dtype=[('x', np.int32), ('y', np.int32), ('w', np.int32), ('h', np.int32),
+                                            ('area', np.float64), ('width_mm', np.float64),
+                                            ('height_mm', np.float64)])
+        for name in self.FIELDS:
+            records[name] = getattr(self, name)
+        return records
+
+
+# --- 計算每個輪廓的尺寸資訊（過濾掉面積小於 min_area 者） ---
+# geometry 可傳入先前 contour_geometry 的結果，只改變 min_area 時不必重算
+def measure_contours(contours, min_area=DEFAULT_MIN_AREA, pixel_to_mm_ratio=None, geometry=None):
+    x, y, w, h, area = geometry if geometry is not None else contour_geometry(contours)
+    indices = np.flatnonzero(area >= min_area)
+    x, y, w, h, area = x[indices], y[indices], w[indices], h[indices], area[indices]
+    scale = pixel_to_mm_ratio if pixel_to_mm_ratio else 1.0
+    return MeasurementResult(contours, indices, x, y, w, h, area, w * scale, h * scale)
+
+
+# --- 在影像上畫出量測框與尺寸文字（直接修改 image） ---
+# 有追蹤結果時標示物件 ID，mm 數值改用平滑後的平均值；精密模式畫旋轉外接矩形
+def draw_measurements(image, result, in_mm=True, box_color=BOX_COLOR, text_color=TEXT_COLOR):
+    precise = result.precise is not None
+    if precise and len(result):
+        cv2.polylines(image, list(rotated_corners(result.precise)), True, box_color, 2)
+    rects = zip(result.x.tolist(), result.y.tolist(), result.w.tolist(), result.h.tolist())
+    tracks = result.tracks
+    if tracks is not None:
+        widths, heights = tracks['width_mean'].tolist(), tracks['height_mean'].tolist()
+        prefixes = [f"#{i} " for i in tracks['id'].tolist()]
+    else:
+        widths, heights = result.width_mm.tolist(), result.height_mm.tolist()
+        prefixes = [''] * len(widths)
+    for (x, y, w, h), width_mm, height_mm, prefix in zip(rects, widths, heights, prefixes):
+        if in_mm:
+            label = f"{prefix}{width_mm:.1f}mm x {height_mm:.1f}mm"
+        else:
+            label = f"{prefix}{w} x {h} px"
+        if not precise:
+            cv2.rectangle(image, (x, y), (x + w, y + h), box_color, 2)
+        cv2.putText(image, label, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, text_color, 1)
+    return image
+
+
+# --- 在影像左上角疊加多行文字（統計資訊等） ---
+def draw_text_lines(image, lines, color=BOX_COLOR, origin=(10, 20), line_height=18):
+    x, y = origin
+    for line in lines:
+        cv2.putText(image, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 3)
+        cv2.putText(image, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+        y += line_height
+    return image
+
+
+# --- 靜止物件沿用上一張的量測 ---
+# 精密模式與相機校正的逐物件運算較重。外接矩形與上一張相同、且區域（含邊緣取樣範圍）內
+# 灰階差超過 pixel_threshold 的像素不到 max_changed_ratio（只有感光雜訊）的物件，直接沿用上一張的寬高與精密量測欄位，
+# 只對其他物件執行精密量測 / 校正。整張畫面靜止時由 motion_gate 在擷取階段略過，這裡處理「部分物件靜止」的情況。
+# 參考只保留上一張影像的縮圖（INTER_AREA 平均，1/STATIC_THUMBNAIL_SCALE 邊長）與結果，不複製整張影像；
+# 串流的多條 worker 執行緒共用同一份參考：每張影像只取一次參考快照，比對與沿用都用這份，更新時加鎖。
+# 引擎快照替換後從頭開始。
+DEFAULT_STATIC_PIXEL_THRESHOLD = 8   # 縮圖上的灰階差（縮小時已平均掉大部分感光雜訊）
+DEFAULT_STATIC_CHANGED_RATIO = 0.01
+STATIC_THUMBNAIL_SCALE = 4
+
+
+# 外接矩形編成一個整數，方便以 intersect1d 一次比對
+def _box_keys(result):
+    return ((result.x.astype(np.int64) << 48) | (result.y.astype(np.int64) << 32) |
+            (result.w.astype(np.int64) << 16) | result.h.astype(np.int64))
+
+
+class StaticReuse:
+    def __init__(self, pixel_threshold=DEFAULT_STATIC_PIXEL_THRESHOLD,
+                 max_changed_ratio=DEFAULT_STATIC_CHANGED_RATIO, margin=EDGE_RADIUS + 1, scale=STATIC_THUMBNAIL_SCALE):
+        self.pixel_threshold = pixel_threshold
+        self.max_changed_ratio = max_changed_ratio
+        self.margin = margin
+        self.scale = scale
+        self._reference = None   # (影像形狀, 縮圖, 結果)
+        self._lock = threading.Lock()
+
+    # 相同設定、沒有參考影像的新實例（引擎快照替換時使用）
+    def renewed(self):
+        return StaticReuse(self.pixel_threshold, self.max_changed_ratio, self.margin, self.scale)
+
+    def thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        size = (max(1, width // self.scale), max(1, height // self.scale))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    # 與 reference（同一份參考快照）比較，回傳 (目前結果的列, 上一張結果的列)，只含靜止的物件
+    def match(self, frame_shape, thumbnail, result, reference):
+        if reference is None or reference[0] != frame_shape or not len(result):
+            return np.zeros(0, np.intp), np.zeros(0, np.intp)
+        _, previous_thumbnail, previous = reference
+        _, rows, previous_rows = np.intersect1d(_box_keys(result), _box_keys(previous), return_indices=True)
+        height, width = thumbnail.shape[:2]
+        margin, scale = self.margin, self.scale
+        keep = []
+        for k, (x, y, w, h) in enumerate(zip(result.x[rows].tolist(), result.y[rows].tolist(),
+                                              result.w[rows].tolist(), result.h[rows].tolist())):
+            # 縮圖座標，往外取整讓邊緣取樣範圍都包含在內
+            x0, y0 = max((x - margin) // scale, 0), max((y - margin) // scale, 0)
+            x1, y1 = min(-(-(x + w + margin) // scale), width), min(-(-(y + h + margin) // scale), height)
+            diff = cv2.absdiff(thumbnail[y0:y1, x0:x1], previous_thumbnail[y0:y1, x0:x1])
+            diff = diff.reshape(diff.shape[0], -1)
+            changed = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=diff)[1])
+            if changed <= self.max_changed_ratio * diff.size:
+                keep.append(k)
+        return rows[keep], previous_rows[keep]
+
+    # refine(result) 就地計算 width_mm / height_mm（與 precise）；靜止的列沿用上一張，只對其他列呼叫 refine
+    def apply(self, frame, result, refine):
+        thumbnail = self.thumbnail(frame)
+        with self._lock:
+            reference = self._reference
+        rows, previous_rows = self.match(frame.shape, thumbnail, result, reference)
+        result.static = np.zeros(len(result), bool)
+        result.static[rows] = True
+        if len(rows) == 0:
+            refine(result)
+        else:
+            previous = reference[2]
+            moving = np.flatnonzero(~result.static)
+            subset = result.subset(moving)
+            if len(moving):
+                refine(subset)
+            width_mm = np.empty(len(result), np.float64)
+            height_mm = np.empty(len(result), np.float64)
+            width_mm[rows], height_mm[rows] = previous.width_mm[previous_rows], previous.height_mm[previous_rows]
+            width_mm[moving], height_mm[moving] = subset.width_mm, subset.height_mm
+            result.width_mm, result.height_mm = width_mm, height_mm
+            if previous.precise is not None:
+                precise = np.zeros(len(result), PRECISE_DTYPE)
+                precise[rows] = previous.precise[previous_rows]
+                if subset.precise is not None:
+                    precise[moving] = subset.precise
+                result.precise = precise
+        with self._lock:
+            self._reference = (frame.shape, thumbnail, result)
+        return result
+
+
+# --- 感興趣區域（ROI） ---
+# 每個 ROI 有自己的前處理步驟與參數（內含一個 MeasurementEngine），
+# 量測時只對該區域的 numpy view（不複製）執行管線，輪廓座標以 offset 換回全畫面
+class RegionOfInterest:
+    def __init__(self, x, y, w, h, name='', engine=None):
+        self.x, self.y, self.w, self.h = int(x), int(y), int(w), int(h)
+        self.name = name
+        self.engine = engine if engine is not None else MeasurementEngine()
+
+    # 裁切到影像範圍內的 (x0, y0, x1, y1)
+    def bounds(self, frame_shape):
+        height, width = frame_shape[:2]
+        x0, y0 = min(max(self.x, 0), width), min(max(self.y, 0), height)
+        x1, y1 = min(max(self.x + self.w, x0), width), min(max(self.y + self.h, y0), height)
+        return x0, y0, x1, y1
+
+    # 換算比例、相機校正與精密模式由上層引擎統一提供
+    def measure(self, frame, pixel_to_mm_ratio=None, profiler=None, precision=False, calibration=None):
+        x0, y0, x1, y1 = self.bounds(frame.shape)
+        if x1 <= x0 or y1 <= y0:
+            return MeasurementResult.empty()
+        view = frame[y0:y1, x0:x1]
+        engine = self.engine
+        processed = engine.pipeline.run(view, pool=engine.pool, profiler=profiler)
+        approx = cv2.CHAIN_APPROX_NONE if precision else cv2.CHAIN_APPROX_SIMPLE
+        contours = find_contours(processed, offset=(x0, y0), approx=approx)
+        result = measure_contours(contours, engine.min_area, pixel_to_mm_ratio)
+        if precision:
+            apply_precision(result, frame, pixel_to_mm_ratio, calibration=calibration)
+        elif calibration is not None:
+            apply_calibration(result, calibration)
+        return result
+
+    def to_config(self):
+        config = self.engine.to_config()
+        config.pop('pixel_to_mm_ratio', None)  # 換算比例、相機校正與精密模式由上層引擎統一提供
+        config.pop('calibration', None)
+        config.pop('precision', None)
+        return {'x': self.x, 'y': self.y, 'w': self.w, 'h': self.h, 'name': self.name, 'config': config}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['x'], config['y'], config['w'], config['h'], config.get('name', ''),
+                   MeasurementEngine.from_config(config.get('config', {})))
+
+
+# --- 量測引擎 ---
+# 設定 rois 後只處理各 ROI 區域，並各自使用 ROI 自己的前處理設定
+class MeasurementEngine:
+    def __init__(self, preprocess_steps=None, preprocess_parameters=None,
+                 binary_threshold=DEFAULT_BINARY_THRESHOLD, min_area=DEFAULT_MIN_AREA,
+                 pixel_to_mm_ratio=None, rois=None, profiler=None, precision=False, calibration=None):
+        if preprocess_steps is None:
+            preprocess_steps = list(DEFAULT_PREPROCESS_STEPS)
+        if preprocess_parameters is None:
+            preprocess_parameters = {step: dict(params) for step, params in DEFAULT_PREPROCESS_PARAMETERS.items()}
+        self.preprocess_steps = preprocess_steps
+        self.preprocess_parameters = preprocess_parameters
+        self._binary_threshold = binary_threshold
+        self.min_area = min_area
+        self.pixel_to_mm_ratio = pixel_to_mm_ratio  # 畫素與毫米的換算比例
+        self._pipeline = None  # 編譯後的前處理管線，步驟或參數變更時才重建
+        self._local = threading.local()  # 每條執行緒各自的緩衝區池
+        self.rois = rois if rois is not None else []  # RegionOfInterest 清單，空清單表示處理全畫面
+        self.profiler = profiler if profiler is not None else StageProfiler()  # 預設停用
+        # 精密模式：次像素邊緣與旋轉外接矩形（較慢）；False 時使用軸對齊外接矩形
+        self.precision = precision
+        # 相機校正（calibration.Calibration）；設定後取代 pixel_to_mm_ratio，修正鏡頭畸變與透視
+        self.calibration = calibration
+        # 超大影像的分塊平行處理（tiling.TiledProcessor），結果與整張處理相同；None 表示整張處理
+        self.tiler = None
+        # 串流時靜止物件沿用上一張的精密量測 / 校正結果（StaticReuse）；None 表示每張都完整計算
+        self.static_reuse = None
+
+    # --- 設定檔（前處理步驟、參數與換算比例） ---
+    def to_config(self):
+        return {
+            'preprocess_steps': list(self.preprocess_steps),
+            'preprocess_parameters': {step: dict(params) for step, params in self.preprocess_parameters.items()},
+            'binary_threshold': self.binary_threshold,
+            'min_area': self.min_area,
+            'pixel_to_mm_ratio': self.pixel_to_mm_ratio,
+            'precision': self.precision,
+            'calibration': self.calibration.to_dict() if self.calibration is not None else None,
+            'rois': [roi.to_config() for roi in self.rois],
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(preprocess_steps=list(config.get('preprocess_steps', DEFAULT_PREPROCESS_STEPS)),
+                   preprocess_parameters={step: dict(params) for step, params in
+                                          config.get('preprocess_parameters', DEFAULT_PREPROCESS_PARAMETERS).items()},
+                   binary_threshold=config.get('binary_threshold', DEFAULT_BINARY_THRESHOLD),
+                   min_area=config.get('min_area', DEFAULT_MIN_AREA),
+                   pixel_to_mm_ratio=config.get('pixel_to_mm_ratio'),
+                   precision=config.get('precision', False),
+                   calibration=Calibration.from_dict(config['calibration']) if config.get('calibration') else None,
+                   rois=[RegionOfInterest.from_config(roi) for roi in config.get('rois', [])])
+
+    @property
+    def binary_threshold(self):
+        return self._binary_threshold
+
+    @binary_threshold.setter
+    def binary_threshold(self, value):
+        if value != self._binary_threshold:
+            self._binary_threshold = value
+            self._pipeline = None
+
+    # 是否已能換算成 mm（設定了換算比例或相機校正）
+    @property
+    def has_scale(self):
+        return self.pixel_to_mm_ratio is not None or self.calibration is not None
+
+    @property
+    def contour_approx(self):
+        return cv2.CHAIN_APPROX_NONE if self.precision else cv2.CHAIN_APPROX_SIMPLE
+
+    # --- 設定快照：複製目前設定（可同時修改部分欄位）並預先編譯，回傳新的引擎 ---
+    # 串流中不直接修改使用中的引擎，而是建立新快照後一次替換參照（參照指派為原子操作）；
+    # 量測端每張影像只讀取一次引擎參照，不會看到改到一半的設定，也不需要加鎖。
+    # 相機校正、ROI、profiler 與 tiler 本身不會被修改，新舊快照直接共用
+    def replace(self, **changes):
+        fields = {
+            'preprocess_steps': list(self.preprocess_steps),
+            'preprocess_parameters': {step: dict(params) for step, params in self.preprocess_parameters.items()},
+            'binary_threshold': self.binary_threshold,
+            'min_area': self.min_area,
+            'pixel_to_mm_ratio': self.pixel_to_mm_ratio,
+            'rois': list(self.rois),
+            'profiler': self.profiler,
+            'precision': self.precision,
+            'calibration': self.calibration,
+        }
+        fields.update(changes)
+        engine = MeasurementEngine(**fields)
+        engine.tiler = self.tiler
+        if self.static_reuse is not None:
+            engine.static_reuse = self.static_reuse.renewed()  # 參考結果屬於舊設定，不可沿用
+        return engine.prepare()
+
+    # 步驟清單或參數被直接修改後呼叫，下一張影像會重新編譯管線
+    def invalidate_pipeline(self):
+        self._pipeline = None
+
+    # 前處理與顯示用的重複使用緩衝區；每條執行緒各有一份，多條 worker 可同時呼叫 measure
+    @property
+    def pool(self):
+        pool = getattr(self._local, 'pool', None)
+        if pool is None:
+            pool = FramePool()
+            self._local.pool = pool
+        return pool
+
+    @property
+    def pipeline(self):
+        pipeline = self._pipeline
+        if pipeline is None:
+            pipeline = compile_pipeline(self.preprocess_steps, self.preprocess_parameters, self._binary_threshold)
+            self._pipeline = pipeline
+        return pipeline
+
+    # 預先編譯管線（含各 ROI）並建立相機校正對照表，切換設定後的第一張影像不必等待
+    def prepare(self):
+        self.pipeline
+        for roi in self.rois:
+            roi.engine.pipeline
+        if self.calibration is not None:
+            self.calibration.lut()
+        return self
+
+    # 回傳每一步的中間結果（除錯畫面用）
+    def preprocess(self, image):
+        return self.pipeline.run(image, keep_intermediates=True)
+
+    def measure(self, frame):
+        profiler = self.profiler
+        if self.rois:
+            if self.calibration is not None:
+                self.calibration.check_size(frame.shape)
+            return MeasurementResult.concatenate([roi.measure(frame, self.pixel_to_mm_ratio, profiler,
+                                                              self.precision, self.calibration)
+                                                  for roi in self.rois])
+        tiler = self.tiler
+        if tiler is not None and tiler.applies(frame):
+            with profiler.time('tiled_preprocess'):
+                processed = tiler.preprocess(frame, self.pipeline, self.pool)
+            with profiler.time('find_contours'):
+                contours = tiler.find_contours(processed, self.contour_approx)
+        else:
+            processed = self.pipeline.run(frame, pool=self.pool, profiler=profiler)
+            with profiler.time('find_contours'):
+                contours = find_contours(processed, approx=self.contour_approx)
+        with profiler.time('measure_contours'):
+            result = measure_contours(contours, self.min_area, self.pixel_to_mm_ratio)
+        if self.calibration is not None:
+            self.calibration.check_size(frame.shape)
+        if self.precision:
+            refine = lambda target: apply_precision(target, frame, self.pixel_to_mm_ratio, calibration=self.calibration)
+            stage = 'precision'
+        elif self.calibration is not None:
+            refine = lambda target: apply_calibration(target, self.calibration)
+            stage = 'calibration'
+        else:
+            return result
+        with profiler.time(stage):
+            if self.static_reuse is not None:
+                return self.static_reuse.apply(frame, result, refine)
+            refine(result)
+        return result
+
+    # 在影像上畫出各 ROI 的範圍
+    def draw_rois(self, image, color=ROI_COLOR):
+        for roi in self.rois:
+            x0, y0, x1, y1 = roi.bounds(image.shape)
+            cv2.rectangle(image, (x0, y0), (x1 - 1, y1 - 1), color, 1)
+            if roi.name:
+                cv2.putText(image, roi.name, (x0 + 3, y0 + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+        return image
+
+    # 回傳畫好標示的影像副本（BGR，可長期保存）
+    def annotate(self, frame, result, in_mm=True):
+        return draw_measurements(self.draw_rois(frame.copy()), result, in_mm)
+
+    # 即時顯示用：轉成 RGB 寫入重複使用的顯示緩衝區後直接標示，
+    # 省去 frame.copy() 與額外的色彩轉換配置；回傳的影像下一張會被覆寫
+    def render_rgb(self, frame, result, in_mm=True):
+        with self.profiler.time('annotate'):
+            display = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.pool.like(frame, 'display'))
+            self.draw_rois(display, ROI_COLOR[::-1])
+            return draw_measurements(display, result, in_mm, text_color=TEXT_COLOR_RGB)
+
+
+# --- 儲存 / 讀取量測設定（JSON） ---
+def save_config(engine, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(engine.to_config(), f, ensure_ascii=False, indent=2)
+
+
+def load_config(path):
+    with open(path, encoding='utf-8') as f:
+        return MeasurementEngine.from_config(json.load(f))
@@ -0,0 +1,329 @@
+# --- 量測紀錄（SPC 用） ---
+# 每張影像的量測結果（時間、影格序號、物件 ID、寬高 mm、面積）交給背景寫入執行緒，
+# 累積成批後以「分塊欄式」二進位格式附加到檔案：每塊先寫區塊標頭（列數、時間範圍），
+# 再依序寫入各欄位的連續陣列（8 位元組對齊）。讀取時以 np.memmap 直接對應各欄位，不需解析，
+# 並可依區塊標頭的時間範圍略過整塊，一天 30 fps 的紀錄也能在數秒內查詢。
+# append 不會阻塞：佇列滿時丟掉最舊的影像並計數（frames_dropped），
+# 每個檔案丟掉的影像數記在檔頭的 frames_dropped（log_metadata() 讀取），資料的缺口在檔案本身就看得到。
+# 時間欄位是擷取時間（由擷取管線傳入），不是寫入執行緒處理到該筆的時間。檔案依大小或時間輪替，可另外輸出 CSV。
+#
+#     log = MeasurementLog('logs', write_csv=True)
+#     log.start()
+#     log.append(seq, result, timestamp=t)     # 擷取管線的 on_log
+#     log.stop()
+#     data = read_logs('logs', start=time.time() - 3600)   # {'timestamp': ..., 'width_mm': ..., ...}
+#
+#     python measurement_log.py logs/ --start 2024-05-01T08:00 --end 2024-05-01T20:00 --csv shift.csv
+import argparse
+import glob
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from capture_pipeline import DROP_OLDEST, FrameQueue
+
+LOG_FIELDS = [('timestamp', '<f8'), ('seq', '<i8'), ('object_id', '<i8'),
+              ('width_mm', '<f4'), ('height_mm', '<f4'), ('area', '<f4')]
+CSV_FORMATS = ['%.6f', '%d', '%d', '%.4f', '%.4f', '%.1f']
+LOG_EXTENSION = '.pxlog'
+FILE_MAGIC = b'PXLOG\x00\x00\x01'
+CHUNK_MAGIC = b'CHNK'
+CHUNK_HEADER = struct.Struct('<4sIdd')  # 標記、列數、最早 / 最晚時間，共 24 位元組
+DEFAULT_BATCH_ROWS = 8192
+DEFAULT_FLUSH_INTERVAL = 1.0      # 秒；未滿一批時最長多久寫出一次
+DEFAULT_ROTATE_BYTES = 256 * 2 ** 20
+DEFAULT_ROTATE_SECONDS = 3600.0
+DEFAULT_QUEUE_FRAMES = 4096
+META_RESERVE = 32   # 檔頭 JSON 後預留的空白，更新 frames_dropped 時就地改寫，不必移動資料
+
+
+def _padded(nbytes):
+    return (nbytes + 7) & ~7
+
+
+# 各欄位的 (名稱, dtype, 在區塊內的位移) 與整塊資料的大小
+def _chunk_layout(fields, rows):
+    layout = []
+    offset = CHUNK_HEADER.size
+    for name, dtype in fields:
+        dtype = np.dtype(dtype)
+        layout.append((name, dtype, offset))
+        offset += _padded(rows * dtype.itemsize)
+    return layout, offset
+
+
+# meta 以空白補到 size 位元組（JSON 解析時忽略），之後以相同大小改寫
+def _file_header(meta, size):
+    meta = json.dumps(meta).encode('utf-8').ljust(size)
+    header = FILE_MAGIC + struct.pack('<I', len(meta)) + meta
+    return header + b'\x00' * (_padded(len(header)) - len(header))
+
+
+class MeasurementLog:
+    def __init__(self, directory, prefix='measurements', rotate_bytes=DEFAULT_ROTATE_BYTES,
+                 rotate_seconds=DEFAULT_ROTATE_SECONDS, write_csv=False, batch_rows=DEFAULT_BATCH_ROWS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, queue_frames=DEFAULT_QUEUE_FRAMES):
+        self.directory = directory
+        self.prefix = prefix
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.write_csv = write_csv
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.queue_frames = queue_frames
+        self._queue = FrameQueue(queue_frames, DROP_OLDEST)
+        self._thread = None
+        self._file = None
+        self._csv = None
+        self._opened_at = 0.0
+        self._meta = None
+        self._meta_size = 0
+        self._dropped_before = 0    # 已記在之前檔案裡的丟棄數，之後增加的部分算在目前的檔案
+        self.path = None            # 目前寫入中的檔案
+        self.rows_written = 0
+        self.chunks_written = 0
+        self.last_error = None
+
+    @property
+    def frames_dropped(self):
+        return self._queue.dropped
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._queue = FrameQueue(self.queue_frames, DROP_OLDEST)
+        self._dropped_before = 0
+        self._thread = threading.Thread(target=self._run, name='measurement-log', daemon=True)
+        self._thread.start()
+
+    # 關閉佇列後寫完剩下的資料再結束
+    def stop(self, timeout=5.0):
+        self._queue.close()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    # --- 加入一張影像的量測結果（不阻塞，只保存陣列參照） ---
+    def append(self, seq, result, timestamp=None):
+        if len(result) == 0:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        ids = result.tracks['id'] if result.tracks is not None else None
+        # 只複製要寫的小欄位，佇列不保留整個結果（worker 行程的結果欄位是共享記憶體區塊的檢視）
+        self._queue.put((timestamp, seq, ids, result.width_mm.copy(), result.height_mm.copy(), result.area.copy()))
+
+    def _run(self):
+        pending = []
+        rows = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            if item is not None:
+                pending.append(item)
+                rows += len(item[3])
+            closed = item is None and self._queue.closed
+            if pending and (rows >= self.batch_rows or closed or time.monotonic() >= deadline):
+                try:
+                    self._write_chunk(self._columns(pending, rows))
+                except OSError as e:
+                    self.last_error = e
+                pending, rows = [], 0
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+            if closed:
+                break
+        self._close_files()
+
+    # 把一批影像的結果組成各欄位的連續陣列
+    def _columns(self, pending, rows):
+        counts = np.fromiter((len(item[3]) for item in pending), np.intp, len(pending))
+        timestamps = np.repeat(np.fromiter((item[0] for item in pending), np.float64, len(pending)), counts)
+        seqs = np.repeat(np.fromiter((item[1] for item in pending), np.int64, len(pending)), counts)
+        ids = np.concatenate([item[2] if item[2] is not None else np.full(len(item[3]), -1, np.int64)
+                              for item in pending])
+        return [timestamps, seqs, ids] + [np.concatenate([item[k] for item in pending]) for k in (3, 4, 5)]
+
+    def _rotate_due(self):
+        if self._file is None:
+            return True
+        return (self._file.tell() >= self.rotate_bytes or
+                (self.rotate_seconds and time.time() - self._opened_at >= self.rotate_seconds))
+
+    def _open_files(self):
+        self._close_files()
+        self._opened_at = time.time()
+        stamp = datetime.fromtimestamp(self._opened_at).strftime('%Y%m%d-%H%M%S')
+        # 同一秒內輪替多次時以流水號區分，檔名排序即為時間順序
+        suffix = 0
+        while os.path.exists(os.path.join(self.directory, f'{self.prefix}-{stamp}-{suffix:03d}{LOG_EXTENSION}')):
+            suffix += 1
+        base = os.path.join(self.directory, f'{self.prefix}-{stamp}-{suffix:03d}')
+        self.path = base + LOG_EXTENSION
+        self._file = open(self.path, 'wb')
+        self._meta = {'fields': LOG_FIELDS, 'created': self._opened_at, 'frames_dropped': 0}
+        self._meta_size = len(json.dumps(self._meta)) + META_RESERVE
+        self._file.write(_file_header(self._meta, self._meta_size))
+        if self.write_csv:
+            self._csv = open(base + '.csv', 'w', encoding='utf-8', newline='')
+            self._csv.write(','.join(name for name, _ in LOG_FIELDS) + '\n')
+
+    # 寫完一塊或關檔時，把這個檔案期間丟掉的影像數寫回檔頭
+    def _update_dropped(self):
+        dropped = self.frames_dropped - self._dropped_before
+        if self._file is None or dropped == self._meta['frames_dropped']:
+            return
+        self._meta['frames_dropped'] = dropped
+        position = self._file.tell()
+        self._file.seek(0)
+        self._file.write(_file_header(self._meta, self._meta_size))
+        self._file.seek(position)
+        self._file.flush()
+
+    def _close_files(self):
+        if self._file is not None:
+            try:
+                self._update_dropped()
+            except OSError as e:
+                self.last_error = e
+            self._dropped_before += self._meta['frames_dropped']
+        for f in (self._file, self._csv):
+            if f is not None:
+                f.close()
+        self._file = self._csv = None
+
+    def _write_chunk(self, columns):
+        if self._rotate_due():
+            self._open_files()
+        rows = len(columns[0])
+        timestamps = columns[0]
+        parts = [CHUNK_HEADER.pack(CHUNK_MAGIC, rows, timestamps.min(), timestamps.max())]
+        for (name, dtype), column in zip(LOG_FIELDS, columns):
+            data = np.ascontiguousarray(column, dtype).tobytes()
+            parts.append(data + b'\x00' * (_padded(len(data)) - len(data)))
+        self._file.write(b''.join(parts))
+        self._file.flush()
+        self._update_dropped()
+        if self._csv is not None:
+            np.savetxt(self._csv, np.column_stack(columns), fmt=CSV_FORMATS, delimiter=',')
+            self._csv.flush()
+        self.rows_written += rows
+        self.chunks_written += 1
+
+
+# --- 讀取單一紀錄檔：回傳 {欄位名稱: 陣列}，只保留 start <= timestamp < end 的列 ---
+# 各欄位直接由 memmap 切出，區塊時間範圍不重疊查詢範圍時整塊略過；寫到一半的最後一塊會被忽略
+def read_log(path, start=None, end=None, fields=None):
+    data = np.memmap(path, np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, np.uint8)
+    if len(data) < len(FILE_MAGIC) + 4 or bytes(data[:len(FILE_MAGIC)]) != FILE_MAGIC:
+        raise ValueError(f'{path} 不是量測紀錄檔')
+    meta_size = struct.unpack_from('<I', data, len(FILE_MAGIC))[0]
+    meta_end = len(FILE_MAGIC) + 4 + meta_size
+    file_fields = [tuple(field) for field in json.loads(bytes(data[len(FILE_MAGIC) + 4:meta_end]))['fields']]
+    names = [name for name, _ in file_fields] if fields is None else list(fields)
+
+    pieces = {name: [] for name in names}
+    offset = _padded(meta_end)
+    while offset + CHUNK_HEADER.size <= len(data):
+        magic, rows, t_min, t_max = CHUNK_HEADER.unpack_from(data, offset)
+        layout, size = _chunk_layout(file_fields, rows)
+        if magic != CHUNK_MAGIC or offset + size > len(data):
+            break
+        if (start is None or t_max >= start) and (end is None or t_min < end):
+            columns = {name: data[offset + position:offset + position + rows * dtype.itemsize].view(dtype)
+                       for name, dtype, position in layout}
+            keep = None
+            if (start is not None and t_min < start) or (end is not None and t_max >= end):
+                timestamps = columns['timestamp']
+                keep = np.ones(rows, bool)
+                if start is not None:
+                    keep &= timestamps >= start
+                if end is not None:
+                    keep &= timestamps < end
+            for name in names:
+                pieces[name].append(columns[name] if keep is None else columns[name][keep])
+        offset += size
+    dtypes = dict(file_fields)
+    return {name: np.concatenate(pieces[name]) if pieces[name] else np.zeros(0, dtypes.get(name, np.float64))
+            for name in names}
+
+
+# 檔頭資訊：fields、created、frames_dropped（舊檔沒有 frames_dropped 時視為 0）
+def log_metadata(path):
+    with open(path, 'rb') as f:
+        head = f.read(len(FILE_MAGIC) + 4)
+        if len(head) < len(FILE_MAGIC) + 4 or head[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError(f'{path} 不是量測紀錄檔')
+        meta = json.loads(f.read(struct.unpack_from('<I', head, len(FILE_MAGIC))[0]))
+    meta.setdefault('frames_dropped', 0)
+    return meta
+
+
+def log_files(source, prefix=None):
+    if isinstance(source, (list, tuple)):
+        return list(source)
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, f'{prefix or ""}*{LOG_EXTENSION}')))
+    return sorted(glob.glob(source)) if glob.has_magic(source) else [source]
+
+
+# --- 讀取資料夾（或檔案清單）內所有紀錄檔並串接 ---
+def read_logs(source, start=None, end=None, fields=None, prefix=None):
+    names = [name for name, _ in LOG_FIELDS] if fields is None else list(fields)
+    parts = [read_log(path, start, end, names) for path in log_files(source, prefix)]
+    return {name: np.concatenate([part[name] for part in parts]) if parts else
+            np.zeros(0, dict(LOG_FIELDS).get(name, np.float64)) for name in names}
+
+
+def _parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='查詢量測紀錄檔')
+    parser.add_argument('source', help='紀錄資料夾、glob 或檔案')
+    parser.add_argument('--start', type=_parse_time, help='起始時間（ISO 格式或 epoch 秒）')
+    parser.add_argument('--end', type=_parse_time, help='結束時間（ISO 格式或 epoch 秒）')
+    parser.add_argument('--csv', help='把查詢結果輸出成 CSV')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        data = read_logs(args.source, args.start, args.end)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - started
+
+    rows = len(data['timestamp'])
+    print(f'{rows} 筆紀錄，讀取 {elapsed:.2f} 秒')
+    dropped = {path: log_metadata(path)['frames_dropped'] for path in log_files(args.source)}
+    if any(dropped.values()):
+        print(f'錯誤：紀錄期間丟棄 {sum(dropped.values())} 張影像的結果（寫入跟不上），資料有缺口：', file=sys.stderr)
+        for path, count in dropped.items():
+            if count:
+                print(f'  {path}: {count}', file=sys.stderr)
+    if rows:
+        first, last = data['timestamp'].min(), data['timestamp'].max()
+        print(f'時間：{datetime.fromtimestamp(first)} ~ {datetime.fromtimestamp(last)}，'
+              f'{len(np.unique(data["seq"]))} 張影像')
+        for name in ('width_mm', 'height_mm'):
+            column = data[name].astype(np.float64)
+            print(f'{name:<10} mean {column.mean():.4f}  std {column.std():.4f}  '
+                  f'min {column.min():.4f}  max {column.max():.4f}')
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8', newline='') as f:
+            f.write(','.join(name for name, _ in LOG_FIELDS) + '\n')
+            np.savetxt(f, np.column_stack([data[name] for name, _ in LOG_FIELDS]), fmt=CSV_FORMATS, delimiter=',')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# --- 畫面變化偵測（motion gating） ---
+# 把影像以 INTER_AREA 縮成小縮圖（區塊平均，同時壓掉感光雜訊）後，與上一次「實際處理」時的縮圖相減；
+# 沒有任何縮圖像素變化超過門檻時判定畫面沒變，沿用上一次的輪廓與量測結果，不跑前處理管線。
+# 參考縮圖只在實際處理時更新，緩慢的漂移累積到門檻後仍會觸發；另以 heartbeat 定期強制處理一次。
+#
+#     gate = MotionGate(heartbeat=2.0)
+#     if gate.should_process(frame):
+#         result = engine.measure(frame)
+import time
+
+import cv2
+
+DEFAULT_THUMBNAIL_WIDTH = 160
+DEFAULT_PIXEL_THRESHOLD = 12    # 縮圖灰階差超過此值視為該處有變化
+DEFAULT_MIN_CHANGED_PIXELS = 1  # 變化的縮圖像素達到此數量才處理
+DEFAULT_HEARTBEAT = 2.0         # 秒；畫面沒變時最長多久強制處理一次，0 表示不強制
+
+
+class MotionGate:
+    def __init__(self, pixel_threshold=DEFAULT_PIXEL_THRESHOLD, min_changed_pixels=DEFAULT_MIN_CHANGED_PIXELS,
+                 heartbeat=DEFAULT_HEARTBEAT, thumbnail_width=DEFAULT_THUMBNAIL_WIDTH):
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_pixels = min_changed_pixels
+        self.heartbeat = heartbeat
+        self.thumbnail_width = thumbnail_width
+        self.reset()
+
+    def reset(self):
+        self._reference = None
+        self._last_processed = 0.0
+        self.processed = 0
+        self.skipped = 0
+
+    # 先縮小再轉灰階，轉換只作用在縮圖上
+    def thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        size = (min(self.thumbnail_width, width), max(1, height * min(self.thumbnail_width, width) // width))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def changed(self, thumbnail):
+        if self._reference is None or self._reference.shape != thumbnail.shape:
+            return True
+        diff = cv2.absdiff(thumbnail, self._reference)
+        changed = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=diff)[1]
+        return cv2.countNonZero(changed) >= self.min_changed_pixels
+
+    # 回傳 True 表示這張需要完整處理（畫面有變化或 heartbeat 到期）
+    def should_process(self, frame, now=None):
+        now = time.monotonic() if now is None else now
+        thumbnail = self.thumbnail(frame)
+        due = self.heartbeat and now - self._last_processed >= self.heartbeat
+        if due or self.changed(thumbnail):
+            self._reference = thumbnail
+            self._last_processed = now
+            self.processed += 1
+            return True
+        self.skipped += 1
+        return False
@@ -1,27 +1,116 @@
-import wx
-import wx.grid as gridlib
-import cv2
-import numpy as np
-from scipy.spatial import distance as dist
-from scipy.spatial.distance import euclidean
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
+import argparse
+import os
 import threading
 import time
 
-DEFAULT_BINARY_THRESHOLD = 127
-DEFAULT_MIN_AREA = 50
-MAXIMUM_AREA = 500
+from startup import StartupTimer
 
-# --- 公用函式區 ---
-# OpenCV findContours 傳回格式處理函式
-# 處理不同版本的 findContours 回傳值結構
-def grab_contours(cnts):
-    if len(cnts) == 2:
-        return cnts[0]
-    elif len(cnts) == 3:
-        return cnts[1]
-    raise Exception("Contours tuple must have length 2 or 3.")
+STARTUP = StartupTimer()  # 啟動時間量測（--profile-startup），須在其他匯入之前建立
+
+# matplotlib（凍結畫面畫布）、autotune、tiling 與 process_worker 在第一次使用時才匯入，不拖慢啟動
+import wx
+import wx.grid as gridlib
+STARTUP.mark('import wx')
+import cv2
+import numpy as np
+STARTUP.mark('import cv2 / numpy')
+from calibration import (DEFAULT_CALIBRATION_PATH, DEFAULT_PATTERN, DEFAULT_SQUARE_MM, calibrate, load_calibration,
+                         load_images, save_calibration)
+from capture_pipeline import StagedCapturePipeline
+from frame_sources import open_source, open_source_async, parse_resolution
+from measure_engine import (MAXIMUM_AREA, MeasurementEngine, MeasurementResult, RegionOfInterest, StaticReuse,
+                            draw_text_lines, save_config)
+from incremental import IncrementalMeasurer
+from measurement_log import DEFAULT_ROTATE_BYTES, DEFAULT_ROTATE_SECONDS, MeasurementLog
+from motion_gate import DEFAULT_HEARTBEAT, MotionGate
+from profiles import DEFAULT_PROFILE_DIR, ProfileError, ProfileStore
+from profiling import ProfileExporter
+from spatial_index import ContourIndex
+from tracker import ObjectTracker
+from video_panel import VideoPanel
+STARTUP.mark('import modules')
+
+STREAM_WORKERS = 2  # 串流量測的 worker 執行緒數量
+DRAG_THRESHOLD = 3  # 拖曳距離（像素）小於此值視為單點點選
+GRID_REFRESH_INTERVAL = 0.25  # 串流時輪廓表格的更新間隔（秒）
+
+
+# --- 輪廓資訊虛擬表格 ---
+# 直接包住 MeasurementResult 的欄位陣列，只有畫面上看得到的儲存格才會被格式化；
+# 排序只保存一組列索引（argsort 結果），不複製任何資料
+# 串流追蹤時寬高顯示各物件的平滑平均值，並顯示物件 ID 與標準差
+# 精密模式時最後一欄改為旋轉外接矩形的像素尺寸與角度
+class ContourTable(gridlib.GridTableBase):
+    LABELS = ["ID", "Width (mm)", "Height (mm)", "Std W / H (mm)", "Area (pixels)",
+              "Bounding Rect Area", "Rect (W x H)"]
+
+    def __init__(self):
+        super().__init__()
+        self.result = MeasurementResult.empty()
+        self.order = None            # 排序後第 row 列對應的結果索引，None 表示原始順序
+        self.sort_column = None
+        self.sort_ascending = True
+
+    def GetNumberRows(self):
+        return len(self.result)
+
+    def GetNumberCols(self):
+        return len(self.LABELS)
+
+    def GetColLabelValue(self, col):
+        return self.LABELS[col]
+
+    def IsEmptyCell(self, row, col):
+        return False
+
+    def GetValue(self, row, col):
+        r = self.result
+        t = r.tracks
+        i = self.order[row] if self.order is not None else row
+        if col == 0:
+            return str(t['id'][i]) if t is not None else ""
+        if col == 1:
+            return f"{(t['width_mean'] if t is not None else r.width_mm)[i]:.1f}"
+        if col == 2:
+            return f"{(t['height_mean'] if t is not None else r.height_mm)[i]:.1f}"
+        if col == 3:
+            return f"{t['width_std'][i]:.2f} / {t['height_std'][i]:.2f}" if t is not None else ""
+        if col == 4:
+            return str(int(r.area[i]))
+        if col == 5:
+            return str(int(r.w[i]) * int(r.h[i]))
+        if r.precise is not None:
+            p = r.precise[i]
+            return f"{p['width_px']:.2f} x {p['height_px']:.2f} @ {p['angle']:.1f}°"
+        return f"{r.w[i]} x {r.h[i]}"
+
+    def SetValue(self, row, col, value):
+        pass  # 唯讀表格
+
+    # 各欄位的排序依據
+    def sort_keys(self, col):
+        r = self.result
+        t = r.tracks
+        if t is None:
+            return (r.indices, r.width_mm, r.height_mm, r.width_mm, r.area, r.rect_area, r.rect_area)[col]
+        return (t['id'], t['width_mean'], t['height_mean'], t['width_std'] + t['height_std'], r.area,
+                r.rect_area, r.rect_area)[col]
+
+    def set_result(self, result):
+        self.result = result
+        self._update_order()
+
+    def sort(self, col, ascending=True):
+        self.sort_column = col
+        self.sort_ascending = ascending
+        self._update_order()
+
+    def _update_order(self):
+        if self.sort_column is None or len(self.result) == 0:
+            self.order = None
+            return
+        order = np.argsort(self.sort_keys(self.sort_column), kind='stable')
+        self.order = order if self.sort_ascending else order[::-1]
 
 
 class ContourInfoPanel(wx.Panel):
@@ -29,12 +118,9 @@ class ContourInfoPanel(wx.Panel):
         super().__init__(parent)
 
         self.grid = gridlib.Grid(self)
-        self.grid.CreateGrid(0, 5)
-
-        self.labels = ["Width (mm)", "Height (mm)", "Area (pixels)",
-                       "Bounding Rect Area", "Rect (W x H)"]
-        for idx, label in enumerate(self.labels):
-            self.grid.SetColLabelValue(idx, label)
+        self.table = ContourTable()
+        self.grid.SetTable(self.table, takeOwnership=True)
+        self.grid.EnableEditing(False)
 
         self.grid.SetRowLabelSize(0)  # ✅ 隱藏 row label
         #self.grid.SetMargins(0, 0)  # ✅ 移除上下邊界
@@ -46,6 +132,7 @@ class ContourInfoPanel(wx.Panel):
 
         self.Bind(wx.EVT_SIZE, self.on_resize)
         self.grid.Bind(wx.EVT_SIZE, self.on_resize)
+        self.grid.Bind(gridlib.EVT_GRID_LABEL_LEFT_CLICK, self.on_label_click)
 
     def on_resize(self, event):
         size = self.grid.GetClientSize()
@@ -59,21 +146,34 @@ class ContourInfoPanel(wx.Panel):
         if event:
             event.Skip()
 
-    def update_contours(self, contours_info):
-        self.grid.ClearGrid()
-        if self.grid.GetNumberRows() > 0:
-            self.grid.DeleteRows(0, self.grid.GetNumberRows())
-
-        self.grid.AppendRows(len(contours_info))
-        for row, contour in enumerate(contours_info):
-            self.grid.SetCellValue(row, 0, f"{contour['width_mm']:.1f}")
-            self.grid.SetCellValue(row, 1, f"{contour['height_mm']:.1f}")
-            self.grid.SetCellValue(row, 2, str(contour['area']))
-            self.grid.SetCellValue(row, 3, str(contour['bounding_rect_area']))
-            self.grid.SetCellValue(row, 4, str(contour['bounding_rect_size']))
+    # --- 點擊欄位標題排序（再點一次反向） ---
+    def on_label_click(self, event):
+        col = event.GetCol()
+        if event.GetRow() != -1 or col < 0:
+            event.Skip()
+            return
+        ascending = not (self.table.sort_column == col and self.table.sort_ascending)
+        self.table.sort(col, ascending)
+        self.grid.SetSortingColumn(col, ascending)
+        self.grid.ForceRefresh()
 
-        self.Layout()
-        self.on_resize(None)  # 手動觸發調整欄寬
+    # result 為 MeasurementResult；列數變動以一次表格訊息通知 grid，儲存格於繪製時才格式化
+    def update_contours(self, result):
+        old_rows = self.table.GetNumberRows()
+        self.table.set_result(result)
+        new_rows = self.table.GetNumberRows()
+
+        self.grid.BeginBatch()
+        if new_rows < old_rows:
+            msg = gridlib.GridTableMessage(self.table, gridlib.GRIDTABLE_NOTIFY_ROWS_DELETED,
+                                           new_rows, old_rows - new_rows)
+            self.grid.ProcessTableMessage(msg)
+        elif new_rows > old_rows:
+            msg = gridlib.GridTableMessage(self.table, gridlib.GRIDTABLE_NOTIFY_ROWS_APPENDED,
+                                           new_rows - old_rows)
+            self.grid.ProcessTableMessage(msg)
+        self.grid.EndBatch()
+        self.grid.ForceRefresh()
 
 # --- 加入前處理步驟的 Dialog ---
 class AddStepDialog(wx.Dialog):
@@ -165,14 +265,27 @@ class MyFrame(wx.Frame):
         super(MyFrame, self).__init__(parent, title=title, size=(1920, 1080))
 
         # 初始化相關變數
-        self.pixel_to_mm_ratio = None  # 畫素與毫米的換算比例
+        self.engine = MeasurementEngine()  # 量測引擎（前處理、輪廓與換算比例皆由此處理）
+        self.engine.static_reuse = StaticReuse()  # 串流時靜止物件沿用上一張的精密量測 / 校正
+        self.profiler = self.engine.profiler  # 各階段耗時統計（預設停用）
+        self.show_stats = False       # 是否在串流畫面疊加統計資訊
+        self.stats_exporter = None    # 統計資訊輸出到檔案
         self.selected_contour = None   # 使用者選擇的輪廓
         self.image = None              # 原始影像
-        self.capture = None           # 攝影機物件
+        self.capture = None           # 影像來源（frame_sources），第一次使用時開啟，各模式共用
+        self.source_spec = '0'        # 影像來源：攝影機編號、錄影檔 / 資料夾或 synthetic
+        self.source_options = {}      # 解析度、fps、FOURCC 等開啟選項（open_source 的參數）
+        self.pending_capture = None   # 背景開啟中的來源（open_source_async 的 Future）
+        self.profile_startup = False  # 第一張量測結果出來時輸出啟動時間報表
         self.streaming = False        # 是否正在串流中
-        self.stream_thread = None     # 串流執行緒
-        self.binary_threshold = DEFAULT_BINARY_THRESHOLD
-        self.min_area = DEFAULT_MIN_AREA
+        self.stream_pipeline = None   # 串流管線（擷取 / 量測 / 顯示執行緒）
+        self.process_engine = None    # 串流量測改在獨立行程執行（process_worker.ProcessEngine）；None 表示在執行緒執行
+        self.tracker = ObjectTracker()  # 串流時跨影格追蹤物件、平滑尺寸並計數
+        self.motion_gate = MotionGate()  # 畫面沒變化時略過量測；None 表示每張都處理
+        self._grid_seq = None         # 串流時輪廓表格目前顯示的影格序號
+        self.calibration_path = DEFAULT_CALIBRATION_PATH  # 校正結果存檔位置，啟動時自動載入
+        self.profiles = None          # 依產品代碼保存的設定檔（ProfileStore），啟動時載入
+        self.measurement_log = None   # 串流量測結果的紀錄檔（MeasurementLog），None 表示不記錄
 
         # 建立 GUI 主面板與排版容器
         self.panel = wx.Panel(self)
@@ -198,6 +311,11 @@ class MyFrame(wx.Frame):
         self.set_ref_button.Bind(wx.EVT_BUTTON, self.on_set_reference_width)
         hbox_buttons.Add(self.set_ref_button, flag=wx.EXPAND | wx.ALL, border=10)
 
+        # 相機校正按鈕：以棋盤格影像修正鏡頭畸變與透視（取代單一換算比例）
+        self.calibrate_button = wx.Button(self.panel, label='Calibrate Camera')
+        self.calibrate_button.Bind(wx.EVT_BUTTON, self.on_calibrate)
+        hbox_buttons.Add(self.calibrate_button, flag=wx.EXPAND | wx.ALL, border=10)
+
         # 套用前處理與尺寸標記按鈕
         self.process_mm_button = wx.Button(self.panel, label='Apply Processing with Size Info')
         self.process_mm_button.Bind(wx.EVT_BUTTON, self.on_apply_processing_mm)
@@ -208,35 +326,77 @@ class MyFrame(wx.Frame):
         self.live_measure_button.Bind(wx.EVT_BUTTON, self.on_live_measurement)
         hbox_buttons.Add(self.live_measure_button, flag=wx.EXPAND | wx.ALL, border=10)
 
+        # 儲存量測設定按鈕（供 batch_measure.py 離線批次量測使用）
+        self.save_config_button = wx.Button(self.panel, label='Save Config')
+        self.save_config_button.Bind(wx.EVT_BUTTON, self.on_save_config)
+        hbox_buttons.Add(self.save_config_button, flag=wx.EXPAND | wx.ALL, border=10)
+
         control_panel.Add(hbox_buttons, flag=wx.EXPAND | wx.ALL, border=10)
 
+        # --- ROI 設定列：開啟後在凍結畫面上拖曳即新增 ROI（套用當下的步驟與參數） ---
+        hbox_roi = wx.BoxSizer(wx.HORIZONTAL)
+        self.roi_mode_button = wx.ToggleButton(self.panel, label='Draw ROI')
+        hbox_roi.Add(self.roi_mode_button, flag=wx.EXPAND | wx.ALL, border=10)
+
+        self.clear_roi_button = wx.Button(self.panel, label='Clear ROIs')
+        self.clear_roi_button.Bind(wx.EVT_BUTTON, self.on_clear_rois)
+        hbox_roi.Add(self.clear_roi_button, flag=wx.EXPAND | wx.ALL, border=10)
+
+        # 自動調參：在凍結畫面上掃描閾值與 kernel 組合，套用誤差最小的設定
+        self.auto_tune_button = wx.Button(self.panel, label='Auto Tune')
+        self.auto_tune_button.Bind(wx.EVT_BUTTON, self.on_auto_tune)
+        hbox_roi.Add(self.auto_tune_button, flag=wx.EXPAND | wx.ALL, border=10)
+
+        # 各階段耗時統計：勾選後啟用 profiler 並在串流畫面疊加 fps 與 p50/p95/p99
+        self.stats_checkbox = wx.CheckBox(self.panel, label='Show Stats')
+        self.stats_checkbox.Bind(wx.EVT_CHECKBOX, self.on_toggle_stats)
+        hbox_roi.Add(self.stats_checkbox, flag=wx.ALIGN_CENTER_VERTICAL | wx.ALL, border=10)
+
+        # 精密模式：次像素邊緣 + 旋轉外接矩形，傾斜擺放的零件也能量到真實寬高
+        self.precision_checkbox = wx.CheckBox(self.panel, label='Precision')
+        self.precision_checkbox.SetValue(self.engine.precision)
+        self.precision_checkbox.Bind(wx.EVT_CHECKBOX, self.on_toggle_precision)
+        hbox_roi.Add(self.precision_checkbox, flag=wx.ALIGN_CENTER_VERTICAL | wx.ALL, border=10)
+
+        control_panel.Add(hbox_roi, flag=wx.EXPAND | wx.ALL, border=10)
+
+        # --- 產品設定檔列：選擇或輸入（可用條碼槍）產品代碼後按 Enter 即換線，串流不中斷 ---
+        hbox_profile = wx.BoxSizer(wx.HORIZONTAL)
+        hbox_profile.Add(wx.StaticText(self.panel, label='Product:'), flag=wx.ALIGN_CENTER_VERTICAL | wx.ALL, border=10)
+        self.product_combo = wx.ComboBox(self.panel, style=wx.TE_PROCESS_ENTER)
+        self.product_combo.Bind(wx.EVT_COMBOBOX, self.on_select_product)
+        self.product_combo.Bind(wx.EVT_TEXT_ENTER, self.on_select_product)
+        hbox_profile.Add(self.product_combo, proportion=1, flag=wx.EXPAND | wx.ALL, border=10)
+
+        self.save_profile_button = wx.Button(self.panel, label='Save Profile')
+        self.save_profile_button.Bind(wx.EVT_BUTTON, self.on_save_profile)
+        hbox_profile.Add(self.save_profile_button, flag=wx.EXPAND | wx.ALL, border=10)
+
+        control_panel.Add(hbox_profile, flag=wx.EXPAND | wx.ALL, border=10)
+
         # --- 建立參數滑桿列 ---
         hbox_sliders = wx.BoxSizer(wx.HORIZONTAL)
 
         # 二值化閾值滑桿
-        self.binary_label = wx.StaticText(self.panel, label='Binary Threshold: 127')
+        self.binary_label = wx.StaticText(self.panel, label=f'Binary Threshold: {self.engine.binary_threshold}')
         hbox_sliders.Add(self.binary_label, flag=wx.LEFT | wx.RIGHT, border=8)
-        self.binary_slider = wx.Slider(self.panel, value=127, minValue=0, maxValue=255, style=wx.SL_HORIZONTAL)
+        self.binary_slider = wx.Slider(self.panel, value=self.engine.binary_threshold, minValue=0, maxValue=255, style=wx.SL_HORIZONTAL)
         self.binary_slider.Bind(wx.EVT_SLIDER, self.on_slider_update)
         hbox_sliders.Add(self.binary_slider, proportion=1)
 
         # 最小輪廓面積滑桿
-        self.area_label = wx.StaticText(self.panel, label=f'Minimum Area: {self.min_area}')
+        self.area_label = wx.StaticText(self.panel, label=f'Minimum Area: {self.engine.min_area}')
         hbox_sliders.Add(self.area_label, flag=wx.LEFT | wx.RIGHT, border=8)
-        self.area_slider = wx.Slider(self.panel, value=self.min_area, minValue=0, maxValue=MAXIMUM_AREA, style=wx.SL_HORIZONTAL)
+        self.area_slider = wx.Slider(self.panel, value=self.engine.min_area, minValue=0, maxValue=MAXIMUM_AREA, style=wx.SL_HORIZONTAL)
         self.area_slider.Bind(wx.EVT_SLIDER, self.on_slider_update)
         hbox_sliders.Add(self.area_slider, proportion=1)
 
         control_panel.Add(hbox_sliders, flag=wx.EXPAND | wx.ALL, border=10)
 
         # --- 建立前處理步驟與操作 ---
-        self.preprocess_steps = ['Gray Conversion', 'Gaussian Blur', 'Binary Threshold', 'Morphological Operations', 'Canny Edge Detection']
-        self.preprocess_parameters = {
-            'Gaussian Blur': {'Kernel Size': '5'},
-            'Binary Threshold': {'Threshold': str(DEFAULT_BINARY_THRESHOLD)},
-            'Morphological Operations': {'Kernel Size': '5'},
-            'Canny Edge Detection': {'Threshold': '50'}
-        }
+        # GUI 編輯中的步驟與參數（與引擎不共用，修改後以 publish_engine 發佈新的設定快照）
+        self.preprocess_steps = list(self.engine.preprocess_steps)
+        self.preprocess_parameters = {step: dict(params) for step, params in self.engine.preprocess_parameters.items()}
 
         # 步驟清單顯示元件
         self.preprocess_listbox = wx.ListBox(self.panel, choices=self.get_preprocess_display(), style=wx.LB_SINGLE)
@@ -274,41 +434,69 @@ class MyFrame(wx.Frame):
         # 將控制面板加入主橫向排版中（左側）
         vbox.Add(control_panel, flag=wx.EXPAND | wx.ALL, border=10)
 
-        # --- 建立圖像顯示畫布（右側） ---
-        self.figure = Figure()
-        self.canvas = FigureCanvas(self.panel, -1, self.figure)
-        vbox.Add(self.canvas, 1, flag=wx.EXPAND | wx.ALL, border=10)
+        # --- 圖像顯示區（右側） ---
+        # 凍結畫面用的 matplotlib 畫布在第一次顯示影像時才建立（ensure_canvas），啟動時先顯示串流面板
+        self.figure = None
+        self.canvas = None
 
-        # 讓使用者可透過滑鼠點擊畫布來選擇輪廓
-        self.canvas.mpl_connect('button_press_event', self.on_canvas_click)
+        # 串流模式專用的影像面板（直接更新 bitmap，不經 matplotlib 重繪）
+        self.video_panel = VideoPanel(self.panel)
+        vbox.Add(self.video_panel, 1, flag=wx.EXPAND | wx.ALL, border=10)
+        self.video_panel.profiler = self.profiler
+        self.main_sizer = vbox
+
+        self._drag_start = None   # 拖曳起點（影像座標）
+        self._lasso_path = None   # 套索選取的路徑點
 
         self.panel.SetSizer(vbox)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+
+        # 狀態列只顯示需要處理的錯誤（例如量測紀錄丟失資料），平常為空白
+        self.status_bar = self.CreateStatusBar()
+        self.status_bar.SetForegroundColour(wx.RED)
+
+        # 串流時由 GUI 執行緒定期從擷取管線的最新結果槽取出結果更新表格
+        self.stream_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_stream_timer, self.stream_timer)
 
         # --- 記錄凍結畫面與輪廓列表 ---
         self.freeze_contours = []
         self.frozen_frame = None
+        self.contour_index = None   # 凍結輪廓的空間索引（點選 / 框選用）
+        self.incremental = IncrementalMeasurer(self.engine)  # 凍結畫面的逐步快取
+        self.image_artist = None    # 畫布上目前顯示的 AxesImage
+        self.selected_indices = []  # 目前選取的輪廓索引
 
-    def update_contour_info(self, contours):
-        # 取得每個 contour 的資訊
-        contours_info = []
-        for contour in contours:
-            if cv2.contourArea(contour) < self.min_area:
-                continue
-            x, y, w, h = cv2.boundingRect(contour)
-            area = cv2.contourArea(contour)
-            rect_area = w * h
-            width_mm = w * self.pixel_to_mm_ratio if self.pixel_to_mm_ratio else w
-            height_mm = h * self.pixel_to_mm_ratio if self.pixel_to_mm_ratio else h
-            contours_info.append({
-                'width_mm': width_mm,
-                'height_mm': height_mm,
-                'area': int(area),
-                'bounding_rect_area': int(rect_area),
-                'bounding_rect_size': f'{w} x {h}'
-            })
-
+    def update_contour_info(self, result):
         # 更新面板內容
-        self.contour_info_panel.update_contours(contours_info)
+        self.contour_info_panel.update_contours(result)
+
+    # --- 串流中定期更新表格（GUI 執行緒）：讀取最新結果槽，不等待也不鎖住串流執行緒 ---
+    def on_stream_timer(self, event):
+        self.update_log_status()
+        pipeline = self.stream_pipeline
+        latest = pipeline.latest.get() if self.streaming and pipeline else None
+        if latest is None or latest[0] == self._grid_seq:
+            return
+        self._grid_seq = latest[0]
+        self.update_contour_info(latest[2])
+
+    # 量測紀錄寫入失敗或跟不上而丟掉影像時，紀錄檔有缺口：顯示在狀態列直到停止記錄
+    def update_log_status(self):
+        log = self.measurement_log
+        message = ''
+        if log is not None and log.last_error is not None:
+            message = f'錯誤：量測紀錄寫入失敗（{log.last_error}）'
+        elif log is not None and log.frames_dropped:
+            message = f'錯誤：量測紀錄寫入跟不上，已丟棄 {log.frames_dropped} 張影像的結果（{log.directory}）'
+        if message != self.status_bar.GetStatusText():
+            self.status_bar.SetStatusText(message)
+
+    # 串流中為最新一張已量測的影像，否則為凍結 / 最後一張影像
+    def current_frame(self):
+        pipeline = self.stream_pipeline
+        latest = pipeline.latest.get() if self.streaming and pipeline else None
+        return latest[1] if latest is not None else self.image
 
     def get_preprocess_display(self):
         return [f'{step} ({", ".join([f"{k}: {v}" for k, v in self.preprocess_parameters.get(step, {}).items()])})'
@@ -320,46 +508,147 @@ class MyFrame(wx.Frame):
             wx.MessageBox('請先停止其他串流功能（例如 Live Measurement）', '錯誤', wx.OK | wx.ICON_ERROR)
             return
 
-        self.capture = cv2.VideoCapture(0)
-        if not self.capture.isOpened():
-            wx.MessageBox('無法開啟攝影機', '錯誤', wx.OK | wx.ICON_ERROR)
+        if not self.open_capture():
             return
 
+        self.start_stream(in_mm=False)
+
+    # --- 取得影像來源：第一次使用時開啟，之後 Start Webcam、Live Measurement 與凍結畫面共用同一個裝置 ---
+    def open_capture(self):
+        if self.capture is not None and self.capture.isOpened():
+            return True
+        try:
+            if self.pending_capture is not None:
+                pending, self.pending_capture = self.pending_capture, None
+                with wx.BusyCursor():
+                    self.capture = pending.result()
+            else:
+                self.capture = open_source(self.source_spec, **self.source_options)
+        except ValueError as e:
+            wx.MessageBox(str(e), '錯誤', wx.OK | wx.ICON_ERROR)
+            return False
+        if not self.capture.isOpened():
+            wx.MessageBox(f'無法開啟影像來源 {self.source_spec}', '錯誤', wx.OK | wx.ICON_ERROR)
+            return False
+        return True
+
+    # pending 為已在背景開啟同一個來源的 Future（啟動時與建立視窗同時進行），第一次使用時才等待結果
+    def set_source(self, spec, pending=None, **options):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+        if self.pending_capture is not None:  # 尚未使用的背景開啟結果，開好後直接釋放
+            self.pending_capture.add_done_callback(lambda f: f.exception() is None and f.result().release())
+        self.pending_capture = pending
+        self.source_spec = spec
+        self.source_options = options
+
+    # --- 啟動多階段串流管線：擷取、量測 worker 與顯示各自在不同執行緒 ---
+    def start_stream(self, in_mm):
+        self.check_calibration_size()
         self.streaming = True
+        self.incremental.clear()
+        self.tracker.reset()
+        if self.motion_gate:
+            self.motion_gate.reset()
+        self.set_video_mode(True)
+
+        # 依影格順序追蹤物件（每張都會執行，不受顯示丟張影響）
+        def on_result(seq, frame, result):
+            self.tracker.update(result)
+            if self.profile_startup and not STARTUP.finished:
+                report = STARTUP.finish('first measured frame')
+                if report:
+                    print(report)
+
+        # 顯示執行緒只畫疊加資訊並交給 VideoPanel；表格由 GUI 執行緒的 stream_timer 更新
+        def on_display(seq, frame, result):
+            display = self.engine.render_rgb(frame, result, in_mm)
+            lines = [f'Count: {self.tracker.count}']
+            if self.measurement_log:
+                lines.append(f'Logged: {self.measurement_log.rows_written} (dropped {self.measurement_log.frames_dropped})')
+            if self.show_stats:
+                lines += self.profiler.overlay_lines()
+                if self.process_engine:
+                    lines.append(self.process_engine.describe())
+            draw_text_lines(display, lines)
+            self.video_panel.submit_frame(display)  # 交給 GUI 執行緒繪製，不等待
+
+        on_log = self.measurement_log.append if self.measurement_log else None  # 只放進佇列，不會阻塞 worker
+        workers = self.process_engine.processes if self.process_engine else STREAM_WORKERS
+        frame_pool = self.process_engine.frames if self.process_engine else None  # 影像直接讀進共享記憶體
+        self.stream_pipeline = StagedCapturePipeline(self.capture, self.measure_frame, on_display=on_display,
+                                                     workers=workers, profiler=self.profiler,
+                                                     on_result=on_result, gate=self.motion_gate, on_log=on_log,
+                                                     frame_pool=frame_pool)
+        self.stream_pipeline.start()
+        self._grid_seq = None
+        self.stream_timer.Start(int(GRID_REFRESH_INTERVAL * 1000))
+
+    # 每張影像只讀取一次 self.engine（不可變的設定快照），GUI 發佈新快照後下一張影像才改用新設定
+    # 使用獨立行程時，快照的設定只在改變後傳送一次
+    def measure_frame(self, frame):
+        engine = self.engine
+        if self.process_engine is not None:
+            return self.process_engine.measure(frame, engine)
+        return engine.measure(frame)
+
+    # --- 切換統計資訊顯示 ---
+    def on_toggle_stats(self, event):
+        self.show_stats = self.stats_checkbox.GetValue()
+        if self.show_stats:
+            self.profiler.reset()
+        # 有輸出檔案時 profiler 保持啟用
+        self.profiler.enabled = self.show_stats or self.stats_exporter is not None
+
+    # --- 切換精密量測模式 ---
+    def on_toggle_precision(self, event):
+        self.publish_engine(precision=self.precision_checkbox.GetValue())
+        self.refresh_frozen()
+
+    # --- 定期把統計資訊寫到檔案（jsonl 或 prometheus） ---
+    def start_stats_export(self, path, fmt='jsonl'):
+        self.profiler.enabled = True
+        self.stats_exporter = ProfileExporter(self.profiler, path, fmt)
+        self.stats_exporter.start()
+
+    # --- 把每張影像的量測結果寫入紀錄檔（背景執行緒批次寫入） ---
+    def start_measurement_log(self, directory, write_csv=False, rotate_bytes=DEFAULT_ROTATE_BYTES,
+                              rotate_seconds=DEFAULT_ROTATE_SECONDS):
+        self.measurement_log = MeasurementLog(directory, rotate_bytes=rotate_bytes, rotate_seconds=rotate_seconds,
+                                              write_csv=write_csv)
+        self.measurement_log.start()
+
+    def on_close(self, event):
+        self.stop_webcam()
+        if self.stats_exporter:
+            self.stats_exporter.stop()
+        if self.measurement_log:
+            self.measurement_log.stop()
+        if self.process_engine:
+            self.process_engine.close()
+        if self.capture:
+            self.capture.release()
+        if self.profile_startup and not STARTUP.finished:
+            print(STARTUP.finish('close (no frame measured)'))
+        event.Skip()
+
+    # --- 啟動後直接開始串流（--autostart）：已有換算比例或校正時進入 Live Measurement ---
+    def autostart(self):
+        if self.engine.has_scale:
+            self.on_live_measurement(None)
+        else:
+            self.on_start_webcam(None)
 
-        def webcam_loop():
-            while self.streaming:
-                ret, frame = self.capture.read()
-                if not ret:
-                    continue
-                self.image = frame
-                processed = self.preprocess_image(frame)[-1]  # 執行前處理，取最後結果
-                contours, _ = cv2.findContours(processed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                display = frame.copy()
-                for contour in contours:
-                    if cv2.contourArea(contour) < self.min_area:
-                        continue
-                    x, y, w, h = cv2.boundingRect(contour)
-                    cv2.rectangle(display, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(display, f"{w} x {h} px", (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                                (255, 0, 0), 1)
-                self.figure.clear()
-                ax = self.figure.add_subplot(111)
-                ax.imshow(cv2.cvtColor(display, cv2.COLOR_BGR2RGB))
-                ax.axis('off')
-                self.canvas.draw()
-                time.sleep(0.03)
-
-        self.stream_thread = threading.Thread(target=webcam_loop, daemon=True)
-        self.stream_thread.start()
-
-    # --- 停止攝影機串流 ---
+    # --- 停止攝影機串流（影像來源保持開啟，關閉視窗時才釋放） ---
 
     def stop_webcam(self, event=None):
         if self.streaming:
+            self.image = self.current_frame()  # 保留最後一張已量測的影像
             self.streaming = False
-            if self.capture:
-                self.capture.release()
+            self.stream_timer.Stop()
+            if self.stream_pipeline:
+                self.stream_pipeline.stop()
 
     # --- 凍結攝影機畫面並擷取輪廓 ---
 
@@ -368,9 +657,10 @@ class MyFrame(wx.Frame):
             wx.MessageBox('尚未啟動攝影機', '錯誤', wx.OK | wx.ICON_ERROR)
             return
 
-        self.streaming = False  # 停止 webcam thread
-        if self.stream_thread and self.stream_thread.is_alive():
-            self.stream_thread.join(timeout=1.0)
+        self.streaming = False  # 停止串流管線
+        self.stream_timer.Stop()
+        if self.stream_pipeline:
+            self.stream_pipeline.stop()
 
         ret, frame = self.capture.read()
         if not ret:
@@ -378,60 +668,140 @@ class MyFrame(wx.Frame):
             return
 
         self.image = frame.copy()
-        processed = self.preprocess_image(frame)[-1]  # 前處理圖像
-        contours, _ = cv2.findContours(processed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        for contour in contours:
-            if cv2.contourArea(contour) < self.min_area:
-                continue
-            x, y, w, h = cv2.boundingRect(contour)
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            cv2.putText(frame, f"{w} x {h} px", (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
-
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-        ax.imshow(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        ax.axis('off')
-        self.canvas.draw()
-
-        # 保存凍結畫面與輪廓
-        self.freeze_contours = contours
-        self.frozen_frame = frame.copy()
+        self.incremental.set_frame(self.image)
+        self.refresh_frozen()
 
-        self.update_contour_info(contours)
+    # --- 以增量方式重新量測凍結畫面（滑桿或步驟變更時只重算受影響的部分） ---
+    def refresh_frozen(self):
+        if self.streaming or self.incremental.frame is None:
+            return
+        result = self.incremental.measure()  # 前處理並擷取輪廓
+        frame = self.engine.annotate(self.image, result, in_mm=False)
+        self.show_full_image(frame)
+
+        # 保存凍結畫面與輪廓；輪廓沒變時（只改 min_area）沿用原本的空間索引與選取
+        if self.incremental.contours_changed:
+            self.freeze_contours = result.contours
+            self.contour_index = ContourIndex(result.contours)
+            self.selected_indices = []
+            self.selected_contour = None
+        self.frozen_frame = frame
+
+        self.update_contour_info(result)
+
+    # --- 滑鼠操作：單點選取、拖曳框選、按住 Ctrl 拖曳為套索選取 ---
+    def on_canvas_press(self, event):
+        if event.xdata is None or event.ydata is None or self.contour_index is None:
+            return
+        if self.roi_mode_button.GetValue():
+            self._drag_start = (event.xdata, event.ydata)
+            self._lasso_path = None
+            return
+        self._drag_start = (event.xdata, event.ydata)
+        self._lasso_path = [(event.xdata, event.ydata)] if event.key == 'control' else None
 
+    def on_canvas_motion(self, event):
+        if self._lasso_path is not None and event.xdata is not None and event.ydata is not None:
+            self._lasso_path.append((event.xdata, event.ydata))
 
+    def on_canvas_release(self, event):
+        start, lasso = self._drag_start, self._lasso_path
+        self._drag_start = self._lasso_path = None
+        if start is None:
+            return
+        if event.xdata is None or event.ydata is None:
+            end = start
+        else:
+            end = (event.xdata, event.ydata)
+        if abs(end[0] - start[0]) < DRAG_THRESHOLD and abs(end[1] - start[1]) < DRAG_THRESHOLD:
+            if not self.roi_mode_button.GetValue():
+                self.on_canvas_click(event)
+        elif self.roi_mode_button.GetValue():
+            self.add_roi(start, end)
+        elif lasso is not None:
+            self.select_contours(self.contour_index.query_lasso(lasso))
+        else:
+            self.select_contours(self.contour_index.query_rect(start[0], start[1], end[0], end[1]))
 
     def on_canvas_click(self, event):
-        if event.xdata is None or event.ydata is None or not hasattr(self, 'freeze_contours'):
+        if event.xdata is None or event.ydata is None or self.contour_index is None:
             return
 
-        click_x, click_y = int(event.xdata), int(event.ydata)
-        self.selected_contour = None
-
-        # 找出包含點擊座標的輪廓（以 bounding box 判斷）
-        for contour in self.freeze_contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            if x <= click_x <= x + w and y <= click_y <= y + h:
-                self.selected_contour = contour
-                break
-
-        # 若有選中，畫紅框標示
-        if self.selected_contour is not None:
+        # 由空間索引找出包含點擊座標的最小輪廓
+        hit = self.contour_index.hit_test(int(event.xdata), int(event.ydata))
+        self.select_contours([] if hit is None else [hit])
+
+    # --- 新增 ROI：複製目前的前處理步驟與參數，之後調整不會影響已建立的 ROI ---
+    def add_roi(self, start, end):
+        x0, x1 = sorted((int(start[0]), int(end[0])))
+        y0, y1 = sorted((int(start[1]), int(end[1])))
+        config = self.engine.to_config()
+        config.pop('rois')
+        roi = RegionOfInterest(x0, y0, x1 - x0 + 1, y1 - y0 + 1, name=f'ROI {len(self.engine.rois) + 1}',
+                               engine=MeasurementEngine.from_config(config))
+        self.publish_engine(rois=self.engine.rois + [roi])
+        self.refresh_frozen()
+
+    def on_clear_rois(self, event):
+        self.publish_engine(rois=[])
+        self.refresh_frozen()
+
+    # --- 記錄選取的輪廓並以紅框標示（第一個作為參考寬度的輪廓） ---
+    def select_contours(self, indices):
+        self.selected_indices = [int(i) for i in indices]
+        self.selected_contour = self.freeze_contours[self.selected_indices[0]] if self.selected_indices else None
+
+        if self.selected_indices:
             selected_image = self.frozen_frame.copy()
-            x, y, w, h = cv2.boundingRect(self.selected_contour)
-            cv2.rectangle(selected_image, (x, y), (x + w, y + h), (0, 0, 255), 3)
+            index = self.contour_index
+            for i in self.selected_indices:
+                x, y, w, h = int(index.x[i]), int(index.y[i]), int(index.w[i]), int(index.h[i])
+                cv2.rectangle(selected_image, (x, y), (x + w, y + h), (0, 0, 255), 3)
             self.show_full_image(selected_image)
 
         # --- 顯示單張圖像在畫布上 ---
 
+    # 影像大小不變時只更新既有的 AxesImage，不重建圖表
     def show_full_image(self, image):
+        self.set_video_mode(False)
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if self.image_artist is not None and self.image_artist.get_array().shape == rgb.shape:
+            self.image_artist.set_data(rgb)
+            self.canvas.draw_idle()
+            return
         self.figure.clear()
         ax = self.figure.add_subplot(111)
-        ax.imshow(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        self.image_artist = ax.imshow(rgb)
         ax.axis('off')
         self.canvas.draw()
 
+    # --- 建立 matplotlib 畫布（第一次顯示凍結畫面時） ---
+    def ensure_canvas(self):
+        if self.canvas is not None:
+            return self.canvas
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
+        self.figure = Figure()
+        self.canvas = FigureCanvas(self.panel, -1, self.figure)
+        self.canvas.Hide()
+        self.main_sizer.Insert(self.main_sizer.GetItemCount() - 1, self.canvas, 1, flag=wx.EXPAND | wx.ALL, border=10)
+
+        # 讓使用者可透過滑鼠點擊畫布來選擇輪廓
+        self.canvas.mpl_connect('button_press_event', self.on_canvas_press)
+        self.canvas.mpl_connect('motion_notify_event', self.on_canvas_motion)
+        self.canvas.mpl_connect('button_release_event', self.on_canvas_release)
+        return self.canvas
+
+    # --- 切換串流顯示面板與 matplotlib 畫布（僅在 GUI 執行緒呼叫） ---
+    def set_video_mode(self, enabled):
+        if not enabled:
+            self.ensure_canvas()
+        if self.video_panel.IsShown() == enabled:
+            return
+        self.video_panel.Show(enabled)
+        self.canvas.Show(not enabled)
+        self.main_sizer.Layout()
+
     # --- 設定像素與毫米的換算比例 ---
     def on_set_reference_width(self, event):
         if self.selected_contour is None:
@@ -443,113 +813,273 @@ class MyFrame(wx.Frame):
         if dlg.ShowModal() == wx.ID_OK:
             try:
                 real_width_mm = float(dlg.GetValue())
-                self.pixel_to_mm_ratio = real_width_mm / w
-                wx.MessageBox(f'設定成功：1 px = {self.pixel_to_mm_ratio:.3f} mm', '成功',
+                self.publish_engine(pixel_to_mm_ratio=real_width_mm / w)
+                wx.MessageBox(f'設定成功：1 px = {self.engine.pixel_to_mm_ratio:.3f} mm', '成功',
                               wx.OK | wx.ICON_INFORMATION)
             except:
                 wx.MessageBox('輸入格式錯誤，請輸入數字', '錯誤', wx.OK | wx.ICON_ERROR)
         dlg.Destroy()
 
+    # --- 相機校正：選擇校正板影像資料夾，目前凍結的畫面作為量測平面 ---
+    def on_calibrate(self, event):
+        with wx.DirDialog(self, '選擇校正板影像資料夾') as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            folder = dlg.GetPath()
+
+        default = f'{DEFAULT_PATTERN[0]} {DEFAULT_PATTERN[1]} {DEFAULT_SQUARE_MM:g}'
+        dlg = wx.TextEntryDialog(self, '請輸入校正板內角點數與間距：欄 列 間距(mm)\n'
+                                 '（凍結畫面中平放在量測平面上的校正板作為量測平面；未凍結時使用第一張影像）',
+                                 '相機校正', default)
+        if dlg.ShowModal() != wx.ID_OK:
+            dlg.Destroy()
+            return
+        try:
+            cols, rows, square_mm = dlg.GetValue().split()
+            pattern, square_mm = (int(cols), int(rows)), float(square_mm)
+        except ValueError:
+            wx.MessageBox('輸入格式錯誤，請輸入「欄 列 間距」', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+        finally:
+            dlg.Destroy()
+
+        try:
+            with wx.BusyCursor():
+                calibration = calibrate(load_images([folder]), pattern, square_mm, self.current_frame())
+            save_calibration(calibration, self.calibration_path)
+        except (ValueError, OSError) as e:
+            wx.MessageBox(f'校正失敗：{e}', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+
+        self.publish_engine(calibration=calibration)
+        if calibration.rms is not None:
+            rms = f'重投影誤差 RMS = {calibration.rms:.3f} px\n'
+        else:
+            rms = '（校正板影像不足，只修正透視）\n'
+        wx.MessageBox(f'校正完成：{rms}畫面中心 1 px = {calibration.mm_per_pixel():.4f} mm\n'
+                      f'已儲存至 {self.calibration_path}', '成功', wx.OK | wx.ICON_INFORMATION)
+        self.refresh_frozen()
+
+    # 啟動時載入上次的校正結果
+    def load_saved_calibration(self, path):
+        self.calibration_path = path
+        if not os.path.exists(path):
+            return
+        try:
+            self.publish_engine(calibration=load_calibration(path))
+        except (OSError, ValueError, KeyError) as e:
+            wx.MessageBox(f'無法載入校正檔 {path}：{e}', '錯誤', wx.OK | wx.ICON_ERROR)
+
+    # 攝影機解析度與校正時不同時停用校正（否則每張影像都會量測失敗）
+    def check_calibration_size(self):
+        calibration = self.engine.calibration
+        if calibration is None or self.capture is None:
+            return
+        size = (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        if size != calibration.image_size:
+            self.publish_engine(calibration=None)
+            wx.MessageBox(f'攝影機解析度 {size[0]}x{size[1]} 與校正時的 '
+                          f'{calibration.image_size[0]}x{calibration.image_size[1]} 不同，已停用相機校正',
+                          '提示', wx.OK | wx.ICON_INFORMATION)
+
+    # --- 產品設定檔 ---
+    def load_profiles(self, directory, product_code=None):
+        try:
+            self.profiles = ProfileStore(directory)
+        except ProfileError as e:
+            wx.MessageBox(f'無法載入產品設定檔：{e}', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+        self.product_combo.Set(self.profiles.codes())
+        if product_code:
+            self.switch_product(product_code)
+        # 其他產品在背景預先驗證、編譯並建好校正對照表，換線時不必等待，也不拖慢啟動
+        threading.Thread(target=self._preload_profiles, args=(self.profiles,), name='profile-preload',
+                         daemon=True).start()
+
+    def _preload_profiles(self, profiles):
+        errors = profiles.preload()
+        if errors:
+            wx.CallAfter(wx.MessageBox, '以下設定檔無法使用：\n' + '\n'.join(errors.values()), '錯誤',
+                         wx.OK | wx.ICON_ERROR)
+
+    def on_select_product(self, event):
+        code = self.product_combo.GetValue().strip()
+        if code:
+            self.switch_product(code)
+
+    def switch_product(self, product_code):
+        if self.profiles is None:
+            wx.MessageBox('產品設定檔資料夾無法使用', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+        try:
+            engine = self.profiles.engine(product_code, profiler=self.profiler)
+        except ProfileError as e:
+            wx.MessageBox(f'無法切換產品：{e}', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+        self.product_combo.SetValue(product_code)
+        self.apply_engine(engine)
+
+    # --- 發佈設定快照 ---
+    # 使用中的引擎視為不可變：GUI 的修改一律以 GUI 自己的步驟清單與參數（不與引擎共用）建立新快照，
+    # 再一次替換 self.engine，串流 worker 在下一張影像開始時才會看到新設定
+    def publish_engine(self, **changes):
+        engine = self.engine.replace(preprocess_steps=list(self.preprocess_steps),
+                                     preprocess_parameters={step: dict(params) for step, params
+                                                            in self.preprocess_parameters.items()},
+                                     **changes)
+        self.engine = engine
+        self.incremental.engine = engine
+        return engine
+
+    # 以新引擎取代目前的引擎並同步所有控制項；串流中下一張開始量測的影像即使用新設定
+    def apply_engine(self, engine):
+        engine.tiler = self.engine.tiler
+        if self.engine.static_reuse is not None:
+            engine.static_reuse = self.engine.static_reuse.renewed()
+        self.engine = engine
+        self.incremental.engine = engine
+        self.preprocess_steps = list(engine.preprocess_steps)
+        self.preprocess_parameters = {step: dict(params) for step, params in engine.preprocess_parameters.items()}
+        self.binary_slider.SetValue(engine.binary_threshold)
+        self.binary_label.SetLabel(f'Binary Threshold: {engine.binary_threshold}')
+        self.area_slider.SetValue(int(engine.min_area))
+        self.area_label.SetLabel(f'Minimum Area: {engine.min_area}')
+        self.precision_checkbox.SetValue(engine.precision)
+        if self.streaming:
+            self.check_calibration_size()
+        self.show_preprocess_steps()
+
+    def on_save_profile(self, event):
+        if self.profiles is None:
+            wx.MessageBox('產品設定檔資料夾無法使用', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+        code = self.product_combo.GetValue().strip()
+        dlg = wx.TextEntryDialog(self, '請輸入產品代碼：', '儲存產品設定檔', code)
+        if dlg.ShowModal() != wx.ID_OK:
+            dlg.Destroy()
+            return
+        code = dlg.GetValue().strip()
+        dlg.Destroy()
+        try:
+            version = self.profiles.save(code, self.engine)
+        except (ProfileError, OSError) as e:
+            wx.MessageBox(f'無法儲存設定檔：{e}', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+        self.product_combo.Set(self.profiles.codes())
+        self.product_combo.SetValue(code)
+        wx.MessageBox(f'已儲存 {code} 第 {version} 版', '成功', wx.OK | wx.ICON_INFORMATION)
+
+    # --- 儲存目前的前處理步驟、參數與換算比例 ---
+    def on_save_config(self, event):
+        with wx.FileDialog(self, '儲存量測設定', wildcard='JSON files (*.json)|*.json',
+                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            try:
+                save_config(self.engine, dlg.GetPath())
+            except OSError as e:
+                wx.MessageBox(f'無法儲存設定：{e}', '錯誤', wx.OK | wx.ICON_ERROR)
+
     # --- 套用處理並顯示 mm 單位尺寸 ---
     def on_apply_processing_mm(self, event):
-        if self.image is None:
+        image = self.current_frame()
+        if image is None:
             wx.MessageBox('請先啟動攝影機', '錯誤', wx.OK | wx.ICON_ERROR)
             return
 
-        if self.pixel_to_mm_ratio is None:
-            wx.MessageBox('請先設定 pixel to mm 轉換比例', '錯誤', wx.OK | wx.ICON_ERROR)
+        if not self.engine.has_scale:
+            wx.MessageBox('請先設定 pixel to mm 轉換比例或校正相機', '錯誤', wx.OK | wx.ICON_ERROR)
             return
 
-        processed_images = self.preprocess_image(self.image)
-        final_processed_image = processed_images[-1]
-        contours, _ = cv2.findContours(final_processed_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        result = self.image.copy()
-
-        for contour in contours:
-            if cv2.contourArea(contour) < self.min_area:
-                continue
-            x, y, w, h = cv2.boundingRect(contour)
-            width_mm = w * self.pixel_to_mm_ratio
-            height_mm = h * self.pixel_to_mm_ratio
-            cv2.rectangle(result, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            cv2.putText(result, f"{width_mm:.1f}mm x {height_mm:.1f}mm", (x, y - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
-
-        self.show_full_image(result)
-        self.update_contour_info(contours)
+        result = self.engine.measure(image)
+        self.show_full_image(self.engine.annotate(image, result))
+        self.update_contour_info(result)
 
     # --- 啟動即時尺寸量測模式 ---
     def on_live_measurement(self, event):
-        if self.pixel_to_mm_ratio is None:
-            wx.MessageBox('請先設定 pixel to mm 轉換比例', '錯誤', wx.OK | wx.ICON_ERROR)
+        if not self.engine.has_scale:
+            wx.MessageBox('請先設定 pixel to mm 轉換比例或校正相機', '錯誤', wx.OK | wx.ICON_ERROR)
             return
 
         if self.streaming:
             wx.MessageBox('Live Measurement 已啟動', '錯誤', wx.OK | wx.ICON_ERROR)
             return
 
-        self.capture = cv2.VideoCapture(0)
-        if not self.capture.isOpened():
-            wx.MessageBox('無法開啟攝影機', '錯誤', wx.OK | wx.ICON_ERROR)
+        if not self.open_capture():
             return
 
-        self.streaming = True
+        self.start_stream(in_mm=True)
+
+    # --- 自動調參：輸入零件標稱尺寸與數量後掃描參數 ---
+    def on_auto_tune(self, event):
+        if self.streaming or self.incremental.frame is None:
+            wx.MessageBox('請先凍結畫面', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+
+        if not self.engine.has_scale:
+            wx.MessageBox('請先設定 pixel to mm 轉換比例或校正相機', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+
+        dlg = wx.TextEntryDialog(self, '請輸入畫面中零件的標稱尺寸與數量\n格式：寬(mm) 高(mm) [數量]', '自動調參')
+        if dlg.ShowModal() != wx.ID_OK:
+            dlg.Destroy()
+            return
+        try:
+            values = dlg.GetValue().split()
+            nominal = (float(values[0]), float(values[1]))
+            count = int(values[2]) if len(values) > 2 else None
+        except (ValueError, IndexError):
+            wx.MessageBox('輸入格式錯誤，請輸入「寬 高 [數量]」', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+        finally:
+            dlg.Destroy()
+
+        # 掃描在背景執行緒進行（worker 行程以 spawn 啟動），GUI 與串流畫面不會停住；完成後回到 GUI 執行緒套用
+        from autotune import DEFAULT_TOP, ReferenceFrame, autotune
+        engine, reference = self.engine, ReferenceFrame(self.image.copy(), nominal_mm=nominal, count=count)
 
-        def live_loop():
-            while self.streaming:
-                ret, frame = self.capture.read()
-                if not ret:
-                    continue
-                self.image = frame
-                processed = self.preprocess_image(frame)[-1]
-                contours, _ = cv2.findContours(processed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                display = frame.copy()
-                for contour in contours:
-                    if cv2.contourArea(contour) < self.min_area:
-                        continue
-                    x, y, w, h = cv2.boundingRect(contour)
-                    width_mm = w * self.pixel_to_mm_ratio
-                    height_mm = h * self.pixel_to_mm_ratio
-                    cv2.rectangle(display, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(display, f"{width_mm:.1f}mm x {height_mm:.1f}mm", (x, y - 5),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
-                self.figure.clear()
-                ax = self.figure.add_subplot(111)
-                ax.imshow(cv2.cvtColor(display, cv2.COLOR_BGR2RGB))
-                ax.axis('off')
-                self.canvas.draw()
-                time.sleep(0.03)
-
-        self.stream_thread = threading.Thread(target=live_loop, daemon=True)
-        self.stream_thread.start()
-
-    # --- 執行前處理流程 ---
+        def run():
+            try:
+                report = autotune(engine, [reference], top=DEFAULT_TOP)
+            except ValueError as e:
+                wx.CallAfter(self.finish_auto_tune, None, e)
+            else:
+                wx.CallAfter(self.finish_auto_tune, report, None)
+
+        self.auto_tune_button.Disable()
+        self.auto_tune_button.SetLabel('Tuning...')
+        threading.Thread(target=run, name='autotune', daemon=True).start()
+
+    def finish_auto_tune(self, report, error):
+        if not self:  # 視窗已關閉
+            return
+        self.auto_tune_button.SetLabel('Auto Tune')
+        self.auto_tune_button.Enable()
+        if error is not None:
+            wx.MessageBox(f'無法自動調參：{error}', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+        from autotune import apply_candidate, format_candidate
+        candidates = report['candidates']
+        if not candidates:
+            wx.MessageBox('找不到可用的參數組合', '錯誤', wx.OK | wx.ICON_ERROR)
+            return
+
+        engine = self.engine.replace()
+        apply_candidate(engine, candidates[0])
+        self.apply_engine(engine)  # 同步控制項並更新凍結畫面
+
+        lines = [format_candidate(rank, c) for rank, c in enumerate(candidates, 1)]
+        wx.MessageBox(f"評估 {report['evaluated']} 組參數（{report['elapsed']:.1f} 秒），已套用第 1 名：\n\n" +
+                      '\n'.join(lines), '自動調參結果', wx.OK | wx.ICON_INFORMATION)
+
+    # --- 執行前處理流程（交由量測引擎） ---
     def preprocess_image(self, image):
-        processed_images = []
-        processed_images.append(image)
-        processed_image = image
-        for step in self.preprocess_steps:
-            params = self.preprocess_parameters.get(step, {})
-            if step == 'Gray Conversion':
-                processed_image = cv2.cvtColor(processed_image, cv2.COLOR_BGR2GRAY)
-            elif step == 'Gaussian Blur':
-                ksize = int(params.get('Kernel Size', '5'))
-                processed_image = cv2.GaussianBlur(processed_image, (ksize, ksize), 0)
-            elif step == 'Binary Threshold':
-                threshold = self.binary_threshold
-                _, processed_image = cv2.threshold(processed_image, threshold, 255, cv2.THRESH_BINARY)
-            elif step == 'Morphological Operations':
-                ksize = int(params.get('Kernel Size', '5'))
-                kernel = np.ones((ksize, ksize), np.uint8)
-                processed_image = cv2.morphologyEx(processed_image, cv2.MORPH_CLOSE, kernel)
-            elif step == 'Canny Edge Detection':
-                threshold = int(params.get('Threshold', '50'))
-                processed_image = cv2.Canny(processed_image, threshold, threshold * 3)
-            processed_images.append(processed_image)
-        return processed_images
+        return self.engine.preprocess(image)
 
     # --- 套用前處理後顯示多張圖像 ---
     def show_multiple_images(self, images):
+        self.set_video_mode(False)
+        self.image_artist = None
         self.figure.clear()
         n = len(images)
         nrows = (n + 1) // 2
@@ -576,10 +1106,10 @@ class MyFrame(wx.Frame):
 
     # --- 滑桿更新參數並即時顯示效果 ---
     def on_slider_update(self, event):
-        self.binary_threshold = self.binary_slider.GetValue()
-        self.binary_label.SetLabel(f'Binary Threshold: {self.binary_threshold}')
-        self.min_area = self.area_slider.GetValue()
-        self.area_label.SetLabel(f'Minimum Area: {self.min_area}')
+        self.publish_engine(binary_threshold=self.binary_slider.GetValue(), min_area=self.area_slider.GetValue())
+        self.binary_label.SetLabel(f'Binary Threshold: {self.engine.binary_threshold}')
+        self.area_label.SetLabel(f'Minimum Area: {self.engine.min_area}')
+        self.refresh_frozen()
 
     # --- 新增前處理步驟 ---
     def on_add_step(self, event):
@@ -619,20 +1149,75 @@ class MyFrame(wx.Frame):
             self.update_preprocess_listbox()
             self.preprocess_listbox.SetSelection(selection + 1)
 
-    # --- 更新清單顯示與同步參數 ---
+    # --- 步驟變動後發佈新的設定快照並更新清單顯示 ---
     def update_preprocess_listbox(self):
+        self.publish_engine()
+        self.show_preprocess_steps()
+
+    def show_preprocess_steps(self):
         self.preprocess_listbox.Clear()
         self.preprocess_listbox.AppendItems([
             f'{step} ({", ".join([f"{k}: {v}" for k, v in self.preprocess_parameters.get(step, {}).items()])})'
             for step in self.preprocess_steps
         ])
+        self.refresh_frozen()
 
 # --- 主程式入口點 ---
 class MyApp(wx.App):
+    # 選項很多，只接受關鍵字參數，新增選項時不會讓後面的參數錯位
+    def __init__(self, *, stats_file=None, stats_format='jsonl', heartbeat=DEFAULT_HEARTBEAT, motion_gate=True,
+                 calibration=DEFAULT_CALIBRATION_PATH, profile_dir=DEFAULT_PROFILE_DIR, product=None,
+                 log_dir=None, log_csv=False, log_rotate_mb=DEFAULT_ROTATE_BYTES / 2 ** 20,
+                 log_rotate_minutes=DEFAULT_ROTATE_SECONDS / 60, source='0', source_options=None, tile_workers=0,
+                 tile_size=None, autostart=False, profile_startup=False, engine_processes=0):
+        self.engine_processes = engine_processes
+        self.autostart = autostart
+        self.profile_startup = profile_startup
+        self.tile_workers = tile_workers
+        self.tile_size = tile_size
+        self.source = source
+        self.source_options = source_options or {}
+        self.log_dir = log_dir
+        self.log_options = (log_csv, int(log_rotate_mb * 2 ** 20), log_rotate_minutes * 60)
+        self.calibration = calibration
+        self.profile_dir = profile_dir
+        self.product = product
+        self.stats_file = stats_file
+        self.stats_format = stats_format
+        self.heartbeat = heartbeat
+        self.motion_gate = motion_gate
+        super().__init__()
+
     def OnInit(self):
+        STARTUP.mark('wx.App')
+        # 攝影機初始化（常需要數百 ms 到數秒）在背景執行，同時建立視窗
+        begin = time.perf_counter()
+        pending = open_source_async(self.source, **self.source_options)
+        pending.add_done_callback(lambda _: STARTUP.record('open source (background)', begin))
+
         frame = MyFrame(None, title='物件檢測與尺寸量測系統')
+        frame.profile_startup = self.profile_startup
+        frame.motion_gate = MotionGate(heartbeat=self.heartbeat) if self.motion_gate else None
+        frame.set_source(self.source, pending=pending, **self.source_options)
+        if self.tile_workers:
+            from tiling import DEFAULT_TILE_SIZE, TiledProcessor
+            frame.engine.tiler = TiledProcessor(self.tile_workers, self.tile_size or DEFAULT_TILE_SIZE)
+        if self.engine_processes:
+            from process_worker import ProcessEngine
+            frame.process_engine = ProcessEngine(self.engine_processes, self.tile_workers, self.tile_size).start()
+        STARTUP.mark('build window')
+        frame.load_saved_calibration(self.calibration)
+        frame.load_profiles(self.profile_dir, self.product)
+        STARTUP.mark('load calibration / profiles')
+        if self.stats_file:
+            frame.start_stats_export(self.stats_file, self.stats_format)
+        if self.log_dir:
+            frame.start_measurement_log(self.log_dir, *self.log_options)
         self.SetTopWindow(frame)
         frame.Show()
+        STARTUP.mark('show window')
+        if self.autostart:
+            wx.CallAfter(frame.autostart)
         return True
 
     def OnExit(self):
@@ -641,5 +1226,49 @@ class MyApp(wx.App):
         return 0
 
 if __name__ == '__main__':
-    app = MyApp()
+    parser = argparse.ArgumentParser(description='物件檢測與尺寸量測系統')
+    parser.add_argument('--stats-file', help='定期輸出各階段耗時統計的檔案')
+    parser.add_argument('--stats-format', choices=['jsonl', 'prometheus'], default='jsonl',
+                        help='統計輸出格式（預設 jsonl）')
+    parser.add_argument('--heartbeat', type=float, default=DEFAULT_HEARTBEAT,
+                        help=f'畫面沒變化時最長多久強制量測一次（秒，預設 {DEFAULT_HEARTBEAT}）')
+    parser.add_argument('--no-motion-gate', action='store_true', help='每張影像都完整量測')
+    parser.add_argument('--calibration', default=DEFAULT_CALIBRATION_PATH,
+                        help=f'相機校正檔，存在時啟動即載入，校正後也存到這裡（預設 {DEFAULT_CALIBRATION_PATH}）')
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR,
+                        help=f'產品設定檔資料夾（預設 {DEFAULT_PROFILE_DIR}）')
+    parser.add_argument('--product', help='啟動時套用的產品代碼')
+    parser.add_argument('--log-dir', help='把串流中每張影像的量測結果寫入此資料夾（SPC 紀錄）')
+    parser.add_argument('--log-csv', action='store_true', help='紀錄另外輸出一份 CSV')
+    parser.add_argument('--log-rotate-mb', type=float, default=DEFAULT_ROTATE_BYTES / 2 ** 20,
+                        help='紀錄檔超過此大小（MB）即輪替')
+    parser.add_argument('--log-rotate-minutes', type=float, default=DEFAULT_ROTATE_SECONDS / 60,
+                        help='紀錄檔超過此時間（分鐘）即輪替，0 表示只依大小')
+    parser.add_argument('--source', default='0',
+                        help='影像來源：攝影機編號、錄影檔 / 影像資料夾 / glob，或 synthetic[:解析度[:零件數]]（預設 0）')
+    parser.add_argument('--resolution', type=parse_resolution, help='攝影機解析度，例如 1920x1080 或 1080p')
+    parser.add_argument('--camera-fps', type=float, help='攝影機 fps；重播時覆寫影片的 fps')
+    parser.add_argument('--fourcc', help='攝影機影像格式，例如 MJPG（高解析度 / 高 fps 時通常需要）')
+    parser.add_argument('--max-speed', action='store_true', help='重播與合成影像不依 fps 節流，以最快速度輸出')
+    parser.add_argument('--preload', action='store_true', help='重播前先把所有影像解碼到記憶體')
+    parser.add_argument('--tile-workers', type=int, default=0,
+                        help='大影像（約 4 MP 以上）分塊平行處理的執行緒數，0 表示不分塊')
+    parser.add_argument('--tile-size', type=int, help='分塊大小（像素，預設 1024）')
+    parser.add_argument('--engine-processes', type=int, default=0,
+                        help='串流量測改在幾個獨立行程執行（當掉時自動重新啟動），0 表示在 GUI 行程的執行緒執行')
+    parser.add_argument('--autostart', action='store_true',
+                        help='啟動後直接開始串流（已有換算比例或校正時為 Live Measurement）')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='輸出各項匯入與初始化的耗時，以及到第一張量測結果的時間')
+    args = parser.parse_args()
+    width, height = args.resolution or (None, None)
+    source_options = {'width': width, 'height': height, 'fps': args.camera_fps, 'fourcc': args.fourcc,
+                      'realtime': not args.max_speed, 'preload': args.preload}
+
+    app = MyApp(stats_file=args.stats_file, stats_format=args.stats_format, heartbeat=args.heartbeat,
+                motion_gate=not args.no_motion_gate, calibration=args.calibration, profile_dir=args.profile_dir,
+                product=args.product, log_dir=args.log_dir, log_csv=args.log_csv, log_rotate_mb=args.log_rotate_mb,
+                log_rotate_minutes=args.log_rotate_minutes, source=args.source, source_options=source_options,
+                tile_workers=args.tile_workers, tile_size=args.tile_size, autostart=args.autostart,
+                profile_startup=args.profile_startup, engine_processes=args.engine_processes)
     app.MainLoop()
\ No newline at end of file
@@ -0,0 +1,188 @@
+# --- 前處理管線（預先編譯） ---
+# 將步驟清單與字串參數一次轉成已綁定參數的函式序列，
+# 每張影像只需依序呼叫，不再逐步比對步驟名稱或解析文字參數。
+import time
+
+import cv2
+import numpy as np
+
+# 形態學 kernel 快取：同樣大小的 kernel 只建立一次
+_kernel_cache = {}
+
+
+def morphology_kernel(ksize):
+    kernel = _kernel_cache.get(ksize)
+    if kernel is None:
+        kernel = np.ones((ksize, ksize), np.uint8)
+        _kernel_cache[ksize] = kernel
+    return kernel
+
+
+# --- 各步驟的建構函式：解析參數後回傳 func(image, dst=None) ---
+# dst 為預先配置的輸出緩衝區，透過 OpenCV 的 dst= 參數直接寫入，不另外配置記憶體
+def _build_gray(params, binary_threshold):
+    def gray(image, dst=None):
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
+    return gray
+
+
+def _build_gaussian_blur(params, binary_threshold):
+    ksize = (int(params.get('Kernel Size', '5')),) * 2
+
+    def gaussian_blur(image, dst=None):
+        return cv2.GaussianBlur(image, ksize, 0, dst=dst)
+    return gaussian_blur
+
+
+def _build_binary_threshold(params, binary_threshold):
+    threshold = binary_threshold
+
+    def binary(image, dst=None):
+        return cv2.threshold(image, threshold, 255, cv2.THRESH_BINARY, dst=dst)[1]
+    return binary
+
+
+def _build_morphology(params, binary_threshold):
+    kernel = morphology_kernel(int(params.get('Kernel Size', '5')))
+
+    def morphology(image, dst=None):
+        return cv2.morphologyEx(image, cv2.MORPH_CLOSE, kernel, dst=dst)
+    return morphology
+
+
+def _build_canny(params, binary_threshold):
+    threshold = int(params.get('Threshold', '50'))
+
+    def canny(image, dst=None):
+        return cv2.Canny(image, threshold, threshold * 3, edges=dst)
+    return canny
+
+
+# 步驟名稱 -> (建構函式, 輸出是否為單通道)
+STAGE_BUILDERS = {
+    'Gray Conversion': (_build_gray, True),
+    'Gaussian Blur': (_build_gaussian_blur, False),
+    'Binary Threshold': (_build_binary_threshold, False),
+    'Morphological Operations': (_build_morphology, False),
+    'Canny Edge Detection': (_build_canny, True),
+}
+
+
+# --- 各步驟的影響半徑（分塊處理時區塊之間需要重疊的寬度） ---
+# 輸出像素只取決於輸入中半徑 r 以內的像素時回傳 r；結果可能取決於整張影像時回傳 None。
+# Canny 的 hysteresis 會沿弱邊緣任意延伸；輸入為二值（0 / 255）時非零梯度至少為 255，
+# 高門檻低於 255 就沒有弱邊緣，半徑固定為 2（Sobel 1 + 非極大值抑制 1）
+CANNY_HALO = 2
+
+
+def stage_halo(step, params, binary_input):
+    if step == 'Gaussian Blur':
+        return int(params.get('Kernel Size', '5')) // 2
+    if step == 'Morphological Operations':
+        return 2 * (int(params.get('Kernel Size', '5')) // 2)  # closing = 膨脹 + 侵蝕
+    if step == 'Canny Edge Detection':
+        return CANNY_HALO if binary_input and int(params.get('Threshold', '50')) * 3 < 255 else None
+    return 0
+
+
+# 步驟輸出是否仍為二值影像（Binary Threshold 之後的形態學與 Canny 不會產生中間灰階）
+def _binary_output(step, binary_input):
+    if step in ('Binary Threshold', 'Canny Edge Detection'):
+        return True
+    return binary_input and step == 'Morphological Operations'
+
+
+# --- 編譯後的前處理管線 ---
+class PreprocessPipeline:
+    def __init__(self, stages, keys=None, halos=None):
+        self.stages = stages  # [(步驟名稱, 函式, 輸出是否為單通道), ...]
+        self.steps = [name for name, _, _ in stages]
+        # 每個步驟的快取鍵（步驟名稱與實際生效的參數），供逐步快取判斷參數是否改變
+        self.keys = keys if keys is not None else [(name,) for name in self.steps]
+        # 每個步驟的影響半徑（stage_halo），None 表示該步驟需要整張影像
+        self.halos = halos if halos is not None else [None] * len(stages)
+        self._funcs = [(func, single_channel) for _, func, single_channel in stages]
+        self._split = None
+
+    # 分塊處理用：拆成可分塊的前段與需要整張影像的後段，回傳 (前段, 後段, 前段的總重疊寬度)
+    def split_local(self):
+        if self._split is None:
+            count, halo = 0, 0
+            for radius in self.halos:
+                if radius is None:
+                    break
+                count += 1
+                halo += radius
+            self._split = (PreprocessPipeline(self.stages[:count], self.keys[:count], self.halos[:count]),
+                           PreprocessPipeline(self.stages[count:], self.keys[count:], self.halos[count:]),
+                           halo)
+        return self._split
+
+    # 輸出是否為單通道（任一步驟輸出單通道，或輸入本身為單通道）
+    def single_channel_output(self, image):
+        return image.ndim == 2 or any(single_channel for _, single_channel in self._funcs)
+
+    # keep_intermediates=True 時回傳每一步的結果（第 0 張為原圖），供除錯畫面使用
+    # 傳入 pool 時各步驟交替寫入池中的兩塊緩衝區（ping-pong），
+    # 回傳的影像屬於 pool，下一次 run 會被覆寫
+    # 傳入已啟用的 profiler 時記錄每個步驟的耗時（階段名稱為 "step:<步驟名稱>"）
+    def run(self, image, keep_intermediates=False, pool=None, profiler=None):
+        if profiler is not None and profiler.enabled and not keep_intermediates:
+            return self._run_profiled(image, pool, profiler)
+        if keep_intermediates:
+            processed_images = [image]
+            for func, _ in self._funcs:
+                image = func(image)
+                processed_images.append(image)
+            return processed_images
+        if pool is None:
+            for func, _ in self._funcs:
+                image = func(image)
+            return image
+        slot = 0
+        for func, single_channel in self._funcs:
+            shape = image.shape[:2] if single_channel else image.shape
+            image = func(image, pool.get(shape, image.dtype, ('pipeline', slot)))
+            slot ^= 1
+        return image
+
+    def _run_profiled(self, image, pool, profiler):
+        slot = 0
+        for name, func, single_channel in self.stages:
+            start = time.perf_counter_ns()
+            if pool is None:
+                image = func(image)
+            else:
+                shape = image.shape[:2] if single_channel else image.shape
+                image = func(image, pool.get(shape, image.dtype, ('pipeline', slot)))
+                slot ^= 1
+            profiler.record('step:' + name, time.perf_counter_ns() - start)
+        return image
+
+    def __call__(self, image):
+        return self.run(image)
+
+
+# --- 步驟的快取鍵：只包含會影響該步驟輸出的參數 ---
+def stage_key(step, params, binary_threshold):
+    if step == 'Binary Threshold':
+        return (step, binary_threshold)
+    return (step, tuple(sorted(params.items())))
+
+
+# --- 將步驟清單與參數編譯成管線（未知步驟會被略過） ---
+def compile_pipeline(steps, parameters, binary_threshold):
+    stages = []
+    keys = []
+    halos = []
+    binary = False
+    for step in steps:
+        if step not in STAGE_BUILDERS:
+            continue
+        builder, single_channel = STAGE_BUILDERS[step]
+        params = parameters.get(step, {})
+        stages.append((step, builder(params, binary_threshold), single_channel))
+        keys.append(stage_key(step, params, binary_threshold))
+        halos.append(stage_halo(step, params, binary))
+        binary = _binary_output(step, binary)
+    return PreprocessPipeline(stages, keys, halos)
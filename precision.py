@@ -0,0 +1,197 @@
+# --- 精密量測模式：次像素邊緣 + 旋轉外接矩形 + Feret 直徑 ---
+# 全部輪廓的點串成一個陣列後一次計算，不逐一呼叫 cv2.minAreaRect / convexHull：
+#   1. 次像素邊緣：沿每個輪廓點的法線方向取樣原始影像亮度（一次 cv2.remap），
+#      以亮度穿過內外中間值的位置（線性內插）作為邊緣，把點沿法線移到該處
+#   2. 卡尺（calipers）：把所有點投影到一組方向上，以 reduceat 取每個輪廓在各方向的投影範圍。
+#      投影的極值一定落在凸包頂點上，因此等同於對凸包做旋轉卡尺，不需另外求凸包。
+#      先以粗角度找出最佳方向，再在其附近以黃金分割細掃，角度誤差造成的尺寸誤差遠小於 0.01 像素
+#   - 最大 / 最小 Feret 直徑：各方向投影範圍的最大值 / 最小值
+#   - 最小面積外接矩形：互相垂直兩方向投影範圍乘積最小者
+import cv2
+import numpy as np
+
+EDGE_RADIUS = 3          # 法線方向往內外各取樣幾個像素
+EDGE_STEP = 0.5          # 法線方向的取樣間距（像素）
+MIN_EDGE_CONTRAST = 4.0  # 梯度峰值低於此值（灰階）時不移動該點
+TANGENT_SPAN = 2         # 以前後第幾個點估計切線方向（CHAIN_APPROX_NONE 的相鄰點只有 8 個方向）
+COARSE_ANGLES = 36       # 粗掃：0 ~ 180 度每 5 度一個方向
+GOLDEN_ITERATIONS = 16   # 細掃：在粗角度前後 5 度內黃金分割搜尋，10 度 * 0.618^16 約 0.005 度
+REMAP_WIDTH = 1024       # cv2.remap 的對照表寬高需小於 32767，取樣點攤平成這個寬度的多列
+
+PRECISE_DTYPE = [('cx', np.float64), ('cy', np.float64), ('width_px', np.float64), ('height_px', np.float64),
+                 ('angle', np.float64),
+                 ('feret_min_mm', np.float64), ('feret_max_mm', np.float64)]
+
+# --- 把輪廓串成點陣列：回傳 (點 (N, 2) float64, 各輪廓起點, 各輪廓點數) ---
+def stack_contours(contours):
+    lengths = np.fromiter((len(c) for c in contours), np.intp, len(contours))
+    starts = np.zeros(len(contours), np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    return points, starts, lengths
+
+
+# 每個點在同一輪廓中前後第 offset 個點的索引（頭尾相接），回傳 (往後, 往前)
+def _neighbors(starts, lengths, offset):
+    owner_start = np.repeat(starts, lengths)
+    owner_length = np.repeat(lengths, lengths)
+    local = np.arange(len(owner_start)) - owner_start
+    return (owner_start + (local + offset) % owner_length,
+            owner_start + (local - offset) % owner_length)
+
+
+# 在灰階影像上取樣（雙線性內插），回傳與 xs 同形狀的 float32 陣列
+def _sample(gray, xs, ys):
+    shape = xs.shape
+    n = xs.size
+    rows = -(-n // REMAP_WIDTH)
+    map_x = np.zeros(rows * REMAP_WIDTH, np.float32)
+    map_y = np.zeros(rows * REMAP_WIDTH, np.float32)
+    map_x[:n] = xs.ravel()
+    map_y[:n] = ys.ravel()
+    map_x, map_y = map_x.reshape(rows, REMAP_WIDTH), map_y.reshape(rows, REMAP_WIDTH)
+    chunks = []
+    for start in range(0, rows, 32000):
+        chunks.append(cv2.remap(gray, map_x[start:start + 32000], map_y[start:start + 32000],
+                                cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE))
+    values = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+    return values.reshape(-1)[:n].reshape(shape).astype(np.float32)
+
+
+# --- 次像素邊緣修正：回傳修正後的點（gray 為單通道原始影像） ---
+def refine_edges(gray, points, starts, lengths, radius=EDGE_RADIUS):
+    after, before = _neighbors(starts, lengths, TANGENT_SPAN)
+    tangent = (points[after] - points[before]).astype(np.float32)
+    norm = np.hypot(tangent[:, 0], tangent[:, 1])
+    valid = norm > 0
+    norm[~valid] = 1.0
+    nx, ny = -tangent[:, 1:2] / norm[:, None], tangent[:, 0:1] / norm[:, None]
+
+    steps = np.arange(-radius, radius + EDGE_STEP / 2, EDGE_STEP, dtype=np.float32)
+    profile = _sample(gray, points[:, 0:1].astype(np.float32) + steps * nx,
+                      points[:, 1:2].astype(np.float32) + steps * ny)
+
+    # 邊緣位置取亮度穿過內外中間值之處：先以相鄰取樣差最大的區間定位，再在區間內線性內插。
+    # 對反鋸齒（面積取樣）的直線邊緣，中間值的位置即為真正的邊緣，不受法線估計偏差影響
+    step_diff = np.diff(profile, axis=1)
+    peak = np.abs(step_diff).argmax(axis=1)
+    rows = np.arange(len(points))
+    contrast = np.abs(step_diff[rows, peak])
+    middle = (profile[:, 0] + profile[:, -1]) / 2  # 法線兩端分別落在物件內外
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.clip((middle - profile[rows, peak]) / step_diff[rows, peak], 0.0, 1.0)
+    shift = steps[peak] + np.nan_to_num(fraction) * EDGE_STEP
+    shift[(contrast < MIN_EDGE_CONTRAST) | ~valid] = 0.0
+    return points + shift[:, None] * np.hstack([nx, ny])
+
+
+# --- 各輪廓在指定方向上的投影範圍 ---
+# angles 為 (M, C)：每個輪廓各自的 M 個方向；回傳投影最小值與最大值，皆為 (M, C)
+# xs / ys 為相對於各輪廓原點的 float32 座標，原地運算以減少暫存陣列
+def _extents(xs, ys, starts, lengths, angles):
+    projection = np.repeat(np.cos(angles).astype(np.float32), lengths, axis=1)
+    projection *= xs
+    projection += np.repeat(np.sin(angles).astype(np.float32), lengths, axis=1) * ys
+    return np.minimum.reduceat(projection, starts, axis=1), np.maximum.reduceat(projection, starts, axis=1)
+
+
+# --- 在粗角度附近以黃金分割搜尋最佳方向（所有輪廓與所有目標同時進行） ---
+# 目標依序為：最大 Feret（投影範圍最大）、最小 Feret（投影範圍最小）、最小面積（兩垂直方向範圍乘積最小）；
+# 寬度函數在最佳角度附近為單峰（V 形），每次迭代每個目標只需再評估一個角度
+def _golden_search(xs, ys, starts, lengths, centers):
+    def cost(angles):
+        low, high = _extents(xs, ys, starts, lengths, np.vstack([angles, angles[2:] + np.pi / 2]))
+        span = high - low
+        return np.vstack([-span[0], span[1], span[2] * span[3]])
+
+    ratio = (np.sqrt(5.0) - 1) / 2
+    a = centers - np.pi / COARSE_ANGLES
+    b = centers + np.pi / COARSE_ANGLES
+    c = b - ratio * (b - a)
+    d = a + ratio * (b - a)
+    fc, fd = cost(c), cost(d)
+    for _ in range(GOLDEN_ITERATIONS):
+        left = fc < fd  # 最小值在 [a, d] 內
+        b = np.where(left, d, b)
+        a = np.where(left, a, c)
+        c, d = np.where(left, b - ratio * (b - a), d), np.where(left, c, a + ratio * (b - a))
+        fresh = cost(np.where(left, c, d))
+        fc, fd = np.where(left, fresh, fd), np.where(left, fc, fresh)
+    return (a + b) / 2
+
+
+# --- 旋轉外接矩形與 Feret 直徑（單位：像素） ---
+# 回傳 (中心 x, 中心 y, 寬, 高, 角度（度）, 最小 Feret, 最大 Feret)；
+# 寬為方向較接近水平的那一邊，角度為該邊相對水平的角度（-45 ~ 45 度）
+def rotated_geometry(points, starts, lengths):
+    # 以各輪廓第一點為原點，座標值小，float32 即足夠精確
+    origin = points[starts]
+    local = points - np.repeat(origin, lengths, axis=0)
+    xs = np.ascontiguousarray(local[:, 0], np.float32)
+    ys = np.ascontiguousarray(local[:, 1], np.float32)
+
+    coarse = np.arange(COARSE_ANGLES) * (np.pi / COARSE_ANGLES)
+    projection = np.cos(coarse).astype(np.float32)[:, None] * xs + np.sin(coarse).astype(np.float32)[:, None] * ys
+    span = np.maximum.reduceat(projection, starts, axis=1) - np.minimum.reduceat(projection, starts, axis=1)
+    half = COARSE_ANGLES // 2
+    area = span[:half] * span[half:]
+    centers = np.vstack([coarse[span.argmax(axis=0)], coarse[span.argmin(axis=0)], coarse[area.argmin(axis=0)]])
+
+    best = _golden_search(xs, ys, starts, lengths, centers)
+    theta = best[2]
+    low, high = _extents(xs, ys, starts, lengths, np.vstack([best[0], best[1], theta, theta + np.pi / 2]))
+    low, high = low.astype(np.float64), high.astype(np.float64)
+    feret_max, feret_min = high[0] - low[0], high[1] - low[1]
+    ul, uh, vl, vh = low[2], high[2], low[3], high[3]
+    mid_u, mid_v = (ul + uh) / 2, (vl + vh) / 2
+    cx = origin[:, 0] + mid_u * np.cos(theta) - mid_v * np.sin(theta)
+    cy = origin[:, 1] + mid_u * np.sin(theta) + mid_v * np.cos(theta)
+
+    # u 方向接近水平時 u 邊為寬，否則 v 邊為寬
+    theta = np.mod(theta, np.pi)
+    u_horizontal = (theta <= np.pi / 4) | (theta > 3 * np.pi / 4)
+    width = np.where(u_horizontal, uh - ul, vh - vl)
+    height = np.where(u_horizontal, vh - vl, uh - ul)
+    angle = np.where(u_horizontal, theta, theta - np.pi / 2)
+    angle = np.degrees(np.where(angle > np.pi / 2, angle - np.pi, angle))
+    return cx, cy, width, height, angle, feret_min, feret_max
+
+
+# --- 對量測結果中通過過濾的輪廓套用精密量測（就地修改 result） ---
+# image 為原始影像（BGR 或灰階），輪廓座標需與其一致；寬高改為旋轉外接矩形的邊長
+# 有相機校正（calibration.Calibration）時，mm 尺寸改由換算到量測平面上的邊緣點重新計算
+def apply_precision(result, image, pixel_to_mm_ratio=None, refine=True, calibration=None):
+    precise = np.zeros(len(result), PRECISE_DTYPE)
+    result.precise = precise
+    if len(result) == 0:
+        return result
+    points, starts, lengths = stack_contours(result.selected_contours)
+    if refine:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        points = refine_edges(gray, points, starts, lengths)
+    cx, cy, width, height, angle, feret_min, feret_max = rotated_geometry(points, starts, lengths)
+    precise['cx'], precise['cy'], precise['angle'] = cx, cy, angle
+    precise['width_px'], precise['height_px'] = width, height
+    if calibration is not None:
+        _, _, width, height, _, feret_min, feret_max = rotated_geometry(calibration.to_world(points), starts, lengths)
+        scale = 1.0
+    else:
+        scale = pixel_to_mm_ratio if pixel_to_mm_ratio else 1.0
+    result.width_mm = width * scale
+    result.height_mm = height * scale
+    precise['feret_min_mm'] = feret_min * scale
+    precise['feret_max_mm'] = feret_max * scale
+    return result
+
+
+# --- 旋轉外接矩形的四個角點（畫圖用），回傳 (C, 4, 2) int32 ---
+def rotated_corners(precise):
+    theta = np.radians(precise['angle'])
+    ux, uy = np.cos(theta), np.sin(theta)
+    half_w, half_h = precise['width_px'] / 2, precise['height_px'] / 2
+    signs = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], np.float64)
+    dx = signs[:, 0] * half_w[:, None]
+    dy = signs[:, 1] * half_h[:, None]
+    xs = precise['cx'][:, None] + dx * ux[:, None] - dy * uy[:, None]
+    ys = precise['cy'][:, None] + dx * uy[:, None] + dy * ux[:, None]
+    return np.round(np.stack([xs, ys], axis=2)).astype(np.int32)
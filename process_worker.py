@@ -0,0 +1,460 @@
+# --- 量測引擎獨立行程 ---
+# 量測在獨立的 worker 行程執行，GUI 行程的串流執行緒只負責傳遞描述與等待結果：
+# 輪廓、幾何計算、精密模式與校正的 Python 迴圈不再與 wx 事件迴圈搶 GIL，重的設定也不會讓畫面卡頓。
+# 影像與結果都放在 multiprocessing.shared_memory 區塊池（SharedBlocks）裡，全程不複製：
+#   - 影像：frames（SharedFramePool）讓擷取執行緒以 capture.read(image=區塊檢視) 直接解碼進共享記憶體，
+#     worker 以 NumPy 檢視量測
+#   - 結果：每個請求租一塊結果區塊，worker 把結果欄位依序寫入（8 位元組對齊），
+#     父行程的 MeasurementResult 欄位直接是該區塊的檢視；結果被 sequencer 送出、顯示與記錄都用完後區塊才歸還
+# Pipe 上只傳送小的描述（區塊名稱、位移、shape、dtype、欄位位移）、變更後的設定與各階段耗時。
+# supervisor 執行緒監看 worker；行程當掉或逾時沒有回應時該張影像記為錯誤，worker 自動重新啟動。
+#
+#     workers = ProcessEngine(processes=2).start()
+#     ret, frame = workers.frames.read(capture)  # 影像直接讀進共享記憶體
+#     result = workers.measure(frame, engine)   # 與 engine.measure(frame) 相同的 MeasurementResult
+#     workers.close()
+import mmap
+import multiprocessing
+import threading
+import time
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from buffer_pool import FramePool
+from calibration import Calibration
+from capture_pipeline import BLOCK, FrameQueue
+from measure_engine import MeasurementEngine, MeasurementResult, StaticReuse
+from profiling import StageProfiler, StageRecorder
+
+DEFAULT_PROCESSES = 2
+DEFAULT_TIMEOUT = 5.0            # 秒；worker 超過此時間沒有回應視為卡住，強制結束並重新啟動
+DEFAULT_STARTUP_TIMEOUT = 30.0   # 秒；新行程的第一張影像包含匯入模組的時間
+DEFAULT_RESULT_BYTES = 2 ** 20   # 結果區塊的初始容量；結果放不下時加大
+MAX_ATTACHED = 64                # worker 端保留的區塊對應數，超過時放掉目前請求以外的區塊
+RESTART_INTERVAL = 1.0           # 秒；連續當掉時兩次重新啟動的最短間隔，期間的影像直接記為錯誤
+SUPERVISE_INTERVAL = 0.5
+ALIGNMENT = 8
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+def _aligned(nbytes):
+    return -(-nbytes // ALIGNMENT) * ALIGNMENT
+
+
+# worker 端：切出的 memoryview 尚未回收時無法關閉，留給行程結束時釋放
+def _close(memory):
+    try:
+        memory.close()
+    except BufferError:
+        pass
+
+
+# --- 共享記憶體區塊池 ---
+# 每個區塊一次只租給一個陣列。租用的區塊由 _Lease（ndarray 子類別）持有，
+# 從它切出的檢視都經由它保留區塊（NumPy 不會越過不同型別的 base），
+# 最後一個檢視被回收時區塊回到空閒清單重複使用；只有 close() 或大小不再適用時才 unlink。
+# NumPy 建立檢視後不保留 buffer export，SharedMemory.close() 擋不住仍在使用的檢視，
+# 因此租出中的區塊在 close() 時只 unlink，等最後一個檢視回收時才解除對應。
+class _Lease(np.ndarray):
+    pass
+
+
+def _view(lease, offset, shape, dtype):
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    return lease[offset:offset + nbytes].view(dtype).reshape(shape).view(np.ndarray)
+
+
+class SharedBlocks:
+    def __init__(self):
+        self._lock = threading.RLock()   # 回收檢視時的 _release 可能在持有鎖的同一條執行緒內觸發
+        self._blocks = {}   # 名稱 -> (SharedMemory, 起始位址)
+        self._free = []
+        self._closed = False
+
+    def lease(self, nbytes):
+        nbytes = max(1, int(nbytes))
+        with self._lock:
+            if self._closed:
+                raise WorkerCrashed('共享記憶體已關閉')
+            # 大兩倍以上的區塊留給大的需求；比需要小的空閒區塊已不會再用到（解析度或結果容量變大），直接釋放
+            fits = [memory for memory in self._free if nbytes <= memory.size <= nbytes * 2 + mmap.PAGESIZE]
+            if fits:
+                memory = min(fits, key=lambda m: m.size)
+                self._free.remove(memory)
+            else:
+                for stale in [memory for memory in self._free if memory.size < nbytes]:
+                    self._free.remove(stale)
+                    self._discard(stale)
+                memory = shared_memory.SharedMemory(create=True, size=nbytes)
+                self._blocks[memory.name] = (memory, np.frombuffer(memory.buf, np.uint8).ctypes.data)
+        lease = np.ndarray((nbytes,), np.uint8, memory.buf).view(_Lease)
+        weakref.finalize(lease, self._release, memory)
+        return lease
+
+    def array(self, shape, dtype=np.uint8):
+        dtype = np.dtype(dtype)
+        return _view(self.lease(int(np.prod(shape, dtype=np.int64)) * dtype.itemsize), 0, shape, dtype)
+
+    # array 所在的 (區塊名稱, 位移)；不在池裡或不連續時回傳 None
+    def locate(self, array):
+        if not array.flags.c_contiguous:
+            return None
+        address = array.ctypes.data
+        with self._lock:
+            for name, (memory, start) in self._blocks.items():
+                if start <= address and address + array.nbytes <= start + memory.size:
+                    return name, address - start
+        return None
+
+    def _release(self, memory):
+        with self._lock:
+            if not self._closed and memory.name in self._blocks:
+                self._free.append(memory)
+            else:
+                memory.close()
+
+    # 只用於沒有檢視的空閒區塊
+    def _discard(self, memory):
+        del self._blocks[memory.name]
+        memory.close()
+        memory.unlink()
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for memory in self._free:
+                memory.close()
+            self._free = []
+            for memory, _ in self._blocks.values():
+                memory.unlink()
+            self._blocks.clear()
+
+
+# --- 影像放在共享記憶體的 FramePool ---
+# 與 FramePool 相同的介面，但 get() 每次租一塊新的區塊（不會覆寫仍在佇列或 worker 中的影像），
+# read() 以上一張影像的形狀準備區塊並交給 capture.read() 直接寫入；
+# 第一張、解析度改變或來源沒有寫入提供的緩衝區時複製一次，之後的影像不再複製
+class SharedFramePool(FramePool):
+    def __init__(self, blocks=None):
+        super().__init__()
+        self.blocks = blocks if blocks is not None else SharedBlocks()
+        self._layouts = {}   # slot -> 上一張影像的 (shape, dtype)
+
+    def get(self, shape, dtype=np.uint8, slot=0):
+        return self.blocks.array(shape, dtype)
+
+    def read(self, capture, slot=0):
+        layout = self._layouts.get(slot)
+        buffer = self.get(*layout) if layout is not None else None
+        ret, frame = capture.read(buffer)
+        if not ret or frame is None:
+            return ret, frame
+        if buffer is None or frame.shape != buffer.shape or frame.dtype != buffer.dtype \
+                or frame.ctypes.data != buffer.ctypes.data:
+            self._layouts[slot] = (frame.shape, frame.dtype)
+            buffer = self.like(frame)
+            buffer[...] = frame
+            frame = buffer
+        return ret, frame
+
+    def clear(self):
+        self._layouts.clear()
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+# --- 連續存放的輪廓點：與 list 相同的索引方式，取用時才切出各輪廓的檢視 ---
+class PackedContours:
+    def __init__(self, points, lengths):
+        self.points = points     # 所有輪廓的點依序相接，(總點數, 1, 2)
+        self.lengths = lengths
+        self.starts = np.cumsum(lengths) - lengths
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start = int(self.starts[index])
+        return self.points[start:start + int(self.lengths[index])]
+
+
+# 結果的各欄位；只傳送通過過濾的輪廓（indices 在父行程重新編號）
+def _result_arrays(result):
+    selected = result.selected_contours
+    lengths = np.fromiter((len(c) for c in selected), np.int64, len(selected))
+    points = np.concatenate(selected) if selected else np.zeros((0, 1, 2), np.int32)
+    arrays = [(name, getattr(result, name)) for name in MeasurementResult.FIELDS]
+    arrays += [('region', result.region), ('points', points), ('lengths', lengths)]
+    if result.precise is not None:
+        arrays.append(('precise', result.precise))
+    if result.static is not None:
+        arrays.append(('static', result.static))
+    return [(name, np.ascontiguousarray(array)) for name, array in arrays]
+
+
+# 依序寫入 buffer，回傳 (欄位描述, 總位元組數)；容量不足時描述為 None
+def _write_arrays(arrays, buffer):
+    layout, offset = [], 0
+    for name, array in arrays:
+        layout.append((name, array.dtype, array.shape, offset))
+        offset = _aligned(offset + array.nbytes)
+    if offset > len(buffer):
+        return None, offset
+    for (name, dtype, shape, start), (_, array) in zip(layout, arrays):
+        np.ndarray(shape, dtype, buffer, start)[...] = array
+    return layout, offset
+
+
+# 結果欄位直接是結果區塊的檢視，區塊在結果與所有欄位都被回收後才歸還
+def _read_result(layout, lease):
+    arrays = {name: _view(lease, offset, shape, dtype) for name, dtype, shape, offset in layout}
+    result = MeasurementResult(PackedContours(arrays['points'], arrays['lengths']), np.arange(len(arrays['x'])),
+                               *(arrays[name] for name in MeasurementResult.FIELDS), region=arrays['region'])
+    result.precise = arrays.get('precise')
+    result.static = arrays.get('static')
+    return result
+
+
+# --- worker 行程 ---
+# 訊息：('measure', (設定, 是否沿用靜止物件) 或 None, 是否記錄各階段耗時,
+#        (影像區塊名稱, 位移, shape, dtype), (結果區塊名稱, 容量))，None 表示結束
+# 回覆：('ok', 欄位描述, [(階段, 耗時 ns), ...] 或 None) / ('grow', 需要的位元組數) / ('error', 訊息)
+def _worker_main(conn, tile_workers=0, tile_size=None):
+    tiler = None
+    if tile_workers:
+        from tiling import DEFAULT_TILE_SIZE, TiledProcessor
+        tiler = TiledProcessor(tile_workers, tile_size or DEFAULT_TILE_SIZE)
+    engine = None
+    calibration = (None, None)   # (設定, Calibration)；設定相同時沿用已建好的對照表
+    attached = {}                # 區塊名稱 -> SharedMemory
+    recorder = StageRecorder()
+    disabled = StageProfiler()
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        _, config, profile, (frame_name, frame_offset, shape, dtype), (result_name, capacity) = message
+        try:
+            # 父行程的區塊池換掉的區塊不會再出現，累積太多時放掉
+            if len(attached) > MAX_ATTACHED:
+                for name in [name for name in attached if name not in (frame_name, result_name)]:
+                    _close(attached.pop(name))
+            for name in (frame_name, result_name):
+                if name not in attached:
+                    attached[name] = shared_memory.SharedMemory(name=name)
+            if config is not None:
+                config, static_reuse = config
+                calibration_config = config.pop('calibration', None)
+                updated = MeasurementEngine.from_config(config)
+                if calibration_config is not None:
+                    if calibration_config != calibration[0]:
+                        calibration = (calibration_config, Calibration.from_dict(calibration_config))
+                    updated.calibration = calibration[1]
+                updated.tiler = tiler
+                updated.static_reuse = StaticReuse() if static_reuse else None
+                engine = updated.prepare()
+            engine.profiler = recorder if profile else disabled
+            recorder.take()
+            frame = np.ndarray(shape, dtype, attached[frame_name].buf, frame_offset)
+            result = engine.measure(frame)
+            output = attached[result_name].buf[:capacity]
+            layout, nbytes = _write_arrays(_result_arrays(result), output)
+            del frame, result, output
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+            continue
+        conn.send(('ok', layout, recorder.take() if profile else None) if layout is not None else ('grow', nbytes))
+    for memory in attached.values():
+        _close(memory)
+
+
+# --- 一個 worker 行程與它目前持有的引擎設定 ---
+class _Slot:
+    def __init__(self, index):
+        self.index = index
+        self.lock = threading.Lock()
+        self.process = None
+        self.conn = None
+        self.engine = None          # 已傳給 worker 的設定所屬的引擎快照
+        self.fresh = True           # 新行程尚未回覆過（第一張影像使用較長的逾時）
+        self.started = None
+        self.exitcode = None
+
+
+class ProcessEngine:
+    def __init__(self, processes=DEFAULT_PROCESSES, tile_workers=0, tile_size=None, timeout=DEFAULT_TIMEOUT,
+                 startup_timeout=DEFAULT_STARTUP_TIMEOUT, result_bytes=DEFAULT_RESULT_BYTES):
+        self.processes = max(1, processes)
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.result_bytes = result_bytes
+        self.restarts = 0
+        self.crashes = 0
+        self.last_error = None
+        self.frames = SharedFramePool()    # 交給 StagedCapturePipeline(frame_pool=...)，擷取直接讀進共享記憶體
+        self.results = SharedBlocks()
+        self._context = multiprocessing.get_context('spawn')  # 不 fork 有多條執行緒的 GUI 行程
+        self._worker_args = (tile_workers, tile_size)
+        self._slots = [_Slot(i) for i in range(self.processes)]
+        self._free = FrameQueue(self.processes, BLOCK)   # 空閒的 worker，依序輪流使用
+        self._closed = threading.Event()
+        self._supervisor = None
+
+    def start(self):
+        for slot in self._slots:
+            with slot.lock:
+                self._ensure_process(slot)
+            self._free.put(slot)
+        self._supervisor = threading.Thread(target=self._supervise, name='worker-supervisor', daemon=True)
+        self._supervisor.start()
+        return self
+
+    # --- 以 engine 的設定量測 frame；可由多條執行緒同時呼叫（同時進行的數量為行程數） ---
+    def measure(self, frame, engine):
+        slot = self._free.get()
+        if slot is None:
+            raise WorkerCrashed('worker 行程已關閉')
+        try:
+            with slot.lock, engine.profiler.time('worker_process'):
+                return self._request(slot, frame, engine)
+        finally:
+            self._free.put(slot)
+
+    def _request(self, slot, frame, engine):
+        if not self._ensure_process(slot):
+            raise WorkerCrashed(f'worker {slot.index} 等待重新啟動（{self.last_error}）')
+        location = self.frames.blocks.locate(frame)
+        if location is None:
+            # 不是由 self.frames 讀入的影像（例如靜態影像或凍結的畫面）：複製進共享記憶體一次
+            shared = self.frames.like(frame)
+            shared[...] = frame
+            frame = shared
+            location = self.frames.blocks.locate(frame)
+        config = (engine.to_config(), engine.static_reuse is not None) if slot.engine is not engine else None
+        profile = engine.profiler.enabled
+        while True:
+            capacity = self.result_bytes
+            lease = self.results.lease(capacity)
+            result_name, _ = self.results.locate(lease)
+            reply = self._call(slot, ('measure', config, profile, location + (frame.shape, frame.dtype.str),
+                                      (result_name, capacity)))
+            if reply[0] == 'error':
+                raise RuntimeError(f'worker {slot.index}: {reply[1]}')
+            slot.engine = engine
+            if reply[0] == 'ok':
+                for stage, elapsed_ns in reply[2] or ():
+                    engine.profiler.record(stage, elapsed_ns)
+                return _read_result(reply[1], lease)
+            self.result_bytes = max(self.result_bytes, reply[1] * 2)   # 結果區塊不足：加大後以同一張影像重試
+            config = None
+
+    def _call(self, slot, message):
+        timeout = self.startup_timeout if slot.fresh else self.timeout
+        try:
+            slot.conn.send(message)
+            if slot.conn.poll(timeout):
+                reply = slot.conn.recv()
+                slot.fresh = False
+                return reply
+            reason = f'超過 {timeout:g} 秒沒有回應'
+        except (EOFError, OSError):
+            reason = None
+        self._stop_process(slot)
+        if reason is None:
+            reason = f'行程已結束（exit code {slot.exitcode}）'
+        self.crashes += 1
+        self.last_error = f'worker {slot.index} {reason}'
+        raise WorkerCrashed(self.last_error)
+
+    # --- 行程管理（持有 slot.lock 時呼叫） ---
+    # 行程已結束時回收並重新啟動；距離上次啟動不到 RESTART_INTERVAL 時先不重啟，回傳 False
+    def _ensure_process(self, slot):
+        if slot.process is not None:
+            if slot.process.is_alive():
+                return True
+            self._stop_process(slot)
+            self.crashes += 1
+            self.last_error = f'worker {slot.index} 行程已結束（exit code {slot.exitcode}）'
+        if self._closed.is_set():
+            return False
+        if slot.started is not None:
+            if time.monotonic() - slot.started < RESTART_INTERVAL:
+                return False
+            self.restarts += 1
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child,) + self._worker_args,
+                                        name=f'measure-worker-{slot.index}', daemon=True)
+        process.start()
+        child.close()  # 父行程不保留 worker 端，worker 結束時 recv 才會收到 EOF
+        slot.process, slot.conn, slot.engine, slot.fresh = process, parent, None, True
+        slot.started = time.monotonic()
+        return True
+
+    # graceful=True 時先等行程自行結束（已送出結束訊息），否則直接終止（卡住或已當掉）
+    def _stop_process(self, slot, graceful=False, timeout=1.0):
+        process, slot.process = slot.process, None
+        if slot.conn is not None:
+            slot.conn.close()
+            slot.conn = None
+        slot.engine = None
+        if process is None:
+            return
+        if graceful:
+            process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        slot.exitcode = process.exitcode
+
+    # --- supervisor：閒置中的格子若行程已結束，不等下一張影像就先重新啟動 ---
+    def _supervise(self):
+        while not self._closed.wait(SUPERVISE_INTERVAL):
+            for slot in self._slots:
+                if slot.process is not None and slot.process.is_alive():
+                    continue
+                if slot.lock.acquire(blocking=False):
+                    try:
+                        self._ensure_process(slot)
+                    finally:
+                        slot.lock.release()
+
+    @property
+    def alive(self):
+        return sum(1 for slot in self._slots if slot.process is not None and slot.process.is_alive())
+
+    def describe(self):
+        return f'Workers: {self.alive}/{self.processes} (restarts {self.restarts})'
+
+    def close(self):
+        self._closed.set()
+        self._free.close()
+        if self._supervisor is not None:
+            self._supervisor.join()
+        for slot in self._slots:
+            with slot.lock:
+                if slot.conn is not None:
+                    try:
+                        slot.conn.send(None)
+                    except OSError:
+                        pass
+                self._stop_process(slot, graceful=True)
+        self.frames.blocks.close()
+        self.results.close()
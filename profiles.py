@@ -0,0 +1,248 @@
+# --- 產品設定檔（profile） ---
+# 以產品代碼為索引保存前處理步驟、參數、滑桿數值、換算比例 / 相機校正與 ROI，每次儲存產生新版本。
+# 讀取時依 schema 驗證型別與範圍（參數仍以字串保存，與 AddStepDialog 相同），錯誤的檔案不會套用到產線上。
+# 已載入的設定與相機校正（含預先建好的對照表）會快取在記憶體，換線時只需建立一個新的 MeasurementEngine，
+# 由呼叫端一次替換引擎參照：串流中的每張影像都完整使用舊或新設定之一，不會混用。
+#
+#     store = ProfileStore('profiles')
+#     store.save('A-1024', engine)          # 存成 profiles/A-1024.v3.json，並更新 index.json
+#     engine = store.engine('A-1024')       # 最新版本；version= 可指定舊版本
+import json
+import os
+import re
+import time
+
+from calibration import Calibration
+from measure_engine import MeasurementEngine
+from pipeline import STAGE_BUILDERS
+
+PROFILE_SCHEMA = 1
+DEFAULT_PROFILE_DIR = 'profiles'
+INDEX_FILE = 'index.json'
+PRODUCT_CODE_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+
+# 各步驟可用的參數：名稱 -> (最小值, 最大值, 是否必須為奇數)
+PARAMETER_SCHEMA = {
+    'Gray Conversion': {},
+    'Gaussian Blur': {'Kernel Size': (1, 99, True)},
+    'Binary Threshold': {'Threshold': (0, 255, False)},  # 實際生效的是 binary_threshold（滑桿）
+    'Morphological Operations': {'Kernel Size': (1, 99, False)},
+    'Canny Edge Detection': {'Threshold': (0, 255, False)},
+}
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def _check(condition, path, message):
+    if not condition:
+        raise ProfileError(f'{path}: {message}')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _validate_parameters(parameters, path):
+    _check(isinstance(parameters, dict), path, '必須是物件')
+    result = {}
+    for step, params in parameters.items():
+        _check(step in PARAMETER_SCHEMA, f'{path}.{step}', '未知的步驟')
+        _check(isinstance(params, dict), f'{path}.{step}', '必須是物件')
+        schema = PARAMETER_SCHEMA[step]
+        result[step] = {}
+        for name, value in params.items():
+            where = f'{path}.{step}.{name}'
+            _check(name in schema, where, '未知的參數')
+            try:
+                number = int(str(value))
+            except ValueError:
+                raise ProfileError(f'{where}: 必須是整數，實際為 {value!r}') from None
+            low, high, odd = schema[name]
+            _check(low <= number <= high, where, f'必須介於 {low} ~ {high}')
+            _check(not odd or number % 2 == 1, where, '必須是奇數')
+            result[step][name] = str(number)
+    return result
+
+
+def _validate_calibration(calibration, path):
+    _check(isinstance(calibration, dict), path, '必須是物件')
+    try:
+        Calibration.from_dict(calibration)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ProfileError(f'{path}: 格式錯誤（{e}）') from None
+    _check(len(calibration['image_size']) == 2, f'{path}.image_size', '必須是 [寬, 高]')
+    _check(len(calibration['homography']) == 3 and all(len(row) == 3 for row in calibration['homography']),
+           f'{path}.homography', '必須是 3x3 矩陣')
+    return calibration
+
+
+# --- 驗證並正規化量測設定（MeasurementEngine.to_config 的格式），錯誤時丟出 ProfileError ---
+def validate_config(config, path='config', nested=False):
+    _check(isinstance(config, dict), path, '必須是物件')
+    result = {}
+    steps = config.get('preprocess_steps', [])
+    _check(isinstance(steps, list), f'{path}.preprocess_steps', '必須是清單')
+    for step in steps:
+        _check(step in STAGE_BUILDERS, f'{path}.preprocess_steps', f'未知的步驟 {step!r}')
+    _check(len(set(steps)) == len(steps), f'{path}.preprocess_steps', '步驟不可重複')
+    result['preprocess_steps'] = list(steps)
+    result['preprocess_parameters'] = _validate_parameters(config.get('preprocess_parameters', {}),
+                                                           f'{path}.preprocess_parameters')
+
+    threshold = config.get('binary_threshold', 127)
+    _check(isinstance(threshold, int) and not isinstance(threshold, bool) and 0 <= threshold <= 255,
+           f'{path}.binary_threshold', '必須是 0 ~ 255 的整數')
+    result['binary_threshold'] = threshold
+    min_area = config.get('min_area', 0)
+    _check(_is_number(min_area) and min_area >= 0, f'{path}.min_area', '必須是非負數')
+    result['min_area'] = min_area
+
+    if not nested:  # ROI 的換算比例、校正與精密模式由上層提供
+        ratio = config.get('pixel_to_mm_ratio')
+        _check(ratio is None or (_is_number(ratio) and ratio > 0), f'{path}.pixel_to_mm_ratio', '必須是正數或 null')
+        result['pixel_to_mm_ratio'] = ratio
+        precision = config.get('precision', False)
+        _check(isinstance(precision, bool), f'{path}.precision', '必須是 true / false')
+        result['precision'] = precision
+        calibration = config.get('calibration')
+        result['calibration'] = (None if calibration is None
+                                 else _validate_calibration(calibration, f'{path}.calibration'))
+
+    rois = config.get('rois', [])
+    _check(isinstance(rois, list), f'{path}.rois', '必須是清單')
+    result['rois'] = []
+    for i, roi in enumerate(rois):
+        where = f'{path}.rois[{i}]'
+        _check(isinstance(roi, dict), where, '必須是物件')
+        for key in ('x', 'y', 'w', 'h'):
+            _check(_is_number(roi.get(key)), f'{where}.{key}', '必須是數字')
+        _check(roi['w'] > 0 and roi['h'] > 0, where, '寬高必須大於 0')
+        _check(isinstance(roi.get('name', ''), str), f'{where}.name', '必須是字串')
+        result['rois'].append({'x': int(roi['x']), 'y': int(roi['y']), 'w': int(roi['w']), 'h': int(roi['h']),
+                               'name': roi.get('name', ''),
+                               'config': validate_config(roi.get('config', {}), f'{where}.config', nested=True)})
+    return result
+
+
+def check_product_code(product_code):
+    if not isinstance(product_code, str) or not PRODUCT_CODE_PATTERN.match(product_code):
+        raise ProfileError(f'產品代碼 {product_code!r} 只能包含英數字、底線、點與減號（最長 64 字）')
+    return product_code
+
+
+# 先寫暫存檔再取代，讀取端不會看到寫到一半的檔案
+def _write_json(path, data):
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp, path)
+
+
+class ProfileStore:
+    def __init__(self, directory=DEFAULT_PROFILE_DIR):
+        self.directory = directory
+        self._configs = {}        # (產品代碼, 版本) -> 驗證過的設定
+        self._calibrations = {}   # (產品代碼, 版本) -> Calibration（對照表建好後重複使用）
+        self.index = self._read_index()
+
+    def _read_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise ProfileError(f'無法讀取 {path}：{e}') from None
+
+    def _path(self, product_code, version):
+        return os.path.join(self.directory, f'{product_code}.v{version}.json')
+
+    def codes(self):
+        return sorted(self.index)
+
+    def versions(self, product_code):
+        prefix = f'{product_code}.v'
+        versions = []
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if name.startswith(prefix) and name.endswith('.json') and name[len(prefix):-5].isdigit():
+                versions.append(int(name[len(prefix):-5]))
+        return sorted(versions)
+
+    # --- 儲存目前的引擎設定為新版本，回傳版本號 ---
+    def save(self, product_code, engine, name=''):
+        check_product_code(product_code)
+        config = validate_config(engine.to_config())
+        os.makedirs(self.directory, exist_ok=True)
+        version = max(self.versions(product_code), default=0) + 1
+        saved_at = time.time()
+        _write_json(self._path(product_code, version), {
+            'schema': PROFILE_SCHEMA,
+            'product_code': product_code,
+            'version': version,
+            'name': name,
+            'saved_at': saved_at,
+            'config': config,
+        })
+        self.index[product_code] = {'version': version, 'name': name, 'saved_at': saved_at}
+        _write_json(os.path.join(self.directory, INDEX_FILE), self.index)
+        self._configs[(product_code, version)] = config
+        if engine.calibration is not None:
+            self._calibrations[(product_code, version)] = engine.calibration
+        return version
+
+    def _resolve(self, product_code, version):
+        if version is None:
+            entry = self.index.get(product_code)
+            if entry is None:
+                raise ProfileError(f'找不到產品代碼 {product_code!r} 的設定檔')
+            version = entry['version']
+        return product_code, version
+
+    # --- 讀取並驗證設定（快取），回傳 MeasurementEngine.to_config 格式 ---
+    def load_config(self, product_code, version=None):
+        key = self._resolve(product_code, version)
+        config = self._configs.get(key)
+        if config is None:
+            path = self._path(*key)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except OSError as e:
+                raise ProfileError(f'無法讀取 {path}：{e}') from None
+            except ValueError as e:
+                raise ProfileError(f'{path} 不是有效的 JSON：{e}') from None
+            schema = data.get('schema')
+            if schema != PROFILE_SCHEMA:
+                raise ProfileError(f'{path}: 不支援的 schema 版本 {schema!r}')
+            config = validate_config(data.get('config'), path)
+            self._configs[key] = config
+        return config
+
+    # --- 依設定建立新的量測引擎：管線先編譯、相機校正對照表先建好，切換後第一張影像不必等待 ---
+    def engine(self, product_code, version=None, profiler=None):
+        key = self._resolve(product_code, version)
+        config = dict(self.load_config(*key))
+        calibration_config = config.pop('calibration', None)
+        engine = MeasurementEngine.from_config(config)
+        if profiler is not None:
+            engine.profiler = profiler
+        if calibration_config is not None:
+            calibration = self._calibrations.get(key)
+            if calibration is None:
+                calibration = Calibration.from_dict(calibration_config)
+                self._calibrations[key] = calibration
+            engine.calibration = calibration
+        return engine.prepare()
+
+    # 預先載入所有產品的最新版本；回傳無法載入者 {產品代碼: 錯誤訊息}
+    def preload(self):
+        errors = {}
+        for product_code in self.codes():
+            try:
+                self.engine(product_code)
+            except ProfileError as e:
+                errors[product_code] = str(e)
+        return errors
@@ -0,0 +1,201 @@
+# --- 各階段耗時統計 ---
+# 以 time.perf_counter_ns 量測每個前處理步驟與迴圈階段（擷取、輪廓、標註、繪製...），
+# 每個階段保留最近 window 筆耗時的環狀緩衝區，可計算 p50 / p95 / p99，另有 fps 計數器。
+# 停用時 time() 回傳共用的空 context manager，record() 直接返回，幾乎沒有額外負擔。
+#
+#     with profiler.time('find_contours'):
+#         contours = find_contours(binary)
+import bisect
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_WINDOW = 512
+FPS_WINDOW_SECONDS = 2.0
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ('profiler', 'stage', 'start')
+
+    def __init__(self, profiler, stage):
+        self.profiler = profiler
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.record(self.stage, time.perf_counter_ns() - self.start)
+        return False
+
+
+# --- 單一階段的耗時環狀緩衝區 ---
+class _StageSamples:
+    def __init__(self, window):
+        self.samples = np.zeros(window, np.int64)
+        self.count = 0
+
+    def add(self, elapsed_ns):
+        self.samples[self.count % len(self.samples)] = elapsed_ns
+        self.count += 1
+
+    def values(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+
+class StageProfiler:
+    def __init__(self, enabled=False, window=DEFAULT_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._stages = {}
+        self._ticks = {}  # 計數器名稱 -> 最近的時間戳（秒）
+        self._lock = threading.Lock()
+
+    def time(self, stage):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def record(self, stage, elapsed_ns):
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._stages.get(stage)
+            if samples is None:
+                samples = self._stages[stage] = _StageSamples(self.window)
+            samples.add(elapsed_ns)
+
+    # fps 計數：每處理一張影像呼叫一次
+    def tick(self, counter):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            ticks = self._ticks.get(counter)
+            if ticks is None:
+                ticks = self._ticks[counter] = []
+            ticks.append(now)
+            cutoff = now - FPS_WINDOW_SECONDS
+            if ticks[0] < cutoff:
+                del ticks[:bisect.bisect_left(ticks, cutoff)]
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._ticks.clear()
+
+    # --- 統計結果 ---
+    def snapshot(self):
+        with self._lock:
+            stages = {name: (samples.values().copy(), samples.count) for name, samples in self._stages.items()}
+            ticks = {name: list(values) for name, values in self._ticks.items()}
+        report = {'timestamp': time.time(), 'stages': {}, 'fps': {}}
+        for name, (values, count) in stages.items():
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, (50, 95, 99)) / 1e6
+            report['stages'][name] = {'count': count, 'mean_ms': float(values.mean() / 1e6),
+                                      'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+        for name, values in ticks.items():
+            span = values[-1] - values[0] if len(values) > 1 else 0.0
+            report['fps'][name] = (len(values) - 1) / span if span > 0 else 0.0
+        return report
+
+    # 畫面疊加顯示用的文字行
+    def overlay_lines(self):
+        report = self.snapshot()
+        lines = [f'{name}: {fps:.1f} fps' for name, fps in sorted(report['fps'].items())]
+        for name, stats in report['stages'].items():
+            lines.append(f"{name}: p50 {stats['p50_ms']:.2f} / p95 {stats['p95_ms']:.2f} / "
+                         f"p99 {stats['p99_ms']:.2f} ms")
+        return lines
+
+    # Prometheus text exposition 格式
+    def to_prometheus(self, prefix='px2mm'):
+        report = self.snapshot()
+        lines = [f'# TYPE {prefix}_stage_latency_ms summary']
+        for name, stats in report['stages'].items():
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+                lines.append(f'{prefix}_stage_latency_ms{{stage="{name}",quantile="{quantile}"}} {stats[key]:.6f}')
+            lines.append(f'{prefix}_stage_latency_ms_count{{stage="{name}"}} {stats["count"]}')
+        lines.append(f'# TYPE {prefix}_fps gauge')
+        for name, fps in report['fps'].items():
+            lines.append(f'{prefix}_fps{{counter="{name}"}} {fps:.3f}')
+        return '\n'.join(lines) + '\n'
+
+
+# --- 只記下一張影像各階段的耗時（不做統計） ---
+# 給 worker 行程使用：量測完以 take() 取出 [(階段, 耗時 ns), ...] 隨結果送回，父行程再以 StageProfiler.record() 合併
+class StageRecorder:
+    enabled = True
+
+    def __init__(self):
+        self.samples = []
+
+    def time(self, stage):
+        return _StageTimer(self, stage)
+
+    def record(self, stage, elapsed_ns):
+        self.samples.append((stage, elapsed_ns))
+
+    def tick(self, counter):
+        pass
+
+    def take(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+
+# --- 定期把統計結果輸出到檔案 ---
+# jsonl：每次附加一行 JSON；prometheus：覆寫整個檔案（可給 node_exporter textfile collector 讀取）
+class ProfileExporter:
+    def __init__(self, profiler, path, fmt='jsonl', interval=1.0):
+        if fmt not in ('jsonl', 'prometheus'):
+            raise ValueError(f'Unknown export format: {fmt}')
+        self.profiler = profiler
+        self.path = path
+        self.format = fmt
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='profile-export', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1.0)
+            self._thread = None
+
+    def write(self):
+        if self.format == 'jsonl':
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.profiler.snapshot()) + '\n')
+        else:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.profiler.to_prometheus())
+            os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.profiler.enabled:
+                self.write()
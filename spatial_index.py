@@ -0,0 +1,130 @@
+# --- 輪廓空間索引 ---
+# 凍結畫面時對所有輪廓的外接矩形建立一次網格索引（grid buckets），
+# 之後的點選、框選、套索選取只需檢查少數格子內的候選輪廓。
+# 索引以 CSR 形式保存：依格子編號排序的 (格子, 輪廓) 配對，查詢時用 searchsorted 取出範圍。
+import cv2
+import numpy as np
+
+from measure_engine import contour_geometry
+
+MIN_CELL_SIZE = 16
+
+
+# --- 向量化的點在多邊形內判斷（ray casting） ---
+def points_in_polygon(px, py, polygon):
+    polygon = np.asarray(polygon, np.float64).reshape(-1, 2)
+    inside = np.zeros(len(px), bool)
+    if len(polygon) < 3:
+        return inside
+    xs, ys = polygon[:, 0], polygon[:, 1]
+    xs_next, ys_next = np.roll(xs, -1), np.roll(ys, -1)
+    px = np.asarray(px, np.float64)[:, None]
+    py = np.asarray(py, np.float64)[:, None]
+    crosses = (ys > py) != (ys_next > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = (xs_next - xs) * (py - ys) / (ys_next - ys) + xs
+    inside = np.logical_xor.reduce(crosses & (px < x_cross), axis=1)
+    return inside
+
+
+class ContourIndex:
+    def __init__(self, contours, cell_size=None):
+        self.contours = contours
+        self.x, self.y, self.w, self.h, self.area = contour_geometry(contours)
+        # 右下角座標（含）
+        self.x1 = self.x + self.w - 1
+        self.y1 = self.y + self.h - 1
+
+        n = len(contours)
+        if cell_size is None:
+            # 以輪廓大小的中位數作為格子大小，大多數輪廓只會落在 1~4 格
+            typical = int(np.median(np.maximum(self.w, self.h))) if n else MIN_CELL_SIZE
+            cell_size = max(MIN_CELL_SIZE, typical)
+        self.cell_size = cell_size
+        self.cols = int(self.x1.max()) // cell_size + 1 if n else 1
+        self._build()
+
+    def __len__(self):
+        return len(self.contours)
+
+    def _cell_id(self, cx, cy):
+        return cy.astype(np.int64) * self.cols + cx
+
+    def _build(self):
+        cs = self.cell_size
+        cx0, cy0 = self.x // cs, self.y // cs
+        span_x = self.x1 // cs - cx0 + 1
+        span_y = self.y1 // cs - cy0 + 1
+        counts = (span_x * span_y).astype(np.intp)
+        total = int(counts.sum())
+
+        # 展開每個輪廓覆蓋的所有格子
+        boxes = np.repeat(np.arange(len(counts)), counts)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        offset = np.arange(total) - starts
+        sx = span_x[boxes]
+        cells = self._cell_id(cx0[boxes] + offset % sx, cy0[boxes] + offset // sx)
+
+        order = np.argsort(cells, kind='stable')
+        self._cells = cells[order]
+        self._boxes = boxes[order]
+
+    # 取出一組格子內的候選輪廓索引（去除重複）
+    def _candidates(self, cx0, cy0, cx1, cy1):
+        if len(self._cells) == 0:
+            return np.zeros(0, np.intp)
+        cx0, cy0 = max(cx0, 0), max(cy0, 0)
+        cx1 = min(cx1, self.cols - 1)
+        if cx1 < cx0 or cy1 < cy0:
+            return np.zeros(0, np.intp)
+        rows = np.arange(cy0, cy1 + 1, dtype=np.int64) * self.cols
+        lo = np.searchsorted(self._cells, rows + cx0, 'left')
+        hi = np.searchsorted(self._cells, rows + cx1, 'right')
+        if len(rows) == 1:
+            return np.unique(self._boxes[lo[0]:hi[0]])   # 跨多格的輪廓在同一列也會出現多次
+        return np.unique(np.concatenate([self._boxes[a:b] for a, b in zip(lo, hi)]))
+
+    # --- 點選：回傳包含該點的最小輪廓索引，沒有則回傳 None ---
+    # 先以外接矩形篩選，再用 pointPolygonTest 確認點在輪廓內；
+    # 若沒有輪廓真正包住該點（例如只有邊緣線），退回外接矩形最小者
+    def hit_test(self, px, py):
+        cs = self.cell_size
+        candidates = self._candidates(px // cs, py // cs, px // cs, py // cs)
+        if len(candidates) == 0:
+            return None
+        in_box = ((self.x[candidates] <= px) & (px <= self.x1[candidates]) &
+                  (self.y[candidates] <= py) & (py <= self.y1[candidates]))
+        candidates = candidates[in_box]
+        if len(candidates) == 0:
+            return None
+        # 由小到大檢查，第一個真正包住點的輪廓即為答案
+        candidates = candidates[np.argsort(self.w[candidates].astype(np.int64) * self.h[candidates], kind='stable')]
+        for i in candidates:
+            if cv2.pointPolygonTest(self.contours[i], (float(px), float(py)), False) >= 0:
+                return int(i)
+        return int(candidates[0])
+
+    # --- 框選：回傳外接矩形完全落在框內（contained=False 時為有交集）的輪廓索引 ---
+    def query_rect(self, x0, y0, x1, y1, contained=True):
+        x0, x1 = sorted((int(x0), int(x1)))
+        y0, y1 = sorted((int(y0), int(y1)))
+        cs = self.cell_size
+        candidates = self._candidates(x0 // cs, y0 // cs, x1 // cs, y1 // cs)
+        if contained:
+            keep = ((self.x[candidates] >= x0) & (self.x1[candidates] <= x1) &
+                    (self.y[candidates] >= y0) & (self.y1[candidates] <= y1))
+        else:
+            keep = ((self.x[candidates] <= x1) & (self.x1[candidates] >= x0) &
+                    (self.y[candidates] <= y1) & (self.y1[candidates] >= y0))
+        return np.sort(candidates[keep])
+
+    # --- 套索選取：回傳外接矩形中心落在多邊形內的輪廓索引 ---
+    def query_lasso(self, polygon):
+        polygon = np.asarray(polygon, np.float64).reshape(-1, 2)
+        if len(polygon) < 3:
+            return np.zeros(0, np.intp)
+        (x0, y0), (x1, y1) = polygon.min(axis=0), polygon.max(axis=0)
+        candidates = self.query_rect(x0, y0, x1, y1, contained=False)
+        centers_x = self.x[candidates] + self.w[candidates] / 2.0
+        centers_y = self.y[candidates] + self.h[candidates] / 2.0
+        return candidates[points_in_polygon(centers_x, centers_y, polygon)]
@@ -0,0 +1,49 @@
+# --- 啟動時間量測 ---
+# 記錄從程式開始到各個里程碑（匯入模組、建立視窗、開啟攝影機、第一張量測結果）的時間，
+# 以 --profile-startup 輸出報表。只相依 time / threading，應在其他匯入之前建立，才能量到匯入時間。
+#
+#     STARTUP = StartupTimer()
+#     import wx
+#     STARTUP.mark('import wx')
+#     print(STARTUP.finish('first measured frame'))
+import threading
+import time
+
+
+class StartupTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.entries = []   # [(名稱, 開始, 結束), ...]，以程式開始後的秒數表示
+        self.finished = False
+        self._last = self.start
+        self._lock = threading.Lock()
+
+    # 主流程的里程碑：從上一個里程碑到現在
+    def mark(self, name):
+        now = time.perf_counter()
+        with self._lock:
+            self.entries.append((name, self._last - self.start, now - self.start))
+            self._last = now
+
+    # 與主流程重疊的工作（例如背景開啟攝影機）：從 begin（perf_counter）到現在，不影響里程碑
+    def record(self, name, begin):
+        now = time.perf_counter()
+        with self._lock:
+            self.entries.append((name, begin - self.start, now - self.start))
+
+    def report(self):
+        with self._lock:
+            entries = sorted(self.entries, key=lambda entry: entry[2])
+        lines = ['啟動時間（ms，從載入主程式起算）', f'{"開始":>8} {"結束":>8} {"耗時":>8}  項目']
+        for name, begin, end in entries:
+            lines.append(f'{begin * 1000:8.1f} {end * 1000:8.1f} {(end - begin) * 1000:8.1f}  {name}')
+        return '\n'.join(lines)
+
+    # 記錄最後一個里程碑並回傳報表；只有第一次呼叫回傳報表，之後回傳 None
+    def finish(self, name):
+        with self._lock:
+            if self.finished:
+                return None
+            self.finished = True
+        self.mark(name)
+        return self.report()
@@ -0,0 +1,46 @@
+# --- 合成測試影像 ---
+# 以固定亂數種子產生「深色輸送帶 + 亮色矩形零件」的影像，零件尺寸已知，
+# 可用於效能測試、自動調參與沒有攝影機時的離線測試。
+import cv2
+import numpy as np
+
+RESOLUTIONS = {
+    'VGA': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4K': (3840, 2160),
+}
+
+PART_DTYPE = [('x', np.int32), ('y', np.int32), ('w', np.int32), ('h', np.int32)]
+
+
+# 回傳 (BGR 影像, 零件結構化陣列)；零件各自落在不重疊的格子中，彼此不相連
+def make_synthetic_frame(width, height, n_parts, seed=0, min_size=12, max_size=None, noise=8, background=40):
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 3), background, np.uint8)
+    if noise:
+        frame += rng.integers(0, noise, (height, width, 1), dtype=np.uint8)
+
+    parts = np.zeros(0, PART_DTYPE)
+    if n_parts <= 0:
+        return frame, parts
+
+    # 依零件數量切出格子，每格放一個零件（至少留 4 像素間隔）
+    cols = max(1, int(np.ceil(np.sqrt(n_parts * width / height))))
+    rows = max(1, int(np.ceil(n_parts / cols)))
+    cell_w, cell_h = width // cols, height // rows
+    limit = min(cell_w, cell_h) - 8
+    if limit < min_size:
+        raise ValueError(f'{n_parts} parts do not fit in a {width}x{height} frame')
+    max_size = min(max_size or limit, limit)
+
+    cells = rng.permutation(rows * cols)[:n_parts]
+    parts = np.zeros(n_parts, PART_DTYPE)
+    parts['w'] = rng.integers(min_size, max_size + 1, n_parts)
+    parts['h'] = rng.integers(min_size, max_size + 1, n_parts)
+    parts['x'] = (cells % cols) * cell_w + 4 + rng.integers(0, cell_w - parts['w'] - 7)
+    parts['y'] = (cells // cols) * cell_h + 4 + rng.integers(0, cell_h - parts['h'] - 7)
+    shades = rng.integers(180, 256, n_parts)
+    for (x, y, w, h), shade in zip(parts.tolist(), shades.tolist()):
+        cv2.rectangle(frame, (x, y), (x + w - 1, y + h - 1), (shade, shade, shade), -1)
+    return frame, parts
@@ -0,0 +1,6 @@
+# --- 測試共用設定 ---
+# 模組都放在專案根目錄，測試從 tests/ 執行時把根目錄加入匯入路徑
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+# --- FramePool 與前處理管線的緩衝區重複使用 ---
+import numpy as np
+
+from buffer_pool import FramePool
+from measure_engine import DEFAULT_PREPROCESS_PARAMETERS, DEFAULT_PREPROCESS_STEPS, MeasurementEngine
+from pipeline import compile_pipeline
+from synthetic import make_synthetic_frame
+
+
+def test_get_reuses_buffer_per_key():
+    pool = FramePool()
+    a = pool.get((4, 5), np.uint8, 0)
+    assert pool.get((4, 5), np.uint8, 0) is a
+    assert pool.get((4, 5), np.uint8, 1) is not a
+    assert pool.get((4, 5), np.float32, 0) is not a
+    assert pool.like(a) is a
+    assert len(pool) == 3
+    pool.clear()
+    assert len(pool) == 0
+
+
+def test_pipeline_with_pool_matches_without_pool():
+    frame, _ = make_synthetic_frame(320, 240, 12, seed=3)
+    pipeline = compile_pipeline(DEFAULT_PREPROCESS_STEPS, DEFAULT_PREPROCESS_PARAMETERS, 127)
+    expected = pipeline.run(frame)
+    pool = FramePool()
+    first = pipeline.run(frame, pool=pool).copy()
+    size = len(pool)
+    second = pipeline.run(frame, pool=pool)
+    np.testing.assert_array_equal(first, expected)
+    np.testing.assert_array_equal(second, expected)
+    # 穩定狀態下不再配置新的緩衝區
+    assert len(pool) == size
+
+
+def test_engine_measure_is_stable_across_frames():
+    engine = MeasurementEngine(pixel_to_mm_ratio=0.1)
+    frames = [make_synthetic_frame(320, 240, 10, seed=seed)[0] for seed in range(3)]
+    expected = [MeasurementEngine(pixel_to_mm_ratio=0.1).measure(frame).to_records() for frame in frames]
+    # 交替量測，前一張的緩衝區被覆寫不應影響下一張的結果
+    for _ in range(2):
+        for frame, records in zip(frames, expected):
+            np.testing.assert_array_equal(engine.measure(frame).to_records(), records)
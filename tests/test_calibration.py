@@ -0,0 +1,78 @@
+# --- 以合成棋盤格影像驗證相機校正 ---
+import cv2
+import numpy as np
+import pytest
+
+from calibration import Calibration, calibrate
+from measure_engine import MeasurementEngine
+
+PATTERN = (10, 7)    # 內角點數
+SQUARE_PX = 40
+SQUARE_MM = 10.0     # 每格 40 像素 -> 0.25 mm/px
+ORIGIN = (100, 80)
+SIZE = (640, 480)
+
+
+def chessboard(size=SIZE):
+    image = np.full((size[1], size[0]), 255, np.uint8)
+    x0, y0 = ORIGIN
+    for row in range(PATTERN[1] + 1):
+        for col in range(PATTERN[0] + 1):
+            if (row + col) % 2 == 0:
+                x, y = x0 + col * SQUARE_PX, y0 + row * SQUARE_PX
+                image[y:y + SQUARE_PX, x:x + SQUARE_PX] = 0
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+# 輕微的透視變形（模擬相機沒有正對量測平面）
+TILT = cv2.getPerspectiveTransform(np.float32([(0, 0), (640, 0), (640, 480), (0, 480)]),
+                                   np.float32([(20, 10), (610, 30), (630, 470), (5, 455)]))
+
+
+def tilted(image, border=255):
+    return cv2.warpPerspective(image, TILT, SIZE, flags=cv2.INTER_LINEAR, borderValue=(border,) * 3)
+
+
+def test_single_view_scale():
+    board = chessboard()
+    calibration = calibrate([board], PATTERN, SQUARE_MM, plane_image=board)
+    assert calibration.camera_matrix is None  # 少於 MIN_VIEWS 張只求 homography
+    assert calibration.mm_per_pixel() == pytest.approx(SQUARE_MM / SQUARE_PX, rel=1e-3)
+
+
+def test_plane_image_size_must_match():
+    board = chessboard()
+    with pytest.raises(ValueError):
+        calibrate([board], PATTERN, SQUARE_MM, plane_image=chessboard((800, 600)))
+    with pytest.raises(ValueError):
+        calibrate([board, chessboard((800, 600))], PATTERN, SQUARE_MM)
+
+
+def test_board_not_found():
+    with pytest.raises(ValueError):
+        calibrate([np.full((480, 640, 3), 255, np.uint8)], PATTERN, SQUARE_MM)
+
+
+def test_tilted_plane_measures_true_size():
+    calibration = calibrate([tilted(chessboard())], PATTERN, SQUARE_MM)
+    # 正對時 80x40 像素的零件（20 x 10 mm），與校正板一起傾斜
+    part = np.zeros((480, 640, 3), np.uint8)
+    part[200:240, 280:360] = 255
+    frame = tilted(part, border=0)
+    # 傾斜後零件在量測平面上略微旋轉，以精密模式的旋轉外接矩形比對實際尺寸
+    engine = MeasurementEngine(preprocess_steps=['Gray Conversion', 'Binary Threshold'], preprocess_parameters={},
+                               calibration=calibration, precision=True)
+    result = engine.measure(frame)
+    assert len(result) == 1
+    assert result.width_mm[0] == pytest.approx(20.0, abs=0.3)
+    assert result.height_mm[0] == pytest.approx(10.0, abs=0.3)
+    with pytest.raises(ValueError):
+        engine.measure(np.zeros((600, 800, 3), np.uint8))  # 與校正時的解析度不同
+
+
+def test_dict_round_trip():
+    calibration = calibrate([tilted(chessboard())], PATTERN, SQUARE_MM)
+    restored = Calibration.from_dict(calibration.to_dict())
+    points = np.array([(10.5, 20.0), (320.0, 240.0), (600.25, 470.0)])
+    np.testing.assert_allclose(restored.to_world(points), calibration.to_world(points))
+    assert restored.image_size == SIZE
@@ -0,0 +1,77 @@
+# --- IncrementalMeasurer 與完整量測比對 ---
+import numpy as np
+
+from incremental import IncrementalMeasurer
+from measure_engine import MeasurementEngine
+from synthetic import make_synthetic_frame
+
+
+def assert_same_result(result, expected):
+    np.testing.assert_array_equal(result.to_records(), expected.to_records())
+
+
+def canny(engine, threshold):
+    parameters = {step: dict(params) for step, params in engine.preprocess_parameters.items()}
+    parameters['Canny Edge Detection']['Threshold'] = str(threshold)
+    return engine.replace(preprocess_parameters=parameters)
+
+
+def test_only_changed_steps_are_recomputed():
+    frame, _ = make_synthetic_frame(320, 240, 15, seed=5)
+    engine = MeasurementEngine(pixel_to_mm_ratio=0.1)
+    measurer = IncrementalMeasurer(engine)
+    measurer.set_frame(frame)
+
+    assert_same_result(measurer.measure(), engine.measure(frame))
+    assert measurer.recomputed_steps == len(engine.preprocess_steps)
+    assert measurer.contours_changed
+
+    # 最後一步的參數：只重算 Canny
+    measurer.engine = engine = canny(engine, 80)
+    assert_same_result(measurer.measure(), engine.measure(frame))
+    assert measurer.recomputed_steps == 1
+
+    # 二值化閾值：從 Binary Threshold 開始重算（其後還有形態學與 Canny）
+    measurer.engine = engine = engine.replace(binary_threshold=100)
+    assert_same_result(measurer.measure(), engine.measure(frame))
+    assert measurer.recomputed_steps == 3
+
+    # 只改 min_area 與換算比例：不碰影像也不重新擷取輪廓
+    measurer.engine = engine = engine.replace(min_area=200, pixel_to_mm_ratio=0.2)
+    assert_same_result(measurer.measure(), engine.measure(frame))
+    assert measurer.recomputed_steps == 0
+    assert not measurer.contours_changed
+
+    # 改回 Canny 閾值：快取只保留目前這組參數，重算最後一步
+    measurer.engine = engine = canny(engine, 50)
+    assert_same_result(measurer.measure(), engine.measure(frame))
+    assert measurer.recomputed_steps == 1
+
+
+def test_new_frame_invalidates_cache():
+    engine = MeasurementEngine()
+    measurer = IncrementalMeasurer(engine)
+    first, _ = make_synthetic_frame(320, 240, 10, seed=1)
+    second, _ = make_synthetic_frame(320, 240, 10, seed=2)
+    measurer.set_frame(first)
+    measurer.measure()
+    measurer.set_frame(first.copy())  # 內容相同：沿用快取
+    measurer.measure()
+    assert measurer.recomputed_steps == 0
+    measurer.set_frame(second)
+    assert_same_result(measurer.measure(), engine.measure(second))
+    assert measurer.recomputed_steps == len(engine.preprocess_steps)
+
+
+def test_precision_mode_matches_engine():
+    frame, _ = make_synthetic_frame(320, 240, 8, seed=9)
+    engine = MeasurementEngine(pixel_to_mm_ratio=0.1)
+    measurer = IncrementalMeasurer(engine)
+    measurer.set_frame(frame)
+    measurer.measure()
+    measurer.engine = engine = engine.replace(precision=True)
+    result = measurer.measure()
+    expected = engine.measure(frame)
+    assert measurer.contours_changed  # 精密模式的輪廓另外快取
+    assert_same_result(result, expected)
+    np.testing.assert_array_equal(result.precise, expected.precise)
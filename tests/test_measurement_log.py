@@ -0,0 +1,98 @@
+# --- .pxlog 量測紀錄的寫入與讀取 ---
+import threading
+
+import numpy as np
+
+from measure_engine import MeasurementEngine
+from measurement_log import LOG_FIELDS, MeasurementLog, log_files, log_metadata, read_log, read_logs
+from synthetic import make_synthetic_frame
+from tracker import ObjectTracker
+
+
+def measured_frames(count, parts=6):
+    engine = MeasurementEngine(pixel_to_mm_ratio=0.1)
+    tracker = ObjectTracker()
+    frame, _ = make_synthetic_frame(320, 240, parts, seed=1)
+    results = []
+    for _ in range(count):
+        result = engine.measure(frame)
+        tracker.update(result)
+        results.append(result)
+    return results
+
+
+def test_round_trip(tmp_path):
+    results = measured_frames(5)
+    log = MeasurementLog(str(tmp_path), write_csv=True, batch_rows=8)
+    log.start()
+    for seq, result in enumerate(results):
+        log.append(seq, result, timestamp=1000.0 + seq)
+    log.stop()
+    assert log.last_error is None
+
+    rows = sum(len(result) for result in results)
+    data = read_logs(str(tmp_path))
+    assert log.rows_written == rows
+    assert sorted(data) == sorted(name for name, _ in LOG_FIELDS)
+    np.testing.assert_array_equal(data['seq'], np.repeat(np.arange(5), [len(r) for r in results]))
+    np.testing.assert_array_equal(data['timestamp'], 1000.0 + data['seq'])
+    np.testing.assert_array_equal(data['object_id'], np.concatenate([r.tracks['id'] for r in results]))
+    # 寬高與面積以檔案欄位的型別（float32）保存
+    for name in ('width_mm', 'height_mm', 'area'):
+        expected = np.concatenate([getattr(r, name) for r in results]).astype(data[name].dtype)
+        np.testing.assert_array_equal(data[name], expected)
+
+    # 時間範圍 [start, end) 與欄位篩選
+    window = read_logs(str(tmp_path), start=1001.0, end=1003.0, fields=['seq', 'height_mm'])
+    assert sorted(window) == ['height_mm', 'seq']
+    np.testing.assert_array_equal(np.unique(window['seq']), [1, 2])
+    assert len(read_logs(str(tmp_path), start=2000.0)['seq']) == 0
+
+    csv = tmp_path / (log_files(str(tmp_path))[0].rsplit('.', 1)[0] + '.csv')
+    assert len(csv.read_text(encoding='utf-8').splitlines()) == rows + 1
+    assert log_metadata(log.path)['frames_dropped'] == 0
+
+
+def test_rotation_and_truncated_chunk(tmp_path):
+    results = measured_frames(6)
+    log = MeasurementLog(str(tmp_path), rotate_bytes=1, batch_rows=1)
+    log.start()
+    for seq, result in enumerate(results):
+        log.append(seq, result, timestamp=2000.0 + seq)
+    log.stop()
+    paths = log_files(str(tmp_path))
+    assert len(paths) == log.chunks_written > 1
+    np.testing.assert_array_equal(np.unique(read_logs(paths)['seq']), np.arange(6))
+
+    # 寫到一半的最後一塊被忽略，前面的資料仍可讀取
+    with open(paths[0], 'r+b') as f:
+        f.seek(0, 2)
+        f.truncate(f.tell() - 3)
+    assert len(read_log(paths[0])['seq']) == 0
+    assert len(read_logs(paths)['seq']) == sum(len(r) for r in results[1:])
+
+
+def test_frames_dropped_recorded_in_header(tmp_path):
+    results = measured_frames(11)
+    log = MeasurementLog(str(tmp_path), batch_rows=1, queue_frames=2)
+    entered, release = threading.Event(), threading.Event()
+    write_chunk = log._write_chunk
+
+    # 第一塊寫入時卡住寫入執行緒，之後加入的影像只能留在容量 2 的佇列中
+    def blocked_write(columns):
+        entered.set()
+        release.wait(5)
+        write_chunk(columns)
+
+    log._write_chunk = blocked_write
+    log.start()
+    log.append(0, results[0], timestamp=3000.0)
+    assert entered.wait(5)
+    for seq, result in enumerate(results[1:], 1):
+        log.append(seq, result, timestamp=3000.0 + seq)
+    release.set()
+    log.stop()
+
+    assert log.frames_dropped == 8
+    assert log_metadata(log.path)['frames_dropped'] == 8
+    np.testing.assert_array_equal(np.unique(read_logs(str(tmp_path))['seq']), [0, 9, 10])
@@ -0,0 +1,94 @@
+# --- 產品設定檔的驗證與版本 ---
+import json
+import os
+
+import numpy as np
+import pytest
+
+from measure_engine import MeasurementEngine, RegionOfInterest
+from profiles import PROFILE_SCHEMA, ProfileError, ProfileStore, check_product_code, validate_config
+from synthetic import make_synthetic_frame
+
+
+def valid_config():
+    return MeasurementEngine(pixel_to_mm_ratio=0.05).to_config()
+
+
+@pytest.mark.parametrize('change', [
+    {'preprocess_steps': ['Gray Conversion', 'Sharpen']},
+    {'preprocess_steps': ['Gray Conversion', 'Gray Conversion']},
+    {'preprocess_parameters': {'Gaussian Blur': {'Kernel Size': '4'}}},
+    {'preprocess_parameters': {'Gaussian Blur': {'Kernel Size': 'big'}}},
+    {'preprocess_parameters': {'Canny Edge Detection': {'Threshold': '300'}}},
+    {'preprocess_parameters': {'Canny Edge Detection': {'Sigma': '1'}}},
+    {'binary_threshold': 256},
+    {'binary_threshold': True},
+    {'min_area': -1},
+    {'pixel_to_mm_ratio': 0},
+    {'precision': 'yes'},
+    {'calibration': {'image_size': [640, 480]}},
+    {'rois': [{'x': 0, 'y': 0, 'w': 0, 'h': 10}]},
+    {'rois': [{'x': 0, 'y': 0, 'w': 10, 'h': 10, 'config': {'binary_threshold': -1}}]},
+])
+def test_invalid_config_is_rejected(change):
+    config = valid_config()
+    config.update(change)
+    with pytest.raises(ProfileError):
+        validate_config(config)
+
+
+def test_valid_config_passes():
+    config = valid_config()
+    assert validate_config(config)['preprocess_steps'] == config['preprocess_steps']
+    assert issubclass(ProfileError, ValueError)
+
+
+@pytest.mark.parametrize('code', ['', '-A', 'A/B', '../x', 'A' * 65, None])
+def test_invalid_product_code(code):
+    with pytest.raises(ProfileError):
+        check_product_code(code)
+
+
+def test_versions_round_trip(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    first = MeasurementEngine(pixel_to_mm_ratio=0.05, min_area=80)
+    second = first.replace(binary_threshold=90, rois=[RegionOfInterest(10, 20, 200, 100, name='left')])
+    assert store.save('A-1024', first, name='初版') == 1
+    assert store.save('A-1024', second) == 2
+    assert store.save('B-7', first) == 1
+    assert store.versions('A-1024') == [1, 2]
+    assert store.codes() == ['A-1024', 'B-7']
+
+    # 重新開啟（沒有記憶體快取），從檔案讀回
+    reopened = ProfileStore(str(tmp_path))
+    assert reopened.index['A-1024']['version'] == 2
+    assert reopened.load_config('A-1024') == validate_config(second.to_config())
+    assert reopened.load_config('A-1024', version=1) == validate_config(first.to_config())
+
+    frame, _ = make_synthetic_frame(320, 240, 10, seed=4)
+    for version, engine in ((1, first), (2, second), (None, second)):
+        loaded = reopened.engine('A-1024', version)
+        np.testing.assert_array_equal(loaded.measure(frame).to_records(), engine.measure(frame).to_records())
+    assert reopened.preload() == {}
+
+
+def test_broken_files_raise_profile_error(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.save('A', MeasurementEngine())
+    store.save('B', MeasurementEngine())
+    with pytest.raises(ProfileError):
+        store.engine('missing')
+
+    with open(tmp_path / 'A.v1.json', 'w', encoding='utf-8') as f:
+        f.write('{not json')
+    path = tmp_path / 'B.v1.json'
+    data = json.loads(path.read_text(encoding='utf-8'))
+    data['schema'] = PROFILE_SCHEMA + 1
+    path.write_text(json.dumps(data), encoding='utf-8')
+
+    reopened = ProfileStore(str(tmp_path))
+    with pytest.raises(ProfileError):
+        reopened.load_config('A')
+    errors = reopened.preload()
+    assert sorted(errors) == ['A', 'B']
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
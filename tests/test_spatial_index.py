@@ -0,0 +1,74 @@
+# --- ContourIndex 與暴力搜尋比對 ---
+import numpy as np
+import pytest
+
+from spatial_index import ContourIndex, points_in_polygon
+
+
+# 隨機矩形輪廓（可互相重疊、大小差異大，讓輪廓跨越多個格子）
+def random_contours(rng, n, width=640, height=480):
+    contours = []
+    for _ in range(n):
+        w, h = rng.integers(2, 120, 2)
+        x, y = rng.integers(0, width - w), rng.integers(0, height - h)
+        corners = [(x, y), (x + w - 1, y), (x + w - 1, y + h - 1), (x, y + h - 1)]
+        contours.append(np.array(corners, np.int32).reshape(-1, 1, 2))
+    return contours
+
+
+def brute_rect(index, x0, y0, x1, y1, contained):
+    if contained:
+        keep = (index.x >= x0) & (index.x1 <= x1) & (index.y >= y0) & (index.y1 <= y1)
+    else:
+        keep = (index.x <= x1) & (index.x1 >= x0) & (index.y <= y1) & (index.y1 >= y0)
+    return np.flatnonzero(keep)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_query_rect_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    index = ContourIndex(random_contours(rng, 80))
+    for _ in range(30):
+        x0, x1 = sorted(rng.integers(-20, 660, 2))
+        y0, y1 = sorted(rng.integers(-20, 500, 2))
+        for contained in (True, False):
+            found = index.query_rect(x0, y0, x1, y1, contained)
+            assert len(np.unique(found)) == len(found)
+            np.testing.assert_array_equal(found, brute_rect(index, x0, y0, x1, y1, contained))
+
+
+def test_single_row_query_has_no_duplicates():
+    # 同一列內跨越多格的輪廓只能回傳一次
+    contour = np.array([(0, 0), (99, 0), (99, 9), (0, 9)], np.int32).reshape(-1, 1, 2)
+    index = ContourIndex([contour], cell_size=16)
+    np.testing.assert_array_equal(index.query_rect(0, 0, 120, 10, contained=False), [0])
+    np.testing.assert_array_equal(index.query_rect(0, 0, 120, 10, contained=True), [0])
+
+
+def test_hit_test_returns_smallest_containing_box():
+    rng = np.random.default_rng(7)
+    index = ContourIndex(random_contours(rng, 60))
+    for px, py in rng.integers(0, 480, (200, 2)):
+        inside = np.flatnonzero((index.x <= px) & (px <= index.x1) & (index.y <= py) & (py <= index.y1))
+        hit = index.hit_test(int(px), int(py))
+        if len(inside) == 0:
+            assert hit is None
+        else:
+            areas = index.w[inside].astype(np.int64) * index.h[inside]
+            assert hit == inside[np.argmin(areas)]
+
+
+def test_query_lasso_matches_brute_force():
+    rng = np.random.default_rng(11)
+    index = ContourIndex(random_contours(rng, 100))
+    polygon = np.array([(50, 40), (500, 80), (600, 420), (300, 300), (80, 450)], np.float64)
+    centers_x = index.x + index.w / 2.0
+    centers_y = index.y + index.h / 2.0
+    expected = np.flatnonzero(points_in_polygon(centers_x, centers_y, polygon))
+    np.testing.assert_array_equal(index.query_lasso(polygon), expected)
+
+
+def test_empty_index():
+    index = ContourIndex([])
+    assert index.hit_test(5, 5) is None
+    assert len(index.query_rect(0, 0, 100, 100)) == 0
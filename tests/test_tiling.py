@@ -0,0 +1,71 @@
+# --- 分塊處理與整張處理比對 ---
+import cv2
+import numpy as np
+import pytest
+
+from measure_engine import DEFAULT_PREPROCESS_STEPS, MeasurementEngine, find_contours
+from synthetic import make_synthetic_frame
+from tiling import TiledProcessor
+
+PIPELINES = [
+    DEFAULT_PREPROCESS_STEPS,                                  # Canny 在二值影像上，可分塊
+    ['Gray Conversion', 'Gaussian Blur', 'Binary Threshold', 'Morphological Operations'],
+    ['Gray Conversion', 'Gaussian Blur', 'Canny Edge Detection'],   # Canny 需整張執行
+]
+
+
+@pytest.fixture(scope='module')
+def tiler():
+    tiler = TiledProcessor(workers=3, tile_size=100, min_pixels=0)
+    yield tiler
+    tiler.close()
+
+
+# 合成零件再加上跨越多個區塊接縫的大型與巢狀輪廓
+def seam_frame(seed):
+    frame, _ = make_synthetic_frame(640, 480, 40, seed=seed)
+    rng = np.random.default_rng(seed)
+    for _ in range(4):
+        x, y = rng.integers(0, 540), rng.integers(0, 380)
+        w, h = rng.integers(60, 220, 2)
+        cv2.rectangle(frame, (int(x), int(y)), (int(x + w), int(y + h)), (230, 230, 230), 3)
+        cv2.circle(frame, (int(x + w // 2), int(y + h // 2)), int(min(w, h) // 4), (250, 250, 250), -1)
+    return frame
+
+
+@pytest.mark.parametrize('steps', PIPELINES)
+@pytest.mark.parametrize('seed', range(3))
+def test_tiled_matches_whole_image(tiler, steps, seed):
+    frame = seam_frame(seed)
+    engine = MeasurementEngine(preprocess_steps=list(steps), pixel_to_mm_ratio=0.1)
+    whole_image = engine.pipeline.run(frame)
+    expected = engine.measure(frame)
+
+    np.testing.assert_array_equal(tiler.preprocess(frame, engine.pipeline), whole_image)
+    contours = tiler.find_contours(whole_image, engine.contour_approx)
+    reference = find_contours(whole_image, approx=engine.contour_approx)
+    assert len(contours) == len(reference)
+    for contour, other in zip(contours, reference):
+        np.testing.assert_array_equal(contour, other)
+
+    engine.tiler = tiler
+    np.testing.assert_array_equal(engine.measure(frame).to_records(), expected.to_records())
+
+
+def test_tiled_precision_matches_whole_image(tiler):
+    frame = seam_frame(5)
+    engine = MeasurementEngine(pixel_to_mm_ratio=0.1, precision=True)
+    expected = engine.measure(frame)
+    engine.tiler = tiler
+    result = engine.measure(frame)
+    np.testing.assert_array_equal(result.to_records(), expected.to_records())
+    np.testing.assert_array_equal(result.precise, expected.precise)
+
+
+def test_small_frames_are_not_tiled():
+    tiler = TiledProcessor(workers=1, min_pixels=640 * 480 + 1)
+    try:
+        assert not tiler.applies(np.zeros((480, 640, 3), np.uint8))
+        assert tiler.applies(np.zeros((481, 640, 3), np.uint8))
+    finally:
+        tiler.close()
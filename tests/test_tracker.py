@@ -0,0 +1,133 @@
+# --- 物件追蹤與靜止物件沿用 ---
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from measure_engine import MeasurementEngine, StaticReuse
+from synthetic import make_synthetic_frame
+from tracker import ObjectTracker, box_iou, greedy_assignment
+
+STEPS = ['Gray Conversion', 'Binary Threshold']
+
+
+def draw_parts(parts, dx=0, skip=(), size=(640, 480)):
+    frame = np.zeros((size[1], size[0], 3), np.uint8)
+    for k, (x, y, w, h) in enumerate(parts.tolist()):
+        if k not in skip:
+            cv2.rectangle(frame, (x + dx, y), (x + dx + w - 1, y + h - 1), (255, 255, 255), -1)
+    return frame
+
+
+# 每列結果對應到哪個零件（以外接矩形左上角比對）
+def part_of_rows(result, parts, dx=0, skip=()):
+    lookup = {(x + dx, y): k for k, (x, y, _, _) in enumerate(parts.tolist()) if k not in skip}
+    return [lookup[(x, y)] for x, y in zip(result.x.tolist(), result.y.tolist())]
+
+
+@pytest.fixture
+def parts():
+    # 零件彼此至少相隔 8 像素，往右移動時不會相連
+    _, parts = make_synthetic_frame(560, 480, 20, seed=2, noise=0)
+    return parts
+
+
+def test_ids_stable_while_moving(parts):
+    engine = MeasurementEngine(preprocess_steps=STEPS, pixel_to_mm_ratio=0.1)
+    tracker = ObjectTracker()
+    ids = {}
+    for step in range(12):
+        dx = 5 * step
+        result = engine.measure(draw_parts(parts, dx))
+        tracks = tracker.update(result)
+        assert len(result) == len(parts)
+        for k, track_id in zip(part_of_rows(result, parts, dx), tracks['id'].tolist()):
+            assert ids.setdefault(k, track_id) == track_id
+    assert len(set(ids.values())) == len(parts)
+    assert tracker.count == len(parts)
+    assert (tracks['hits'] == 12).all()
+    # 寬高不變，平滑值等於單張量測值
+    np.testing.assert_allclose(tracks['width_mean'], result.width_mm)
+    np.testing.assert_allclose(tracks['width_std'], 0, atol=1e-12)
+
+
+def test_missing_objects_expire(parts):
+    engine = MeasurementEngine(preprocess_steps=STEPS)
+    tracker = ObjectTracker(max_missed=2)
+    first = dict(zip(part_of_rows(engine.measure(draw_parts(parts)), parts),
+                     tracker.update(engine.measure(draw_parts(parts)))['id'].tolist()))
+    # 零件 0 消失兩張後回來：仍是同一個 ID；零件 1 消失三張：給新的 ID
+    for gone in ({0, 1}, {0, 1}, {1}):
+        tracker.update(engine.measure(draw_parts(parts, skip=gone)))
+    result = engine.measure(draw_parts(parts))
+    latest = dict(zip(part_of_rows(result, parts), tracker.update(result)['id'].tolist()))
+    assert latest[0] == first[0]
+    assert latest[1] not in first.values()
+    assert all(latest[k] == first[k] for k in range(2, len(parts)))
+
+
+def test_box_iou_and_assignment():
+    a = np.array([[0, 0, 10, 10], [20, 20, 10, 10]], np.float64)
+    b = np.array([[20, 20, 10, 10], [5, 0, 10, 10]], np.float64)
+    np.testing.assert_allclose(box_iou(a, b), [[0, 50 / 150], [1, 0]])
+    rows, cols = greedy_assignment(np.array([[0.1, 0.2], [0.05, np.inf]]))
+    assert sorted(zip(rows.tolist(), cols.tolist())) == [(0, 1), (1, 0)]
+
+
+def test_static_reuse_matches_full_measurement(parts):
+    engine = MeasurementEngine(preprocess_steps=STEPS, pixel_to_mm_ratio=0.1, precision=True)
+    reusing = engine.replace()
+    reusing.static_reuse = StaticReuse()
+    still = draw_parts(parts)
+    moved = still.copy()
+    x, y, w, h = parts[0].tolist()
+    moved[y:y + h, x:x + w] = 0
+    cv2.rectangle(moved, (x + 2, y), (x + w + 1, y + h - 1), (255, 255, 255), -1)
+
+    reusing.measure(still)
+    for frame in (still, moved):
+        result = reusing.measure(frame)
+        expected = engine.measure(frame)
+        np.testing.assert_array_equal(result.to_records(), expected.to_records())
+        np.testing.assert_array_equal(result.precise, expected.precise)
+    # 只有移動的零件重新量測
+    moving = np.flatnonzero(~result.static)
+    assert len(moving) == 1
+    assert (result.x[moving[0]], result.y[moving[0]]) == (x + 2, y)
+
+
+# 比對後暫停，讓其他執行緒在這段期間更新參考
+class SlowMatch(StaticReuse):
+    def match(self, *args):
+        matched = super().match(*args)
+        time.sleep(0.005)
+        return matched
+
+
+def test_static_reuse_is_consistent_across_threads(parts):
+    engine = MeasurementEngine(preprocess_steps=STEPS, pixel_to_mm_ratio=0.1, precision=True)
+    # 第二張少了前幾個零件，其餘零件位置不變但列號不同：比對與沿用若用到不同的參考，會套錯零件的寬高
+    frames = [draw_parts(parts), draw_parts(parts, skip={0, 1, 2})]
+    expected = [engine.measure(frame).to_records() for frame in frames]
+    reusing = engine.replace()
+    reusing.static_reuse = SlowMatch()
+    failures = []
+
+    def worker(offset):
+        for i in range(30):
+            k = (i + offset) % 2
+            try:
+                same = np.array_equal(reusing.measure(frames[k]).to_records(), expected[k])
+            except IndexError:
+                same = False
+            if not same:
+                failures.append(k)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
@@ -0,0 +1,144 @@
+# --- 分塊平行處理（超大影像） ---
+# 把影像切成互相重疊的區塊，前處理與 findContours 在 thread pool 中平行執行（OpenCV 運算會釋放 GIL）：
+#   - 前處理：重疊寬度（halo）為各步驟影響半徑的總和（pipeline.stage_halo），每個區塊只把中心部分寫回，
+#     拼出的影像與整張一次處理逐像素相同；需要整張影像的步驟（非二值輸入的 Canny）在拼回後整張執行
+#   - 輪廓：沒碰到接縫的輪廓直接採用；碰到接縫的輪廓依外接矩形合併成群組（連同落在群組範圍內的其他輪廓），
+#     在拼好的影像上只對群組範圍重新擷取，最後依整張 findContours 的順序排列
+# 輪廓的點序列與順序都與整張處理相同，量測結果完全一致。
+#
+#     engine.tiler = TiledProcessor(workers=8)
+#     result = engine.measure(frame)   # 小於 min_pixels 的影像仍整張處理
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from measure_engine import find_contours
+
+DEFAULT_TILE_SIZE = 1024
+DEFAULT_MIN_PIXELS = 4_000_000  # 小於此像素數的影像整張處理，分塊的額外成本不划算
+
+
+# a、b 為 (n, 4) 的 [x0, y0, x1, y1)；回傳 (len(a), len(b)) 的矩陣，a 往外擴 pad 像素後與 b 有交集者為 True
+def _overlap_matrix(a, b, pad=1):
+    return ((a[:, None, 0] - pad < b[None, :, 2]) & (a[:, None, 2] + pad > b[None, :, 0]) &
+            (a[:, None, 1] - pad < b[None, :, 3]) & (a[:, None, 3] + pad > b[None, :, 1]))
+
+
+# --- 合併相鄰或重疊的矩形，直到任兩個結果之間都不相鄰 ---
+# 以相鄰矩陣求連通元件（每個矩形反覆取相鄰者中最小的編號），合併後的外接矩形可能又碰到別的群組，重複到穩定
+def merge_rects(rects):
+    rects = np.asarray(rects, np.int64).reshape(-1, 4)
+    while len(rects) > 1:
+        adjacent = _overlap_matrix(rects, rects)
+        labels = np.arange(len(rects))
+        while True:
+            updated = np.where(adjacent, labels[None, :], len(rects)).min(axis=1)
+            updated = updated[updated]
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+        roots, group = np.unique(labels, return_inverse=True)
+        if len(roots) == len(rects):
+            break
+        merged = np.empty((len(roots), 4), np.int64)
+        merged[:, :2] = np.iinfo(np.int64).max
+        merged[:, 2:] = np.iinfo(np.int64).min
+        np.minimum.at(merged[:, 0], group, rects[:, 0])
+        np.minimum.at(merged[:, 1], group, rects[:, 1])
+        np.maximum.at(merged[:, 2], group, rects[:, 2])
+        np.maximum.at(merged[:, 3], group, rects[:, 3])
+        rects = merged
+    return rects
+
+
+class TiledProcessor:
+    def __init__(self, workers=None, tile_size=DEFAULT_TILE_SIZE, min_pixels=DEFAULT_MIN_PIXELS):
+        self.workers = workers or os.cpu_count() or 1
+        self.tile_size = tile_size
+        self.min_pixels = min_pixels
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='tile')
+
+    def applies(self, frame):
+        return frame.shape[0] * frame.shape[1] >= self.min_pixels
+
+    # 區塊中心（不含重疊）的 [x0, y0, x1, y1)，大小平均分配
+    def tiles(self, shape):
+        height, width = shape[:2]
+        xs = np.linspace(0, width, max(1, -(-width // self.tile_size)) + 1).astype(int)
+        ys = np.linspace(0, height, max(1, -(-height // self.tile_size)) + 1).astype(int)
+        return [(xs[i], ys[j], xs[i + 1], ys[j + 1]) for j in range(len(ys) - 1) for i in range(len(xs) - 1)]
+
+    # --- 分塊前處理；傳入 pool 時輸出寫入池中的緩衝區（下一次呼叫會被覆寫） ---
+    def preprocess(self, frame, pipeline, pool=None):
+        local, rest, halo = pipeline.split_local()
+        height, width = frame.shape[:2]
+        shape = frame.shape[:2] if local.single_channel_output(frame) else frame.shape
+        out = pool.get(shape, frame.dtype, ('tiled', 0)) if pool is not None else np.empty(shape, frame.dtype)
+
+        def run_tile(core):
+            x0, y0, x1, y1 = core
+            hx0, hy0 = max(x0 - halo, 0), max(y0 - halo, 0)
+            hx1, hy1 = min(x1 + halo, width), min(y1 + halo, height)
+            processed = local.run(frame[hy0:hy1, hx0:hx1])
+            out[y0:y1, x0:x1] = processed[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+
+        list(self._executor.map(run_tile, self.tiles(frame.shape)))
+        return rest.run(out) if rest.stages else out
+
+    # 擷取區塊中心內的輪廓，分成「完整」與「碰到接縫」兩類（後者只回傳外接矩形）
+    def _trace_tile(self, binary, core, approx):
+        height, width = binary.shape[:2]
+        x0, y0, x1, y1 = core
+        contours = find_contours(binary[y0:y1, x0:x1], offset=(x0, y0), approx=approx)
+        inner, inner_rects, seam_rects = [], [], []
+        for contour in contours:
+            bx, by, bw, bh = cv2.boundingRect(contour)
+            rect = (bx, by, bx + bw, by + bh)
+            if ((bx == x0 and x0 > 0) or (by == y0 and y0 > 0) or
+                    (bx + bw == x1 and x1 < width) or (by + bh == y1 and y1 < height)):
+                seam_rects.append(rect)
+            else:
+                inner.append(contour)
+                inner_rects.append(rect)
+        return inner, inner_rects, seam_rects
+
+    # --- 分塊擷取外輪廓，結果與 measure_engine.find_contours 整張處理相同 ---
+    def find_contours(self, binary, approx=cv2.CHAIN_APPROX_SIMPLE):
+        height, width = binary.shape[:2]
+        traced = list(self._executor.map(lambda core: self._trace_tile(binary, core, approx),
+                                         self.tiles(binary.shape)))
+        inner = [contour for contours, _, _ in traced for contour in contours]
+        inner_rects = np.array([rect for _, rects, _ in traced for rect in rects], np.int64).reshape(-1, 4)
+        seeds = np.array([rect for _, _, rects in traced for rect in rects], np.int64).reshape(-1, 4)
+
+        # 群組範圍（往外擴 1 像素）內的其他輪廓也併入群組並重新擷取：
+        # 重新擷取的範圍內只會有完整的輪廓，外層輪廓包住內層時的取捨也與整張處理相同
+        absorbed = np.zeros(len(inner_rects), bool)
+        groups = merge_rects(seeds)
+        while len(groups):
+            hit = _overlap_matrix(groups, inner_rects).any(axis=0) & ~absorbed
+            if not hit.any():
+                break
+            absorbed |= hit
+            groups = merge_rects(np.concatenate([groups, inner_rects[hit]]))
+
+        # 群組平均分給各 worker，每個 worker 依序擷取自己的群組
+        def trace_groups(batch):
+            traced = []
+            for gx0, gy0, gx1, gy1 in batch.tolist():
+                x0, y0, x1, y1 = max(gx0 - 1, 0), max(gy0 - 1, 0), min(gx1 + 1, width), min(gy1 + 1, height)
+                traced.extend(find_contours(binary[y0:y1, x0:x1], offset=(x0, y0), approx=approx))
+            return traced
+
+        contours = [contour for contour, taken in zip(inner, absorbed) if not taken]
+        for group_contours in self._executor.map(trace_groups, np.array_split(groups, self.workers)):
+            contours.extend(group_contours)
+
+        # findContours 依起點（最上方最左邊的點）的掃描順序由後往前排列
+        starts = np.array([contour[0, 0, 1] * width + contour[0, 0, 0] for contour in contours], np.int64)
+        return tuple(contours[i] for i in np.argsort(-starts, kind='stable'))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,200 @@
+# --- 跨影格的輪廓追蹤 ---
+# 以外接矩形 IoU（移動較快時退回中心距離）比對前後影格的輪廓，貪婪指派後給每個物件穩定的 ID。
+# 每個物件的寬高（mm）存在固定長度的環狀緩衝區，所有物件共用一個 (容量, history, 2) 陣列，
+# 平均 / 標準差 / 最小 / 最大值一次向量化算出，顯示端改用平滑後的數值。
+# 靜止的物件（量測引擎的 StaticReuse 沿用上一張量測，result.static）標記為 static，其數值仍照常加入統計。
+# 每個物件只計數一次：設定 count_line 時於中心越過計數線時計數，否則於連續出現 min_hits 張後計數。
+#
+#     tracker = ObjectTracker()
+#     tracks = tracker.update(result)   # 與 result 各列對應的結構化陣列，也會存到 result.tracks
+import numpy as np
+
+DEFAULT_IOU_THRESHOLD = 0.3
+DEFAULT_MAX_DISTANCE = 40.0  # 像素；IoU 不足時中心距離在此範圍內仍視為同一物件
+DEFAULT_MAX_MISSED = 5       # 連續幾張沒有對應到就移除
+DEFAULT_MIN_HITS = 3
+DEFAULT_HISTORY = 32
+
+TRACK_DTYPE = [('id', np.int64), ('hits', np.int32), ('static', np.bool_),
+               ('width_mean', np.float64), ('width_std', np.float64),
+               ('width_min', np.float64), ('width_max', np.float64),
+               ('height_mean', np.float64), ('height_std', np.float64),
+               ('height_min', np.float64), ('height_max', np.float64)]
+
+
+# --- 兩組外接矩形 (x, y, w, h) 的 IoU 矩陣 ---
+def box_iou(a, b):
+    ax0, ay0 = a[:, 0:1], a[:, 1:2]
+    ax1, ay1 = ax0 + a[:, 2:3], ay0 + a[:, 3:4]
+    bx0, by0 = b[:, 0], b[:, 1]
+    bx1, by1 = bx0 + b[:, 2], by0 + b[:, 3]
+    iw = np.clip(np.minimum(ax1, bx1) - np.maximum(ax0, bx0), 0, None)
+    ih = np.clip(np.minimum(ay1, by1) - np.maximum(ay0, by0), 0, None)
+    inter = iw * ih
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+# --- 貪婪指派：由成本最低的配對開始，每列 / 每行只用一次 ---
+# cost 中 np.inf 表示不可配對；回傳 (列索引, 行索引)
+def greedy_assignment(cost):
+    if cost.size == 0:
+        return np.zeros(0, np.intp), np.zeros(0, np.intp)
+    flat = np.flatnonzero(np.isfinite(cost))
+    flat = flat[np.argsort(cost.ravel()[flat], kind='stable')]
+    rows, cols = np.divmod(flat, cost.shape[1])
+    used_rows = np.zeros(cost.shape[0], bool)
+    used_cols = np.zeros(cost.shape[1], bool)
+    keep = []
+    for k, (r, c) in enumerate(zip(rows.tolist(), cols.tolist())):
+        if not used_rows[r] and not used_cols[c]:
+            used_rows[r] = used_cols[c] = True
+            keep.append(k)
+    return rows[keep], cols[keep]
+
+
+class Track:
+    __slots__ = ('id', 'slot', 'box', 'centroid', 'velocity', 'hits', 'missed', 'counted', 'static')
+
+    def __init__(self, track_id, slot, box):
+        self.id = track_id
+        self.slot = slot          # 在共用環狀緩衝區中的位置
+        self.box = box            # (x, y, w, h)
+        self.centroid = (box[0] + box[2] / 2.0, box[1] + box[3] / 2.0)
+        self.velocity = (0.0, 0.0)
+        self.hits = 1
+        self.missed = 0
+        self.counted = False
+        self.static = False       # 這一張沿用上一張的量測
+
+    # 依速度預測下一張的外接矩形
+    def predicted_box(self):
+        x, y, w, h = self.box
+        return (x + self.velocity[0], y + self.velocity[1], w, h)
+
+
+class ObjectTracker:
+    def __init__(self, iou_threshold=DEFAULT_IOU_THRESHOLD, max_distance=DEFAULT_MAX_DISTANCE,
+                 max_missed=DEFAULT_MAX_MISSED, min_hits=DEFAULT_MIN_HITS, history=DEFAULT_HISTORY,
+                 count_line=None):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.history = history
+        self.count_line = count_line  # ('x' 或 'y', 座標)；None 表示確認追蹤後即計數
+        self.reset()
+
+    def reset(self):
+        self.tracks = []
+        self.count = 0
+        self._next_id = 1
+        self._samples = np.full((16, self.history, 2), np.nan)  # 每個物件的 (寬, 高) 環狀緩衝區
+        self._cursor = np.zeros(16, np.intp)
+        self._free = list(range(15, -1, -1))
+
+    def _allocate_slot(self):
+        if not self._free:
+            capacity = len(self._samples)
+            self._samples = np.concatenate([self._samples, np.full_like(self._samples, np.nan)])
+            self._cursor = np.concatenate([self._cursor, np.zeros(capacity, np.intp)])
+            self._free = list(range(2 * capacity - 1, capacity - 1, -1))
+        slot = self._free.pop()
+        self._samples[slot] = np.nan
+        self._cursor[slot] = 0
+        return slot
+
+    def _push(self, slot, width, height):
+        self._samples[slot, self._cursor[slot] % self.history] = (width, height)
+        self._cursor[slot] += 1
+
+    def _crossed(self, before, after):
+        axis = 0 if self.count_line[0] == 'x' else 1
+        position = self.count_line[1]
+        return (before[axis] - position) * (after[axis] - position) <= 0 and before[axis] != after[axis]
+
+    # --- 以一張影像的量測結果更新追蹤；回傳與 result 各列對應的 TRACK_DTYPE 陣列 ---
+    def update(self, result):
+        n = len(result)
+        boxes = np.stack([result.x, result.y, result.w, result.h], axis=1).astype(np.float64)
+        centers = boxes[:, :2] + boxes[:, 2:] / 2.0
+        tracks = self.tracks
+
+        rows = cols = np.zeros(0, np.intp)
+        if tracks and n:
+            predicted = np.array([t.predicted_box() for t in tracks], np.float64)
+            iou = box_iou(predicted, boxes)
+            predicted_centers = predicted[:, :2] + predicted[:, 2:] / 2.0
+            distance = np.hypot(*(predicted_centers[:, None, :] - centers[None, :, :]).transpose(2, 0, 1))
+            # IoU 足夠者成本為 1 - IoU；否則以中心距離排在所有 IoU 配對之後
+            cost = np.where(iou >= self.iou_threshold, 1.0 - iou, 1.0 + distance / self.max_distance)
+            cost[(iou < self.iou_threshold) & (distance > self.max_distance)] = np.inf
+            rows, cols = greedy_assignment(cost)
+
+        assigned = np.full(n, -1, np.intp)
+        matched_tracks = np.zeros(len(tracks), bool)
+        assigned[cols] = rows
+        matched_tracks[rows] = True
+
+        box_list = result.x.tolist(), result.y.tolist(), result.w.tolist(), result.h.tolist()
+        widths, heights = result.width_mm.tolist(), result.height_mm.tolist()
+        static = result.static.tolist() if result.static is not None else [False] * n
+        row_tracks = []
+        for i, box in enumerate(zip(*box_list)):
+            if assigned[i] >= 0:
+                track = tracks[assigned[i]]
+                before = track.centroid
+                track.centroid = (box[0] + box[2] / 2.0, box[1] + box[3] / 2.0)
+                track.velocity = (track.centroid[0] - before[0], track.centroid[1] - before[1])
+                track.hits += 1
+                track.missed = 0
+                track.static = static[i]
+                self._push(track.slot, widths[i], heights[i])  # 靜止時也加入，平滑值持續更新
+                track.box = box
+                if not track.counted and self.count_line is not None and self._crossed(before, track.centroid):
+                    track.counted = True
+                    self.count += 1
+            else:
+                track = Track(self._next_id, self._allocate_slot(), box)
+                self._next_id += 1
+                self._push(track.slot, widths[i], heights[i])
+                tracks.append(track)
+            if not track.counted and self.count_line is None and track.hits >= self.min_hits:
+                track.counted = True
+                self.count += 1
+            row_tracks.append(track)
+
+        # 沒有對應到的物件累計遺失次數，超過上限即移除並釋放緩衝區
+        survivors = []
+        for k, track in enumerate(tracks):
+            if k < len(matched_tracks) and not matched_tracks[k]:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    self._free.append(track.slot)
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        result.tracks = self._statistics(row_tracks)
+        return result.tracks
+
+    # 向量化計算各列物件的統計值
+    def _statistics(self, row_tracks):
+        stats = np.zeros(len(row_tracks), TRACK_DTYPE)
+        if not row_tracks:
+            return stats
+        slots = np.fromiter((t.slot for t in row_tracks), np.intp, len(row_tracks))
+        stats['id'] = [t.id for t in row_tracks]
+        stats['hits'] = [t.hits for t in row_tracks]
+        stats['static'] = [t.static for t in row_tracks]
+        samples = self._samples[slots]  # (列數, history, 2)，未填滿的位置為 NaN
+        mean = np.nanmean(samples, axis=1)
+        std = np.nanstd(samples, axis=1)
+        low = np.nanmin(samples, axis=1)
+        high = np.nanmax(samples, axis=1)
+        for axis, name in enumerate(('width', 'height')):
+            stats[name + '_mean'] = mean[:, axis]
+            stats[name + '_std'] = std[:, axis]
+            stats[name + '_min'] = low[:, axis]
+            stats[name + '_max'] = high[:, axis]
+        return stats
@@ -0,0 +1,115 @@
+# --- 串流影像顯示面板 ---
+# 直接以 wx.Bitmap 顯示 numpy RGB 影像，取代每張影像都重建 matplotlib 圖表的做法。
+# submit_frame 可由任何執行緒呼叫：只把影像複製進預先配置的緩衝區並以 wx.CallAfter
+# 通知 GUI 執行緒，不會等待繪製完成；GUI 來不及畫時只保留最新一張（latest-frame-wins）。
+import threading
+import time
+
+import numpy as np
+import wx
+
+
+class VideoPanel(wx.Panel):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.SetBackgroundColour(wx.BLACK)
+
+        self._lock = threading.Lock()
+        self._incoming = None    # 擷取執行緒寫入的緩衝區
+        self._displayed = None   # GUI 執行緒正在顯示的緩衝區
+        self._has_new_frame = False
+        self._scheduled = False  # 是否已排入 wx.CallAfter
+
+        self._bitmap = None
+        self._frame_size = None  # (寬, 高)，改變時才重建 bitmap 與版面
+        self._placement = None   # (縮放比例, x 偏移, y 偏移)
+
+        self.frames_submitted = 0
+        self.frames_shown = 0
+        self.profiler = None  # 設定 StageProfiler 後記錄 GUI 執行緒更新 bitmap 與繪製的耗時
+
+        self.Bind(wx.EVT_PAINT, self.on_paint)
+        self.Bind(wx.EVT_SIZE, self.on_size)
+
+    # --- 由擷取 / 處理執行緒呼叫 ---
+    def submit_frame(self, rgb):
+        with self._lock:
+            if self._incoming is None or self._incoming.shape != rgb.shape:
+                self._incoming = np.empty(rgb.shape, np.uint8)
+            np.copyto(self._incoming, rgb)
+            self._has_new_frame = True
+            self.frames_submitted += 1
+            if self._scheduled:
+                return
+            self._scheduled = True
+        wx.CallAfter(self._consume_frame)
+
+    # --- GUI 執行緒：交換緩衝區並更新 bitmap ---
+    def _consume_frame(self):
+        if not self:  # 視窗已關閉
+            return
+        with self._lock:
+            self._scheduled = False
+            if not self._has_new_frame:
+                return
+            self._incoming, self._displayed = self._displayed, self._incoming
+            self._has_new_frame = False
+
+        start = time.perf_counter_ns()
+        frame = self._displayed
+        h, w = frame.shape[:2]
+        if self._frame_size != (w, h):
+            self._frame_size = (w, h)
+            self._bitmap = wx.Bitmap.FromBuffer(w, h, frame)
+            self._update_placement()
+        else:
+            self._bitmap.CopyFromBuffer(frame)
+        self.frames_shown += 1
+        self.Refresh(eraseBackground=False)
+        if self.profiler is not None:
+            self.profiler.record('bitmap_update', time.perf_counter_ns() - start)
+            self.profiler.tick('shown')
+
+    # 依面板大小計算等比例縮放與置中位置
+    def _update_placement(self):
+        if self._frame_size is None:
+            return
+        panel_w, panel_h = self.GetClientSize()
+        frame_w, frame_h = self._frame_size
+        if panel_w <= 0 or panel_h <= 0:
+            self._placement = None
+            return
+        scale = min(panel_w / frame_w, panel_h / frame_h)
+        offset_x = (panel_w - frame_w * scale) / 2 / scale
+        offset_y = (panel_h - frame_h * scale) / 2 / scale
+        self._placement = (scale, offset_x, offset_y)
+
+    def on_size(self, event):
+        self._update_placement()
+        self.Refresh(eraseBackground=False)
+        event.Skip()
+
+    def on_paint(self, event):
+        start = time.perf_counter_ns()
+        self._paint()
+        if self.profiler is not None:
+            self.profiler.record('paint', time.perf_counter_ns() - start)
+
+    def _paint(self):
+        dc = wx.AutoBufferedPaintDC(self)
+        dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+        dc.Clear()
+        if self._bitmap is None or self._placement is None:
+            return
+        scale, offset_x, offset_y = self._placement
+        dc.SetUserScale(scale, scale)
+        dc.DrawBitmap(self._bitmap, int(offset_x), int(offset_y))
+
+    # 清除畫面（停止串流時使用）
+    def clear(self):
+        with self._lock:
+            self._has_new_frame = False
+        self._bitmap = None
+        self._frame_size = None
+        self.Refresh()